@@ -0,0 +1,204 @@
+"""
+בדיקות ביצועים לצינור הבנייה
+Benchmark suite for the build pipeline stages.
+
+Generates synthetic data (see synthetic_data.py), then times and memory-profiles three
+stages separately:
+    load_all_budget_data        the budget workbooks into the BudgetStore
+    load_paid_supports_data     the paid supports tables, without the Sankey data
+    build_convergent_flow_data  the per-year Sankey data, the only flows builder
+                                (build_flow_data was removed with its unused flowData)
+The Sankey builder runs in this process rather than in build_flows_by_year's worker pool,
+so tracemalloc sees its allocations and no stage is counted twice.
+
+The run fails when a stage regresses over baselines.json: its peak memory beyond the
+tolerance, or its CPU time beyond the looser --cpu-tolerance. Peak memory is what the stage
+allocates, the same on any machine for the same data and library versions; CPU time is less
+noisy than wall time but still depends on the machine that recorded the baseline, hence the
+looser tolerance. Wall time is printed and stored for reference only.
+
+Usage:
+    python benchmarks/run_benchmarks.py                     # 1x, 10 years, compare to baseline
+    python benchmarks/run_benchmarks.py --scale 10 --years 15
+    python benchmarks/run_benchmarks.py --update-baseline   # record current results as baseline
+
+baselines.json holds 1x-10y and 10x-10y; a run without a stored baseline fails. 100x is not
+part of the gate: it needs far more memory than a CI runner has.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+import create_visualization as cv  # noqa: E402
+from synthetic_data import generate  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'baselines.json')
+
+# Allowed peak memory growth relative to the baseline before a stage fails
+DEFAULT_TOLERANCE = 0.25
+
+# Allowed CPU time growth relative to the baseline before a stage fails
+DEFAULT_CPU_TOLERANCE = 1.0
+
+# Timing runs of the short Sankey builder stage, whose single runs vary widely (the best is reported)
+FLOW_REPEAT = 3
+
+# Differences below these are noise, whatever the ratio
+MIN_BYTES_DELTA = 1024 * 1024
+MIN_CPU_SECONDS_DELTA = 0.5
+
+
+def measure(func, *args, repeat=1, **kwargs):
+    """
+    Run func for wall and CPU time (the best of repeat runs), then once under tracemalloc for peak memory.
+    Returns (result, {seconds, cpuSeconds, peakBytes}). Output printed by the stage is discarded.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds = cpu_seconds = math.inf
+        for _ in range(repeat):
+            start, cpu_start = time.perf_counter(), time.process_time()
+            result = func(*args, **kwargs)
+            seconds = min(seconds, time.perf_counter() - start)
+            cpu_seconds = min(cpu_seconds, time.process_time() - cpu_start)
+
+        tracemalloc.start()
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, {'seconds': seconds, 'cpuSeconds': cpu_seconds, 'peakBytes': peak}
+
+
+def year_flow_inputs(budget_data, paid_data, csv_path):
+    """Per-year build_year_flows() arguments, as load_paid_supports_data() passes them"""
+    budget_info_by_year, _ = cv.paid_supports_budget_info(budget_data, cv.read_paid_supports_csv(csv_path))
+    return {
+        year: cv.flow_inputs(budget_info_by_year.get(year, {}), year_paid['byCode'], year_paid['recipientsByCode'])
+        for year, year_paid in paid_data.items()
+    }
+
+
+def run_flow_builder(builder, inputs):
+    return {year: builder(*args) for year, args in inputs.items()}
+
+
+def run_suite(data_dir, first_year, last_year):
+    """Measure every stage on the data in data_dir; returns {stage: {seconds, cpuSeconds, peakBytes}}"""
+    results = {}
+
+    budget_data, results['load_all_budget_data'] = measure(
+        cv.load_all_budget_data, data_dir=data_dir, first_year=first_year, last_year=last_year
+    )
+    budget_store = budget_data[0]
+
+    csv_path = os.path.join(data_dir, 'table_of_paid_supports.csv')
+    paid_data, results['load_paid_supports_data'] = measure(
+        cv.load_paid_supports_data, budget_store, csv_path=csv_path, first_year=first_year, last_year=last_year,
+        with_flows=False
+    )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        inputs = year_flow_inputs(budget_store, paid_data, csv_path)
+    _, results['build_convergent_flow_data'] = measure(
+        run_flow_builder, cv.build_convergent_flow_data, inputs, repeat=FLOW_REPEAT
+    )
+
+    return results
+
+
+def compare(results, baseline, tolerance, cpu_tolerance):
+    """
+    List of regression messages for stages whose peak memory exceeds baseline * (1 + tolerance)
+    or whose CPU time exceeds baseline * (1 + cpu_tolerance)
+    """
+    gates = (
+        ('peakBytes', tolerance, MIN_BYTES_DELTA, '{:,.0f}'),
+        ('cpuSeconds', cpu_tolerance, MIN_CPU_SECONDS_DELTA, '{:.3f}'),
+    )
+    failures = []
+    for stage, current in results.items():
+        reference = baseline.get(stage)
+        if not reference:
+            continue
+        for metric, metric_tolerance, min_delta, fmt in gates:
+            if metric not in reference:
+                continue
+            limit = reference[metric] * (1 + metric_tolerance)
+            if current[metric] > limit and current[metric] - reference[metric] > min_delta:
+                failures.append(
+                    f"{stage}: {metric} {fmt.format(current[metric])} > {fmt.format(limit)} "
+                    f"(baseline {fmt.format(reference[metric])}, tolerance {metric_tolerance:.0%})"
+                )
+    return failures
+
+
+def load_baselines():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the budget build pipeline on synthetic data')
+    parser.add_argument('--scale', type=float, default=1, help='row multiplier (baselines: 1, 10)')
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='peak memory tolerance')
+    parser.add_argument('--cpu-tolerance', type=float, default=DEFAULT_CPU_TOLERANCE, help='CPU time tolerance')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--data-dir', help='reuse previously generated synthetic data')
+    args = parser.parse_args()
+
+    key = f"{args.scale:g}x-{args.years}y"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        first_year = 2015
+        last_year = first_year + args.years - 1
+        if not args.data_dir:
+            print(f"יוצר נתונים סינתטיים ({key})...")
+            generate(data_dir, scale=args.scale, years=args.years, seed=args.seed)
+        results = run_suite(data_dir, first_year, last_year)
+
+    print(f"\n{'Stage':<30} | {'Seconds':>10} | {'CPU s':>10} | {'Peak MB':>10}")
+    print("-" * 69)
+    for stage, r in results.items():
+        print(f"{stage:<30} | {r['seconds']:>10.3f} | {r['cpuSeconds']:>10.3f} | {r['peakBytes'] / 1e6:>10.1f}")
+
+    baselines = load_baselines()
+    if args.update_baseline:
+        baselines[key] = {'machine': platform.platform(), 'python': platform.python_version(), 'stages': results}
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"\nנשמר קו בסיס ל-{key}")
+        return 0
+
+    if key not in baselines:
+        print(f"\nאין קו בסיס ל-{key}; הרץ עם --update-baseline")
+        return 1
+
+    failures = compare(results, baselines[key]['stages'], args.tolerance, args.cpu_tolerance)
+    if failures:
+        print("\nנמצאו נסיגות בביצועים:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("\nאין נסיגות בביצועים")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
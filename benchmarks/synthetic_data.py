@@ -0,0 +1,163 @@
+"""
+מחולל נתונים סינתטיים לבדיקות ביצועים
+Synthetic generator for tableau-shaped budget workbooks and a paid-supports CSV.
+
+The output has the columns and value conventions that load_all_budget_data() and
+load_paid_supports_data() read, at a configurable scale, so the build pipeline can
+be benchmarked offline without the real source files.
+
+Usage:
+    python benchmarks/synthetic_data.py OUTPUT_DIR [--scale 10] [--years 10] [--seed 0]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Rows per year-workbook and payments per year at scale 1x
+# (roughly the executed rows of a real workbook and of a year of paid supports)
+BASE_BUDGET_ROWS = 6000
+BASE_PAYMENT_ROWS = 20000
+
+# Excel's per-sheet row limit
+MAX_SHEET_ROWS = 1048575
+
+FIRST_SYNTHETIC_YEAR = 2015
+
+RAMA1_NAMES = ['בטחון וסדר ציבורי', 'שירותים חברתיים', 'תשתיות', 'החזרי חוב',
+               'שירותים כלליים', 'ענפי משק', 'הוצאות אחרות', 'הכנסות']
+MIUN1_NAMES = ['שכר', 'קניות', 'העברות', 'השקעה', 'הכנסות  מיועדות', 'העברות  פנים תקציביות']
+BUDGET_TYPES = ['ביצוע', 'מאושר', 'מקורי']
+
+# Section codes the loader drops; the generator avoids them so row counts scale predictably
+EXCLUDED_SEIF_CODES = {0, 84, 89, 91, 93, 94, 95, 98}
+
+# סעיף of the payments' orphan codes (excluded, so no budget row ever carries it)
+ORPHAN_SEIF_CODE = 98
+
+
+def _labels(prefix, count):
+    return np.array([f"{prefix} {i}" for i in range(count)], dtype=object)
+
+
+def build_budget_frame(year, scale=1, seed=0):
+    """
+    One year of tableau-shaped budget rows.
+    Like the real workbooks, every line appears once per budget type (executed, approved,
+    original), so every תקנה code has an executed row, and a תקנה is either all expense
+    or all income.
+    """
+    rows = int(BASE_BUDGET_ROWS * scale)
+    if rows > MAX_SHEET_ROWS:
+        raise ValueError(f"{rows} rows exceed the {MAX_SHEET_ROWS} row limit of a worksheet")
+    rng = np.random.default_rng(seed + year)
+    lines = rows // len(BUDGET_TYPES)
+
+    seif_codes = np.array([c for c in range(1, 100) if c not in EXCLUDED_SEIF_CODES])
+    # The hierarchy grows with scale like real detail does: more תקנות, same top levels
+    takana_count = max(200, lines)
+    takana_seif = rng.choice(seif_codes, size=takana_count)
+    takana_codes = takana_seif * 1000000 + np.arange(takana_count) % 1000000
+    takana_names = _labels('תקנה', takana_count)
+    takana_is_income = rng.random(takana_count) >= 0.88
+
+    takana = rng.integers(0, takana_count, size=lines)
+    seif = takana_seif[takana]
+    rama2 = seif % 40
+    rama1 = rama2 % len(RAMA1_NAMES)
+    tchum = seif * 10 + takana % 10
+    miun1 = rng.integers(0, len(MIUN1_NAMES), size=lines)
+
+    line = pd.DataFrame({
+        'שנה': year,
+        'קוד רמה 1': rama1 + 1,
+        'שם רמה 1': np.array(RAMA1_NAMES, dtype=object)[rama1],
+        'קוד רמה 2': rama2 + 10,
+        'שם רמה 2': _labels('תת-תחום', 40)[rama2],
+        'קוד סעיף': seif,
+        'שם סעיף': _labels('סעיף', 100)[seif],
+        'קוד תחום': tchum,
+        'שם תחום': np.array([f"תחום {t}" for t in tchum], dtype=object),
+        'שם תכנית': np.array([f"תכנית {t % 50}" for t in takana], dtype=object),
+        'קוד תקנה': takana_codes[takana],
+        'שם תקנה': takana_names[takana],
+        'שם מיון רמה 1': np.array(MIUN1_NAMES, dtype=object)[miun1],
+        'קוד מיון רמה 2': miun1 * 10 + 1,
+        'שם מיון רמה 2': np.array([f"מיון {m}" for m in miun1 * 10 + 1], dtype=object),
+        'הוצאה/הכנסה': np.where(takana_is_income[takana], 'הכנסה', 'הוצאה'),
+    })
+
+    frames = []
+    for budget_type in BUDGET_TYPES:
+        amounts = rng.lognormal(mean=7, sigma=2, size=lines)
+        # About one row in sixteen is negative (refunds), as in the executed rows of a real year
+        amounts[rng.random(lines) < 0.06] *= -1
+        commitments = np.where(rng.random(lines) < 0.4, rng.lognormal(mean=6, sigma=2, size=lines), 0.0)
+        frames.append(line.assign(**{
+            'סוג תקציב': budget_type,
+            'הוצאה נטו': amounts,
+            'יתרת התחיבויות': commitments,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_payments_frame(budget_frames, scale=1, seed=0):
+    """Paid-supports rows whose תקנה codes mostly match the expense codes of the same year"""
+    frames = []
+    for year, budget in budget_frames.items():
+        rng = np.random.default_rng(seed + year + 1)
+        rows = int(BASE_PAYMENT_ROWS * scale)
+        codes = budget.loc[budget['הוצאה/הכנסה'] == 'הוצאה', 'קוד תקנה'].unique()
+        names = budget.drop_duplicates('קוד תקנה').set_index('קוד תקנה')['שם תקנה']
+        picked = rng.choice(codes, size=rows)
+        # About 5% of the payments reference codes that exist in no year (orphans): the same
+        # תקנה number under a סעיף the loader drops
+        orphan = rng.random(rows) < 0.05
+        picked = np.where(orphan, ORPHAN_SEIF_CODE * 1000000 + picked % 1000000, picked)
+        recipient = rng.zipf(1.5, size=rows) % max(1000, rows // 4)
+        frames.append(pd.DataFrame({
+            'שנת הבקשה': year,
+            'תקנה': [f"{code:08d} {names.get(code, 'תקנה לא ידועה')}" for code in picked],
+            'שם מגיש': np.array([f"עמותה {r}" for r in recipient], dtype=object),
+            'ח"פ מגיש': 580000000 + recipient,
+            'סכום ששולם': np.round(rng.lognormal(mean=11, sigma=1.5, size=rows), 2),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def generate(output_dir, scale=1, years=10, seed=0):
+    """
+    Write tableau_BudgetData<year>.xlsx workbooks and table_of_paid_supports.csv to output_dir.
+    Returns (first_year, last_year).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    first_year = FIRST_SYNTHETIC_YEAR
+    last_year = first_year + years - 1
+
+    budget_frames = {}
+    for year in range(first_year, last_year + 1):
+        budget = build_budget_frame(year, scale=scale, seed=seed)
+        budget.to_excel(os.path.join(output_dir, f"tableau_BudgetData{year}.xlsx"), index=False)
+        budget_frames[year] = budget
+
+    payments = build_payments_frame(budget_frames, scale=scale, seed=seed)
+    payments.to_csv(os.path.join(output_dir, 'table_of_paid_supports.csv'), index=False)
+    return first_year, last_year
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic budget workbooks and paid supports CSV')
+    parser.add_argument('output_dir')
+    parser.add_argument('--scale', type=float, default=1, help='row multiplier (1, 10, 100)')
+    parser.add_argument('--years', type=int, default=10, help='number of consecutive years from 2015')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    first_year, last_year = generate(args.output_dir, scale=args.scale, years=args.years, seed=args.seed)
+    print(f"נוצרו נתונים סינתטיים לשנים {first_year}-{last_year} ב-{args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+מאגר רשומות תקציב קומפקטי בזיכרון
+Compact, year-partitioned store for budget expense records.
+
+Each year is held as DataFrame-backed columns; hierarchy paths are interned once
+as tuples and referenced by id, and records are exposed through a __slots__ view
+that reads from the columns on demand.
+"""
+
+import sys
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Field order of the record view (same keys as the dicts emitted by load_all_budget_data)
+RECORD_FIELDS = ('name', 'path', 'value', 'code', 'isSalary', 'miunRama1', 'program', 'classification', 'commitment')
+
+# Stored in place of a missing קוד תקנה
+NO_CODE = -1
+
+
+def record_name(path):
+    """Display name of a record: deepest non-empty of the last two levels, else the first"""
+    return path[-1] if path[-1] else path[-2] if path[-2] else path[0]
+
+
+class BudgetRecord:
+    """Read-only view of one stored row; supports item['field'], item.get() and dict(item)"""
+
+    __slots__ = ('_partition', '_row')
+
+    def __init__(self, partition, row):
+        self._partition = partition
+        self._row = row
+
+    def __getitem__(self, field):
+        return self._partition.field(field, self._row)
+
+    def get(self, field, default=None):
+        if field not in RECORD_FIELDS:
+            return default
+        return self._partition.field(field, self._row)
+
+    def __contains__(self, field):
+        return field in RECORD_FIELDS
+
+    def keys(self):
+        return RECORD_FIELDS
+
+    def __repr__(self):
+        return f"BudgetRecord({dict(self)!r})"
+
+
+# Columns identifying a record's output key (program is dropped by without_program())
+KEY_COLUMNS = ('path_id', 'code', 'isSalary', 'classification', 'program')
+
+
+def key_columns(keep_program):
+    return list(KEY_COLUMNS if keep_program else KEY_COLUMNS[:-1])
+
+
+def collapse_frame(frame, keep_program=True):
+    """
+    Record columns collapsed to the output key (path, code, isSalary, classification and
+    optionally program), summing value and commitment; groups keep the order of their first record.
+    Without program the column is kept, empty.
+    """
+    grouped = frame.groupby(key_columns(keep_program), sort=False, observed=True)
+    collapsed = grouped[['value', 'commitment']].sum().reset_index()
+    if not keep_program:
+        collapsed['program'] = pd.Categorical(np.full(len(collapsed), '', dtype=object))
+    return collapsed[list(frame.columns)]
+
+
+class YearPartition(Sequence):
+    """
+    Columns of one year's records, with code and ministry indexes.
+    Everything is built in the constructor and only read afterwards, so the query
+    server's request threads can share a partition without locking.
+    """
+
+    def __init__(self, store, frame):
+        self._store = store
+        self.frame = frame
+        # Plain numpy views for per-row access; much cheaper than frame.iat
+        self._arrays = {col: frame[col].to_numpy() for col in frame.columns}
+        self._by_code = frame.groupby('code', sort=False).indices
+        ministries = store.level_labels(self._arrays['path_id'], 0)
+        self._by_ministry = pd.Series(ministries).groupby(ministries, sort=False).indices
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [BudgetRecord(self, i) for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return BudgetRecord(self, row)
+
+    def __iter__(self):
+        for row in range(len(self.frame)):
+            yield BudgetRecord(self, row)
+
+    def field(self, field, row):
+        """Value of `field` for the record at `row`"""
+        arrays = self._arrays
+        if field == 'path':
+            return self._store.paths[arrays['path_id'][row]]
+        if field == 'name':
+            return record_name(self._store.paths[arrays['path_id'][row]])
+        if field == 'miunRama1':
+            return self._store.paths[arrays['path_id'][row]][-1]
+        if field == 'value':
+            return float(arrays['value'][row])
+        if field == 'commitment':
+            return float(arrays['commitment'][row])
+        if field == 'code':
+            code = int(arrays['code'][row])
+            return None if code == NO_CODE else code
+        if field == 'isSalary':
+            return bool(arrays['isSalary'][row])
+        if field in ('program', 'classification'):
+            value = arrays[field][row]
+            return '' if pd.isna(value) else value
+        raise KeyError(field)
+
+    def total(self):
+        """Sum of all record values"""
+        return float(self.frame['value'].sum())
+
+    def rows_for_code(self, code):
+        """Row positions of the records carrying a given קוד תקנה"""
+        return self._by_code.get(code, np.empty(0, dtype=np.intp))
+
+    def rows_for_ministry(self, ministry):
+        """Row positions of the records under a given first hierarchy level (שם רמה 1)"""
+        return self._by_ministry.get(ministry, np.empty(0, dtype=np.intp))
+
+    def key_count(self, keep_program=True):
+        """Number of distinct output keys, i.e. the record count after collapse_frame(keep_program)"""
+        return int(self.frame.groupby(key_columns(keep_program), sort=False, observed=True).ngroups)
+
+    def without_program(self):
+        """Columns collapsed to the program-free key (path, code, isSalary, classification)"""
+        return collapse_frame(self.frame, keep_program=False)
+
+    def project(self, fields, depth=None):
+        """
+        Records projected down to `fields` as dicts (the key fields in order, then `value`),
+        with `path` truncated to `depth` levels. Records that become identical are merged
+        in the order of their first record and their `value` summed in row order.
+        """
+        path_ids = self._arrays['path_id']
+        key_fields = [field for field in fields if field != 'value']
+        keys = {}
+        for field in key_fields:
+            if field == 'path':
+                keys[field], prefixes = self._store.prefix_ids(path_ids, depth)
+            elif field == 'name':
+                keys[field] = self._store.path_names(path_ids)
+            elif field == 'miunRama1':
+                keys[field] = self._store.level_labels(path_ids, -1)
+            else:
+                keys[field] = self.frame[field]
+        if key_fields:
+            groups = pd.DataFrame(keys).groupby(key_fields, sort=False, observed=True, dropna=False).ngroup()
+            groups = groups.to_numpy()
+        else:
+            groups = np.zeros(len(self), dtype=np.intp)
+        _, first_rows = np.unique(groups, return_index=True)
+
+        columns = []
+        for field in key_fields:
+            if field == 'path':
+                column = [list(prefixes[prefix_id]) for prefix_id in keys[field][first_rows].tolist()]
+            elif field == 'code':
+                column = [None if code == NO_CODE else code for code in keys[field].to_numpy()[first_rows].tolist()]
+            elif field in ('program', 'classification'):
+                column = ['' if pd.isna(label) else label for label in keys[field].to_numpy()[first_rows]]
+            elif field in ('name', 'miunRama1'):
+                column = keys[field][first_rows].tolist()
+            else:
+                column = keys[field].to_numpy()[first_rows].tolist()
+            columns.append(column)
+        if 'value' in fields:
+            values = np.zeros(len(first_rows))
+            # Unbuffered, in row order: the same sums as adding the records one by one
+            np.add.at(values, groups, self._arrays['value'])
+            key_fields.append('value')
+            columns.append(values.tolist())
+        return [dict(zip(key_fields, record)) for record in zip(*columns)]
+
+    def code_info(self):
+        """
+        Per-code budget info used to match paid supports:
+        { code: {'name', 'path', 'value'} } with name and path taken from the code's first record
+        """
+        coded = self.frame[self.frame['code'] > 0]
+        grouped = coded.groupby('code', sort=False)
+        first_path = grouped['path_id'].first()
+        totals = grouped['value'].sum()
+        info = {}
+        for code, path_id in first_path.items():
+            path = self._store.paths[path_id]
+            info[int(code)] = {
+                'name': record_name(path),
+                'path': list(path),
+                'value': float(totals[code])
+            }
+        return info
+
+
+class BudgetStore(Mapping):
+    """Year -> YearPartition mapping with a shared table of interned path tuples"""
+
+    def __init__(self):
+        self._partitions = {}
+        self.paths = []
+        self._path_ids = {}
+        # Per-path lookup tables derived from the path table, extended as paths are added
+        self._path_tables = {}
+        self._prefixes = {}
+
+    def intern_path(self, path):
+        """Id of a hierarchy path in the shared table, adding it on first sight"""
+        key = tuple(path)
+        path_id = self._path_ids.get(key)
+        if path_id is None:
+            path_id = len(self.paths)
+            key = tuple(sys.intern(part) for part in key)
+            self.paths.append(key)
+            self._path_ids[key] = path_id
+        return path_id
+
+    def path_table(self, key, of_path, dtype=object):
+        """
+        Array of of_path(path) for every path in the table, by path id. Built once per key and
+        extended with the paths added since, so each path is visited once per key.
+        """
+        table = self._path_tables.get(key)
+        known = 0 if table is None else len(table)
+        if table is None or known < len(self.paths):
+            added = np.empty(len(self.paths) - known, dtype=dtype)
+            for i, path in enumerate(self.paths[known:]):
+                added[i] = of_path(path)
+            table = self._path_tables[key] = added if table is None else np.concatenate([table, added])
+        return table
+
+    def level_labels(self, path_ids, level):
+        """Labels at hierarchy `level` for an array of path ids"""
+        return self.path_table(('level', level), lambda path: path[level])[path_ids]
+
+    def path_names(self, path_ids):
+        """Record names (see record_name) for an array of path ids"""
+        return self.path_table(('name',), record_name)[path_ids]
+
+    def prefix_ids(self, path_ids, depth):
+        """
+        Ids of the paths truncated to `depth` levels for an array of path ids, and the list
+        of truncated paths they index (in order of first sight)
+        """
+        prefixes, lookup = self._prefixes.setdefault(depth, ([], {}))
+
+        def prefix_id(path):
+            prefix = path[:depth]
+            if prefix not in lookup:
+                lookup[prefix] = len(prefixes)
+                prefixes.append(prefix)
+            return lookup[prefix]
+
+        return self.path_table(('prefix', depth), prefix_id, dtype=np.intp)[path_ids], prefixes
+
+    def add_year(self, year, paths, value, code, is_salary, program, classification, commitment, aggregate=False):
+        """
+        Store one year's records from parallel columns (one entry per record), as read from the workbook:
+        paths are hierarchy path sequences and code holds NO_CODE where there is no קוד תקנה.
+        aggregate: collapse records sharing an identical output key (see collapse_frame)
+        """
+        frame = pd.DataFrame({
+            'path_id': np.fromiter((self.intern_path(path) for path in paths), dtype=np.int32, count=len(paths)),
+            'value': np.asarray(value, dtype=np.float64),
+            'code': np.asarray(code, dtype=np.int64),
+            'isSalary': np.asarray(is_salary, dtype=bool),
+            'program': pd.Categorical(program),
+            'classification': pd.Categorical(classification),
+            'commitment': np.asarray(commitment, dtype=np.float64),
+        })
+        if aggregate:
+            frame = collapse_frame(frame)
+        partition = self._partitions[year] = YearPartition(self, frame)
+        return partition
+
+    def __getitem__(self, year):
+        return self._partitions[year]
+
+    def __iter__(self):
+        return iter(self._partitions)
+
+    def __len__(self):
+        return len(self._partitions)
+
+    def total(self, year):
+        return self._partitions[year].total()
+
+    def without_program(self):
+        """Store of the same years collapsed by YearPartition.without_program(), sharing the path table"""
+        store = BudgetStore()
+        store.paths = self.paths
+        store._path_ids = self._path_ids
+        store._path_tables = self._path_tables
+        store._prefixes = self._prefixes
+        for year, partition in self._partitions.items():
+            store._partitions[year] = YearPartition(store, partition.without_program())
+        return store
@@ -0,0 +1,174 @@
+"""
+מדידת שלבי הבנייה
+Stage-level timing and memory instrumentation for the build pipeline.
+
+Each stage records wall time, CPU time, tracemalloc peak, input/output row counts
+and bytes written. The collected stages can be written as a JSON report, and each
+stage can optionally be profiled with cProfile into its own .prof file.
+
+Enable from the environment without editing the script:
+    BUDGET_BUILD_REPORT=build_report.json BUDGET_BUILD_PROFILE_DIR=profiles python create_visualization.py
+"""
+
+import cProfile
+import json
+import os
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class StageRecord:
+    """Measurements of one stage; the body of the stage fills in the row counts and outputs"""
+
+    __slots__ = ('name', 'depth', 'wall_seconds', 'cpu_seconds', 'peak_bytes', 'input_rows', 'output_rows',
+                 'bytes_written', 'outputs', 'profile_path')
+
+    def __init__(self, name, input_rows=None, depth=0):
+        self.name = name
+        self.depth = depth  # number of enclosing stages (0 = outermost)
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_bytes = None
+        self.input_rows = input_rows
+        self.output_rows = None
+        self.bytes_written = 0
+        self.outputs = []
+        self.profile_path = None
+
+    def record_output(self, path):
+        """Count a written file towards the stage's bytes written"""
+        if path and os.path.exists(path):
+            self.outputs.append(path)
+            self.bytes_written += os.path.getsize(path)
+        return path
+
+    def record_outputs(self, paths):
+        """Count files written alongside the stage's page (its data shards); returns paths"""
+        for path in paths:
+            self.record_output(path)
+        return paths
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'wallSeconds': self.wall_seconds,
+            'cpuSeconds': self.cpu_seconds,
+            'peakBytes': self.peak_bytes,
+            'inputRows': self.input_rows,
+            'outputRows': self.output_rows,
+            'bytesWritten': self.bytes_written,
+            'outputs': self.outputs,
+            'profile': self.profile_path,
+        }
+
+
+class BuildInstrumentation:
+    """
+    Collects StageRecords for a build.
+    trace_memory: measure the tracemalloc peak of each stage (slows the build down)
+    profile_dir: write a cProfile dump per stage into this directory
+    Stages nest: an enclosing stage's peak covers its inner stages, and only the outermost
+    stage is profiled (its profile includes the inner ones; cProfile cannot nest).
+    """
+
+    def __init__(self, trace_memory=False, profile_dir=None, report_path=None):
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.report_path = report_path
+        self.stages = []
+        # Record of the stage running now, for code that writes files on its behalf
+        self.current = None
+        # Peak of each running traced stage so far, innermost last: a stage resets the
+        # tracemalloc peak, so the peaks measured before it are kept here
+        self._peaks = []
+        self._profiling = False
+
+    @classmethod
+    def from_environment(cls):
+        """Instrumentation configured by BUDGET_BUILD_REPORT / BUDGET_BUILD_PROFILE_DIR"""
+        report_path = os.environ.get('BUDGET_BUILD_REPORT') or None
+        return cls(
+            trace_memory=bool(report_path),
+            profile_dir=os.environ.get('BUDGET_BUILD_PROFILE_DIR') or None,
+            report_path=report_path
+        )
+
+    @contextmanager
+    def stage(self, name, input_rows=None):
+        parent = self.current
+        record = StageRecord(name, input_rows, depth=parent.depth + 1 if parent else 0)
+        self.current = record
+        profiler = cProfile.Profile() if self.profile_dir and not self._profiling else None
+        started_tracing = False
+        if self.trace_memory:
+            if tracemalloc.is_tracing():
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                started_tracing = True
+            self._peaks.append(0)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profiler:
+            self._profiling = True
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            self.current = parent
+            if profiler:
+                profiler.disable()
+                self._profiling = False
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            if self.trace_memory:
+                record.peak_bytes = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if started_tracing:
+                    tracemalloc.stop()
+                elif self._peaks:
+                    # The enclosing stage's peak includes this one's; measure its remainder afresh
+                    self._peaks[-1] = max(self._peaks[-1], record.peak_bytes)
+                    tracemalloc.reset_peak()
+            if profiler:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+                record.profile_path = os.path.join(self.profile_dir, f"{len(self.stages):02d}_{safe_name}.prof")
+                profiler.dump_stats(record.profile_path)
+            self.stages.append(record)
+            # Timings are printed only when measurements were asked for; plain builds stay quiet
+            if self.report_path or self.profile_dir:
+                print(f"  ⏱ {record.wall_seconds:.2f}s")
+
+    def outputs(self):
+        """Every file the stages recorded, in the order they were written"""
+        return [path for stage in self.stages for path in stage.outputs]
+
+    def report(self):
+        return {
+            # Inner stages run within their enclosing stage's time: only the outermost ones add up
+            'totalWallSeconds': sum(s.wall_seconds for s in self.stages if s.depth == 0),
+            'totalBytesWritten': sum(s.bytes_written for s in self.stages),
+            'stages': [s.to_dict() for s in self.stages],
+        }
+
+    def write_report(self, path=None):
+        """Write the JSON report to path (default: the path given by the environment), if any"""
+        path = path or self.report_path
+        if not path:
+            return None
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+def count_rows(data):
+    """Rows in a {year: [records]} mapping"""
+    if not data:
+        return 0
+    return sum(len(items) for items in data.values())
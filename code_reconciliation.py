@@ -0,0 +1,180 @@
+"""
+שיוך תשלומים לקודי תקנה שאינם בתקציב השנה
+Reconciliation of paid supports whose קוד תקנה is missing from that year's budget.
+
+Each payment is resolved, in order, by:
+    exact      the code exists in the payment year's budget
+    crosswalk  an explicit old -> new code mapping (code_crosswalk.json) to a code of that year
+    renamed    a code of that year in the same סעיף whose תקנה name matches the payment's
+    prior/next the nearest earlier / later budget year in which the code exists
+
+All lookups are vectorized over the orphan rows only: the cross-year code index is one
+sorted array of code*YEAR_SPAN+year keys searched with np.searchsorted, so the cost
+grows with the number of orphans, not with the number of years.
+
+Only payments of years that have a budget workbook are reconciled: a payment of a year
+with no budget stays an orphan, since there is no year to attach its code to.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CROSSWALK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'code_crosswalk.json')
+
+# Key stride separating codes in the cross-year index (above any year)
+YEAR_SPAN = 10000
+
+# A קוד תקנה starts with its two-digit סעיף
+SECTION_DIVISOR = 1000000
+
+# Level of the תקנה name in a budget path
+TAKANA_LEVEL = 4
+
+
+def load_code_crosswalk(path=CROSSWALK_PATH):
+    """{old code: new code} from an optional JSON file of {"old": new}; empty when the file is missing"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return {int(old): int(new) for old, new in json.load(f).items()}
+
+
+def normalize_takana_name(names):
+    """Series of תקנה names with whitespace runs collapsed, for matching renamed codes"""
+    return names.fillna('').astype(str).str.split().str.join(' ')
+
+
+class CodeIndex:
+    """Sorted (code, year) keys of every budget code in every year"""
+
+    def __init__(self, codes_by_year):
+        keys = [
+            np.fromiter(codes, dtype=np.int64, count=len(codes)) * YEAR_SPAN + year
+            for year, codes in codes_by_year.items()
+        ]
+        self.keys = np.sort(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+
+    def contains(self, codes, years):
+        keys = codes * YEAR_SPAN + years
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        return found
+
+    def nearest_year(self, codes, years):
+        """
+        (source year, is prior) of the nearest year each code exists in, for codes absent
+        from their own year; source year is 0 where the code exists in no year.
+        Ties prefer the earlier year.
+        """
+        if len(self.keys) == 0:
+            return np.zeros(len(codes), dtype=np.int64), np.zeros(len(codes), dtype=bool)
+        keys = codes * YEAR_SPAN + years
+        # The key itself is absent, so the neighbours around its position are the prior and next years
+        positions = np.searchsorted(self.keys, keys)
+        prior_keys = self.keys[np.maximum(positions - 1, 0)]
+        next_keys = self.keys[np.minimum(positions, len(self.keys) - 1)]
+        has_prior = (positions > 0) & (prior_keys // YEAR_SPAN == codes)
+        has_next = (positions < len(self.keys)) & (next_keys // YEAR_SPAN == codes)
+
+        no_gap = np.iinfo(np.int64).max
+        prior_gap = np.where(has_prior, years - prior_keys % YEAR_SPAN, no_gap)
+        next_gap = np.where(has_next, next_keys % YEAR_SPAN - years, no_gap)
+        use_prior = has_prior & (prior_gap <= next_gap)
+        source = np.where(use_prior, prior_keys % YEAR_SPAN, np.where(has_next, next_keys % YEAR_SPAN, 0))
+        return source, use_prior
+
+
+def reconcile_codes(df, budget_info_by_year, crosswalk=None):
+    """
+    Resolve the budget code of every paid supports row.
+    df: read_paid_supports_csv() frame; budget_info_by_year: {year: {code: {'name', 'path', 'value'}}}
+    Returns df with three added columns:
+        קוד_מותאם   resolved code (NA when unresolved)
+        שיוך        resolution method (see module docstring; NA when unresolved)
+        שנת_מקור    budget year the resolved code was taken from
+    """
+    crosswalk = crosswalk or {}
+    index = CodeIndex({year: list(info) for year, info in budget_info_by_year.items()})
+
+    df = df.copy()
+    codes = df['קוד_תקנה'].fillna(-1).astype('int64').to_numpy()
+    years = df['שנת הבקשה'].fillna(0).astype('int64').to_numpy()
+    has_code = codes >= 0
+    in_budget_years = np.isin(years, list(budget_info_by_year))
+
+    resolved = np.where(has_code, codes, -1)
+    source_year = years.copy()
+    method = np.full(len(df), None, dtype=object)
+
+    exact = has_code & index.contains(codes, years)
+    method[exact] = 'exact'
+    pending = has_code & in_budget_years & ~exact
+
+    # Explicit crosswalk to a code of the payment year
+    if crosswalk and pending.any():
+        rows = np.flatnonzero(pending)
+        mapped = pd.Series(codes[rows]).map(crosswalk).fillna(-1).astype('int64').to_numpy()
+        hit = (mapped >= 0) & index.contains(mapped, years[rows])
+        resolved[rows[hit]] = mapped[hit]
+        method[rows[hit]] = 'crosswalk'
+        pending[rows[hit]] = False
+
+    # Renamed: a code of the payment year, same סעיף, same תקנה name (only when unambiguous)
+    if pending.any():
+        rows = np.flatnonzero(pending)
+        names = pd.DataFrame([
+            (year, code // SECTION_DIVISOR, info['path'][TAKANA_LEVEL] if len(info['path']) > TAKANA_LEVEL else '', code)
+            for year in np.unique(years[rows])
+            for code, info in budget_info_by_year[year].items()
+        ], columns=['year', 'section', 'name', 'code'])
+        names['name'] = normalize_takana_name(names['name'])
+        names = names[names['name'] != ''].drop_duplicates(['year', 'section', 'name'], keep=False)
+
+        orphans = pd.DataFrame({
+            'row': rows,
+            'year': years[rows],
+            'section': codes[rows] // SECTION_DIVISOR,
+            'name': normalize_takana_name(df['שם_תקנה'].iloc[rows]).to_numpy(),
+        })
+        hits = orphans.merge(names, on=['year', 'section', 'name'], how='inner')
+        hit_rows = hits['row'].to_numpy()
+        resolved[hit_rows] = hits['code'].to_numpy()
+        method[hit_rows] = 'renamed'
+        pending[hit_rows] = False
+
+    # Nearest earlier / later year in which the code exists
+    if pending.any():
+        rows = np.flatnonzero(pending)
+        source, is_prior = index.nearest_year(codes[rows], years[rows])
+        hit = source > 0
+        source_year[rows[hit]] = source[hit]
+        method[rows[hit]] = np.where(is_prior[hit], 'prior', 'next')
+        pending[rows[hit]] = False
+
+    unresolved = pd.isna(method)
+    df['קוד_מותאם'] = pd.Series(resolved, index=df.index).where(~unresolved).astype('Int64')
+    df['שיוך'] = method
+    df['שנת_מקור'] = source_year
+    return df
+
+
+def extend_budget_info(budget_info_by_year, df):
+    """
+    Add to each year's budget info the codes resolved from another year (prior/next),
+    with that year's name and path. They have no budget of their own that year: their
+    value is 0 and they are marked 'borrowed', so a payment to them is not shown as over
+    budget. Modifies and returns budget_info_by_year.
+    """
+    borrowed = df[df['שיוך'].isin(['prior', 'next'])]
+    pairs = borrowed[['שנת הבקשה', 'קוד_מותאם', 'שנת_מקור']].drop_duplicates()
+    for year, code, source_year in pairs.itertuples(index=False):
+        year_info = budget_info_by_year.setdefault(int(year), {})
+        code = int(code)
+        if code not in year_info:
+            info = budget_info_by_year[int(source_year)][code]
+            year_info[code] = {'name': info['name'], 'path': info['path'], 'value': 0.0, 'borrowed': True}
+    return budget_info_by_year
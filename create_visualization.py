@@ -4,52 +4,252 @@
 """
 
 import pandas as pd
+import numpy as np
+import argparse
 import glob
 import json
 import os
+import sys
 import webbrowser
 import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import cached_property, partial
+
+from budget_store import NO_CODE, BudgetStore
+from code_reconciliation import extend_budget_info, load_code_crosswalk, reconcile_codes
+from flow_encoding import encode_paid_supports_flows
+from recipient_index import write_recipient_index
+from year_deltas import build_year_deltas, write_year_deltas
+from build_instrumentation import BuildInstrumentation, count_rows
+
+# Directory of the templates and config files
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Directory the pages, data engine and shards are written to (the pipeline module can point it elsewhere)
+OUTPUT_DIR = BASE_DIR
 
 # ============================
 # NAME NORMALIZATION MAPPINGS
 # ============================
 # Some budget categories changed names over the years but represent the same item
-NAME_MAPPINGS = {
-    # תת-תחום mappings (שם רמה 2)
-    'ביטוח לאומי': 'הקצבות ביטוח לאומי',
-    'העברות ביטוח לאומי': 'הקצבות ביטוח לאומי',
-    # משרד התחבורה - שם תת-תחום השתנה ב-2019
-    'פיתוח התחבורה': 'תחבורה',
-}
+# Additional renames are read from name_mappings.json (old name -> new name), no code change needed
+NAME_MAPPINGS_PATH = os.path.join(BASE_DIR, 'name_mappings.json')
+
+def load_name_mappings(path=NAME_MAPPINGS_PATH):
+    """Load the old name -> normalized name table from a JSON config file"""
+    if not os.path.exists(path):
+        print(f"  קובץ מיפוי שמות לא נמצא: {path}")
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+NAME_MAPPINGS = load_name_mappings()
+
+def normalize_hierarchy_columns(df, hierarchy_cols, name_mappings=None):
+    """
+    Convert hierarchy columns to categoricals and remap their categories through name_mappings
+    (default: NAME_MAPPINGS, read from name_mappings.json on import).
+    Normalization runs once per distinct label instead of once per cell;
+    categories that map to the same name are merged.
+    """
+    if name_mappings is None:
+        name_mappings = NAME_MAPPINGS
+    for col in hierarchy_cols:
+        if col not in df.columns:
+            continue
+        values = df[col].astype('category')
+        labels = [name_mappings.get(str(c), str(c)) for c in values.cat.categories]
+        categories = list(dict.fromkeys(labels))
+        position = {label: i for i, label in enumerate(categories)}
+        # Trailing -1 keeps missing values (code -1) missing after the remap
+        remap = np.array([position[label] for label in labels] + [-1], dtype=np.int64)
+        df[col] = pd.Categorical.from_codes(remap[values.cat.codes.to_numpy()], categories=categories)
+    return df
+
+# Budget years covered by the visualizations
+FIRST_YEAR = 2015
+LAST_YEAR = 2024
+
+# Deepest hierarchy level a page can drill into (the main page stops at תקנה)
+RIGIDITY_INDEX_DEPTH = 5
+
+def build_rigidity_index(rows, depth=RIGIDITY_INDEX_DEPTH):
+    """
+    Aggregate commitment balances (יתרת התחיבויות) joined onto expense rows
+    into a tree of per-node commitment totals, one tree level per hierarchy level.
+    Takes the raw (path, value, commitment) expense rows: |commitment| is summed per row,
+    not over netted aggregates.
+
+    Node: { 'value', 'commitments', 'absCommitments', 'children': { name: node } }
+    The pages derive the rigidity ratio as absCommitments / value.
+    Only nodes that carry commitments are kept; a missing node has no commitments.
+    """
+    def new_node():
+        return {'value': 0.0, 'commitments': 0.0, 'absCommitments': 0.0}
+
+    root = new_node()
+    for path, value, commitment in rows:
+        node = root
+        chain = [root]
+        for part in path[:depth]:
+            children = node.setdefault('children', {})
+            node = children.get(part)
+            if node is None:
+                node = children[part] = new_node()
+            chain.append(node)
+        for node in chain:
+            node['value'] += value
+            if commitment:
+                node['commitments'] += commitment
+                node['absCommitments'] += abs(commitment)
+
+    def finalize(node):
+        children = node.pop('children', {})
+        kept = {name: finalize(child) for name, child in children.items() if child['absCommitments']}
+        if kept:
+            node['children'] = kept
+        return node
+
+    return finalize(root)
+
+def prune_rigidity_node(node, depth):
+    """Copy of a rigidity index node limited to `depth` levels below it"""
+    pruned = {key: value for key, value in node.items() if key != 'children'}
+    if depth > 0 and 'children' in node:
+        pruned['children'] = {name: prune_rigidity_node(child, depth - 1) for name, child in node['children'].items()}
+    return pruned
+
+def drop_program_detail(budget_data):
+    """Collapse every year to the program-free key, for pages that do not read `program`"""
+    return budget_data.without_program()
+
+def project_budget_data(budget_data, fields, depth=None):
+    """
+    Project every record down to the fields a page reads, truncating `path` to `depth` levels.
+    Records that become identical are merged and their `value` summed (see YearPartition.project).
+    """
+    return {year: partition.project(fields, depth) for year, partition in budget_data.items()}
+
+def project_paid_supports_data(paid_supports_data, fields):
+    """Keep only the fields of each year's paid supports data that a page reads"""
+    return {
+        year: {field: year_data[field] for field in fields if field in year_data}
+        for year, year_data in paid_supports_data.items()
+    }
+
+def project_rigidity_index(rigidity_data, depth):
+    """Keep only the rigidity index nodes down to `depth` hierarchy levels"""
+    return {year: prune_rigidity_node(index, depth) for year, index in rigidity_data.items()}
+
+def partition_budget_rows(df):
+    """
+    Row positions of a year's workbook per stream, from masks computed once over the frame:
+        expense           executed הוצאה rows with a positive amount, outside the excluded
+                          codes (קוד רמה 2 62 and the excluded סעיפים)
+        income            executed הכנסה rows with a negative amount, except state income (הכנסות)
+        negative_expense  executed הוצאה rows with a negative amount (income in practice)
+    Converts הוצאה נטו to numbers in place (unparseable amounts count as 0).
+    """
+    rows = len(df)
+    df['הוצאה נטו'] = pd.to_numeric(df['הוצאה נטו'], errors='coerce').fillna(0)
+    amounts = df['הוצאה נטו'].to_numpy()
+    positive = amounts > 0
+    negative = amounts < 0
+
+    executed = df['סוג תקציב'].eq('ביצוע').to_numpy() if 'סוג תקציב' in df.columns else np.ones(rows, dtype=bool)
+    if 'הוצאה/הכנסה' in df.columns:
+        kind = df['הוצאה/הכנסה']
+        expense = executed & kind.eq('הוצאה').to_numpy()
+        income = executed & kind.eq('הכנסה').to_numpy()
+        negative_expense = expense & negative
+    else:
+        # Without the column every row is an expense and there is no income
+        expense = executed
+        income = np.zeros(rows, dtype=bool)
+        negative_expense = income
+
+    # Filter out state income (הכנסות category) - we only want ministry income
+    if 'שם רמה 1' in df.columns:
+        income = income & df['שם רמה 1'].ne('הכנסות').to_numpy()
+
+    # סינון קוד רמה 2 = 62 (החזרי חוב קרן)
+    excluded = np.zeros(rows, dtype=bool)
+    if 'קוד רמה 2' in df.columns:
+        excluded |= df['קוד רמה 2'].isin([62]).to_numpy()
+
+    # Additional filtering: exclude specific section codes (קוד סעיף)
+    if 'קוד סעיף' in df.columns and 'קוד מיון רמה 2' in df.columns:
+        # Convert section code to 4-digit string for comparison
+        seif_code = df['קוד סעיף'].astype(str).str.zfill(4)
+
+        # Codes to exclude: 0000, 0089, 0091, 0093, 0094, 0095, 0098
+        excluded |= seif_code.str.startswith(('0000', '0089', '0091', '0093', '0094', '0095', '0098')).to_numpy()
+
+        # Special case: code 0084 is only excluded if קוד מיון רמה 2 != 266
+        excluded |= (seif_code.str.startswith('0084') & (df['קוד מיון רמה 2'] != 266)).to_numpy()
+
+    return {
+        'expense': np.flatnonzero(expense & ~excluded & positive),
+        'income': np.flatnonzero(income & negative),
+        'negative_expense': np.flatnonzero(negative_expense),
+    }
+
+
+def column_strings(df, col, positions):
+    """A column's values at the row positions as strings, '' for missing values or a missing column"""
+    if col not in df.columns:
+        return [''] * len(positions)
+    return [str(value) if pd.notna(value) else '' for value in df[col].to_numpy()[positions]]
+
+
+def row_paths(df, hierarchy_cols, positions):
+    """Hierarchy path of each row at the row positions"""
+    return [list(path) for path in zip(*(column_strings(df, col, positions) for col in hierarchy_cols))]
+
+
+def budget_workbooks(data_dir='.'):
+    """Paths of the tableau_BudgetData*.xlsx workbooks in data_dir"""
+    return (glob.glob(os.path.join(data_dir, "tableau_BudgetData*.xlsx")) +
+            glob.glob(os.path.join(data_dir, "tableau_tableau_BudgetData*.xlsx")))
 
-def normalize_name(name):
-    """Normalize budget item names that changed across years"""
-    if pd.isna(name):
-        return name
-    return NAME_MAPPINGS.get(str(name), str(name))
 
-def load_all_budget_data():
-    """טעינת כל קבצי התקציב"""
-    all_files = glob.glob("tableau_BudgetData*.xlsx") + glob.glob("tableau_tableau_BudgetData*.xlsx")
+def workbook_year(filename):
+    """Budget year of a workbook, from the first four digits of its file name (0 when there are none)"""
+    year_str = ''.join(filter(str.isdigit, os.path.basename(filename)))[:4]
+    return int(year_str) if year_str else 0
 
-    all_data = {}
+
+def load_all_budget_data(aggregate=True, data_dir='.', first_year=FIRST_YEAR, last_year=LAST_YEAR, name_mappings=None):
+    """
+    טעינת כל קבצי התקציב
+    aggregate: collapse rows sharing an identical output key (see budget_store.collapse_frame)
+    data_dir: directory holding the tableau_BudgetData*.xlsx workbooks
+    """
+    all_files = budget_workbooks(data_dir)
+
+    all_data = BudgetStore()  # year-partitioned columns instead of per-row dicts
     all_income = {}
-    all_commitments = {}
+    all_rigidity = {}
 
     for filename in all_files:
         try:
-            print(f"טוען {filename}...")
-            df = pd.read_excel(filename)
-
-            # חילוץ שנה
-            year_str = ''.join(filter(str.isdigit, filename))[:4]
-            year = int(year_str) if year_str else 0
+            # חילוץ שנה (before reading, so workbooks outside the year range are never parsed)
+            year = workbook_year(filename)
 
-            if year < 2015 or year > 2024:
+            if year < first_year or year > last_year:
                 continue
 
+            print(f"טוען {filename}...")
+            df = pd.read_excel(filename)
+
             # יצירת מבנה נתונים להיררכיה
             hierarchy_cols = ['שם רמה 1', 'שם רמה 2', 'שם סעיף', 'שם תחום', 'שם תקנה', 'שם מיון רמה 1']
+            df = normalize_hierarchy_columns(df, hierarchy_cols, name_mappings)
+
+            # One pass of column masks splits the rows into the expense and income streams
+            streams = partition_budget_rows(df)
+            amounts = df['הוצאה נטו'].to_numpy()
 
             # --- עיבוד הכנסות ---
             # Income = negative values (flipped to positive)
@@ -57,191 +257,76 @@ def load_all_budget_data():
             # 1. הכנסה rows with NEGATIVE values (actual income)
             # 2. הוצאה rows with NEGATIVE values (expenses that are actually income)
             income_items = []
-            
-            # 1. הכנסות מסומנות כ"הכנסה" - only NEGATIVE values are actual income
-            if 'הוצאה/הכנסה' in df.columns:
-                income_df = df[df['הוצאה/הכנסה'] == 'הכנסה'].copy()
-                
-                if 'סוג תקציב' in income_df.columns:
-                    income_df = income_df[income_df['סוג תקציב'] == 'ביצוע']
-                
-                # Filter out state income (הכנסות category) - we only want ministry income
-                if 'שם רמה 1' in income_df.columns:
-                    income_df = income_df[income_df['שם רמה 1'] != 'הכנסות']
-
-                income_df['הוצאה נטו'] = pd.to_numeric(income_df['הוצאה נטו'], errors='coerce').fillna(0)
-                
-                # Only include NEGATIVE values (actual income) and flip to positive
-                income_df = income_df[income_df['הוצאה נטו'] < 0]
-                
-                for _, row in income_df.iterrows():
-                    path = []
-                    for col in hierarchy_cols:
-                        raw_val = row.get(col, '')
-                        if pd.notna(raw_val):
-                            path.append(normalize_name(str(raw_val)))
-                        else:
-                            path.append('')
-                    
-                    value = row['הוצאה נטו']
-                    
-                    if path[0]:
-                        # Flip negative to positive (income is stored as positive)
-                        income_items.append({
-                            'path': path,
-                            'value': abs(float(value))
-                        })
-            
-            # 2. הוצאות שליליות (גם הן הכנסות בפועל) - flip to positive
-            if 'הוצאה/הכנסה' in df.columns:
-                negative_exp_df = df[df['הוצאה/הכנסה'] == 'הוצאה'].copy()
-                
-                if 'סוג תקציב' in negative_exp_df.columns:
-                    negative_exp_df = negative_exp_df[negative_exp_df['סוג תקציב'] == 'ביצוע']
-                
-                negative_exp_df['הוצאה נטו'] = pd.to_numeric(negative_exp_df['הוצאה נטו'], errors='coerce').fillna(0)
-                negative_exp_df = negative_exp_df[negative_exp_df['הוצאה נטו'] < 0]
-                
-                for _, row in negative_exp_df.iterrows():
-                    path = []
-                    for col in hierarchy_cols:
-                        raw_val = row.get(col, '')
-                        if pd.notna(raw_val):
-                            path.append(normalize_name(str(raw_val)))
-                        else:
-                            path.append('')
-                    
-                    value = row['הוצאה נטו']
-                    
+            for stream in ('income', 'negative_expense'):
+                positions = streams[stream]
+                for path, value in zip(row_paths(df, hierarchy_cols, positions), amounts[positions]):
                     if path[0]:
                         # Flip negative to positive (income is stored as positive)
                         income_items.append({
                             'path': path,
                             'value': abs(float(value))
                         })
-            
+
             all_income[year] = income_items
 
             # --- עיבוד הוצאות ---
-            if 'הוצאה/הכנסה' in df.columns:
-                df = df[df['הוצאה/הכנסה'] == 'הוצאה']
-
-            if 'סוג תקציב' in df.columns:
-                df = df[df['סוג תקציב'] == 'ביצוע']
-
-            # סינון קוד רמה 2 = 62 (החזרי חוב קרן) ו-35
-            if 'קוד רמה 2' in df.columns:
-                df = df[~df['קוד רמה 2'].isin([62])]
-            
-            # Additional filtering: exclude specific section codes (קוד סעיף)
-            if 'קוד סעיף' in df.columns and 'קוד מיון רמה 2' in df.columns:
-                # Convert section code to 4-digit string for comparison
-                seif_code = df['קוד סעיף'].astype(str).str.zfill(4)
-                
-                # Codes to exclude: 0000, 0089, 0091, 0093, 0094, 0095, 0098
-                should_exclude = (
-                    seif_code.str.startswith('0000') |
-                    seif_code.str.startswith('0089') |
-                    seif_code.str.startswith('0091') |
-                    seif_code.str.startswith('0093') |
-                    seif_code.str.startswith('0094') |
-                    seif_code.str.startswith('0095') |
-                    seif_code.str.startswith('0098')
-                )
-                
-                # Special case: code 0084 is only excluded if קוד מיון רמה 2 != 266
-                is_0084_to_exclude = seif_code.str.startswith('0084') & (df['קוד מיון רמה 2'] != 266)
-                should_exclude = should_exclude | is_0084_to_exclude
-                
-                # Keep only rows that should NOT be excluded
-                df = df[~should_exclude]
-
-            # המרת הוצאה נטו למספר
-            df['הוצאה נטו'] = pd.to_numeric(df['הוצאה נטו'], errors='coerce').fillna(0)
-            
             # Note: We do NOT subtract יתרת התחיבויות (commitment balance)
             # This matches the approach in join_phases.py which includes commitment_balance
             # as part of the budget amounts without subtraction
-            
-            df = df[df['הוצאה נטו'] > 0]
-
-            data_items = []
-            commitment_items = []
-            for _, row in df.iterrows():
-                # Build path with name normalization
-                path = []
-                for col in hierarchy_cols:
-                    raw_val = row.get(col, '')
-                    if pd.notna(raw_val):
-                        path.append(normalize_name(str(raw_val)))
-                    else:
-                        path.append('')
-                value = row['הוצאה נטו']
-
-                # בדיקה אם זה שכר
-                miun_rama1 = str(row.get('שם מיון רמה 1', '')) if pd.notna(row.get('שם מיון רמה 1')) else ''
-                is_salary = miun_rama1 == 'שכר'
-
-                # Get budget code (קוד תקנה) for matching with paid supports
-                budget_code = None
-                if 'קוד תקנה' in row.index:
-                    code_val = row['קוד תקנה']
-                    if pd.notna(code_val):
-                        budget_code = int(code_val)
-
-                # Get commitment balance for this row
-                commitment_value = 0
-                if 'יתרת התחיבויות' in row.index:
-                    commitment_value = pd.to_numeric(row['יתרת התחיבויות'], errors='coerce')
-                    if pd.isna(commitment_value):
-                        commitment_value = 0
-
-                if path[0] and value > 0:  # רק אם יש רמה 1 וערך חיובי
-                    data_items.append({
-                        'name': path[-1] if path[-1] else path[-2] if path[-2] else path[0],
-                        'path': path,
-                        'value': float(value),
-                        'code': budget_code,  # קוד תקנה for matching with paid supports
-                        'isSalary': is_salary,
-                        'miunRama1': miun_rama1,
-                        'program': str(row.get('שם תכנית', '')) if pd.notna(row.get('שם תכנית')) else '',
-                        'classification': str(row.get('שם מיון רמה 2', '')) if pd.notna(row.get('שם מיון רמה 2')) else ''
-                    })
-                    
-                    # Add commitment item with same path structure
-                    if commitment_value != 0:
-                        commitment_items.append({
-                            'path': path,
-                            'value': float(commitment_value)
-                        })
+            positions = streams['expense']  # positive amounts only
+            # רק אם יש רמה 1
+            positions = positions[np.array([bool(name) for name in column_strings(df, hierarchy_cols[0], positions)], dtype=bool)]
+            paths = [tuple(path) for path in zip(*(column_strings(df, col, positions) for col in hierarchy_cols))]
+            values = amounts[positions].astype(np.float64)
+
+            # Get budget code (קוד תקנה) for matching with paid supports
+            if 'קוד תקנה' in df.columns:
+                budget_codes = pd.to_numeric(df['קוד תקנה'].iloc[positions], errors='coerce').fillna(NO_CODE).to_numpy(np.int64)
+            else:
+                budget_codes = np.full(len(positions), NO_CODE, dtype=np.int64)
 
-            all_data[year] = data_items
-            all_commitments[year] = commitment_items
-            print(f"  נטענו {len(data_items)} רשומות הוצאה, {len(income_items)} רשומות הכנסה ו-{len(commitment_items)} רשומות התחייבויות לשנת {year}")
+            # Join commitment balance onto the expense row (same path and code)
+            if 'יתרת התחיבויות' in df.columns:
+                commitments = pd.to_numeric(df['יתרת התחיבויות'].iloc[positions], errors='coerce').fillna(0).to_numpy()
+            else:
+                commitments = np.zeros(len(positions))
+
+            # From the raw rows: aggregation nets commitments of opposite sign under one key
+            all_rigidity[year] = build_rigidity_index(zip(paths, values.tolist(), commitments.tolist()))
+
+            # The columns go straight into the store, without a dict per row
+            partition = all_data.add_year(
+                year, paths, values, budget_codes,
+                is_salary=np.array(column_strings(df, 'שם מיון רמה 1', positions), dtype=object) == 'שכר',  # בדיקה אם זה שכר
+                program=column_strings(df, 'שם תכנית', positions),
+                classification=column_strings(df, 'שם מיון רמה 2', positions),
+                commitment=commitments,
+                aggregate=aggregate
+            )
+            if aggregate:
+                print(f"  איחוד שורות כפולות: {len(paths)} → {len(partition)} ({partition.key_count(keep_program=False)} ללא פירוט תכנית)")
+
+            commitment_count = int(np.count_nonzero(partition.frame['commitment'].to_numpy()))
+            print(f"  נטענו {len(partition)} רשומות הוצאה, {len(income_items)} רשומות הכנסה ו-{commitment_count} רשומות התחייבויות לשנת {year}")
 
         except Exception as e:
             print(f"שגיאה בטעינת {filename}: {e}")
 
-    return all_data, all_income, all_commitments
+    return all_data, all_income, all_rigidity
 
 
-def load_paid_supports_data(budget_data):
-    """
-    Load paid supports data from CSV and match to budget codes.
-    Returns data structured by year with:
-    - totalPaid: total amount paid
-    - recipientCount: number of unique recipients
-    - byCode: aggregated data by budget code (קוד תקנה)
-    - recipients: list of individual recipients for table display
-    - orphanRecords/orphanAmount/orphanCodes: unmatched records stats
-    - flowData: hierarchical data for Sankey diagram (רמה 1 → רמה 2 → סעיף → תקנה)
-    - recipientsByCode: recipients grouped by budget code for drill-down
-    """
-    csv_path = os.path.join(os.path.dirname(__file__), 'table_of_paid_supports.csv')
+# Paid supports CSV read by default
+PAID_SUPPORTS_CSV = os.path.join(BASE_DIR, 'table_of_paid_supports.csv')
+
+
+def read_paid_supports_csv(csv_path=None):
+    """Paid supports CSV with the תקנה code and name split out; None when the file is missing"""
+    if csv_path is None:
+        csv_path = PAID_SUPPORTS_CSV
     
     if not os.path.exists(csv_path):
         print(f"  קובץ תמיכות לא נמצא: {csv_path}")
-        return {}
+        return None
     
     print(f"  טוען נתוני תמיכות מ-{csv_path}...")
     df = pd.read_csv(csv_path)
@@ -251,41 +336,97 @@ def load_paid_supports_data(budget_data):
     
     # Extract תקנה name (text after the code)
     df['שם_תקנה'] = df['תקנה'].str.replace(r'^\d{8}\s*', '', regex=True)
+    return df
+
+
+def paid_supports_budget_info(budget_data, frame):
+    """
+    {year: {code: {name, path, value}}} of the budget, extended with the codes the reconciled
+    frame borrows from another year (value 0, marked 'borrowed'; see extend_budget_info).
+    Reconciles the frame first when it is not yet reconciled.
+    Returns (budget_info_by_year, reconciled frame)
+    """
+    # Hierarchy info for the Sankey diagrams (grouped by code in the store, no per-row walk)
+    budget_info_by_year = {year: partition.code_info() for year, partition in budget_data.items()}
+
+    # Resolve codes missing from their year's budget, and borrow the hierarchy of codes taken from another year
+    if 'שיוך' not in frame:
+        frame = reconcile_codes(frame, budget_info_by_year, load_code_crosswalk())
+    extend_budget_info(budget_info_by_year, frame)
+    return budget_info_by_year, frame
+
+
+def build_year_flows(budget_info, by_code, recipients_by_code):
+    """convergentFlowData of one year's paid supports (budget ← takana → recipients)"""
+    return build_convergent_flow_data(budget_info, by_code, recipients_by_code)
+
+
+def flow_inputs(budget_info, by_code, recipients_by_code):
+    """
+    build_year_flows() arguments of one year, with budget_info cut down to the codes that
+    have payments (the only ones the builders read), so little is sent to a worker process
+    """
+    codes = (int(code_str) if code_str.isdigit() else 0 for code_str in by_code)
+    return {code: budget_info[code] for code in codes if code in budget_info}, by_code, recipients_by_code
+
+
+def build_flows_by_year(inputs, workers=None):
+    """
+    {year: convergentFlowData} for {year: flow_inputs(...)}, one year per task
+    in a process pool, assembled in year order.
+    workers: worker processes (None: CPU count; 1 builds them in this process)
+    """
+    years = sorted(inputs)
+    workers = min(workers or os.cpu_count() or 1, len(years))
+    if workers <= 1:
+        return {year: build_year_flows(*inputs[year]) for year in years}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(years, pool.map(build_year_flows, *zip(*(inputs[year] for year in years)))))
+
+
+# Recipients embedded per year in the paid supports page (its table page size)
+EMBEDDED_RECIPIENTS = 50
+
+
+def load_paid_supports_data(budget_data, csv_path=None, first_year=FIRST_YEAR, last_year=LAST_YEAR, frame=None,
+                            with_flows=True, workers=None):
+    """
+    Load paid supports data from CSV and match to budget codes (budget_data is a BudgetStore).
+    frame: an already parsed read_paid_supports_csv() result, instead of reading csv_path
+    with_flows: build the Sankey data (build_flows_by_year, after the per-year tables); when False
+    convergentFlowData is left None, for a caller that builds it itself
+    workers: processes building the Sankey data (see build_flows_by_year)
+    Returns data structured by year with:
+    - totalPaid: total amount paid
+    - recipientCount: number of unique recipients
+    - byCode: aggregated data by budget code (קוד תקנה)
+    - recipients: the EMBEDDED_RECIPIENTS largest recipients, the table's fallback
+    - orphanRecords/orphanAmount/orphanCodes: unmatched records stats
+    - reconciledRecords/reconciledAmount/reconciledBy: records whose code was resolved
+      through code_reconciliation (crosswalk, renamed code, nearest year) instead of dropped
+    - convergentFlowData: Sankey graph, budget hierarchy ← תקנה → recipients
+    - recipientsByCode: the 100 largest recipients of each budget code, for the Sankey data and
+      drill-down (the paid supports page embeds fewer when the recipient shards are written)
+    """
+    df = frame if frame is not None else read_paid_supports_csv(csv_path)
+    if df is None:
+        return {}
     
-    # Build set of valid codes per year from budget data
-    # Also build hierarchy info for Sankey
-    budget_codes_by_year = {}
-    budget_info_by_year = {}  # code -> {name, path, value}
-    
-    for year, items in budget_data.items():
-        budget_codes_by_year[year] = set()
-        budget_info_by_year[year] = {}
-        for item in items:
-            if 'code' in item and item['code']:
-                code = item['code']
-                budget_codes_by_year[year].add(code)
-                if code not in budget_info_by_year[year]:
-                    budget_info_by_year[year][code] = {
-                        'name': item.get('name', ''),
-                        'path': item.get('path', []),
-                        'value': 0
-                    }
-                budget_info_by_year[year][code]['value'] += item.get('value', 0)
+    budget_info_by_year, df = paid_supports_budget_info(budget_data, df)
     
     paid_data = {}
+    flow_inputs_by_year = {}
     
     # Process by year (שנת הבקשה)
-    for year in range(2015, 2025):
+    for year in range(first_year, last_year + 1):
         year_df = df[df['שנת הבקשה'] == year].copy()
         
         if len(year_df) == 0:
             continue
         
-        # Get valid budget codes for this year
-        valid_codes = budget_codes_by_year.get(year, set())
-        
-        # Mark matched vs orphan records
-        year_df['is_matched'] = year_df['קוד_תקנה'].isin(valid_codes)
+        # Mark matched vs orphan records; matched records count under their resolved code
+        year_df['is_matched'] = year_df['שיוך'].notna()
+        year_df['קוד_תקנה'] = year_df['קוד_מותאם'].where(year_df['is_matched'], year_df['קוד_תקנה'])
         
         matched_df = year_df[year_df['is_matched']]
         orphan_df = year_df[~year_df['is_matched']]
@@ -323,8 +464,9 @@ def load_paid_supports_data(budget_data):
                     'paid': float(paid_val) if pd.notna(paid_val) else 0.0,  # Keep in ILS
                 })
         
-        # Build recipients list (limit to top 5000 by amount for performance)
-        recipients_df = matched_df.nlargest(5000, 'סכום ששולם')
+        # Largest recipients, one table page: the page reads every row from the recipient
+        # index shards and falls back to these only when the shards cannot be loaded
+        recipients_df = matched_df.nlargest(EMBEDDED_RECIPIENTS, 'סכום ששולם')
         recipients = []
         for _, row in recipients_df.iterrows():
             code_int = int(row['קוד_תקנה']) if pd.notna(row['קוד_תקנה']) else 0
@@ -343,18 +485,14 @@ def load_paid_supports_data(budget_data):
                 'requestYear': int(row['שנת הבקשה']) if pd.notna(row['שנת הבקשה']) else year
             })
         
-        # Build hierarchical flow data for Sankey diagram
-        # Structure: רמה 1 → רמה 2 → סעיף → תקנה → מקבלי תמיכות
-        # ONLY codes with actual paid supports, flow = paid amounts
-        flow_data = build_flow_data(budget_info_by_year.get(year, {}), by_code, recipients_by_code)
-
-        # Build convergent flow data (budget ← takana → recipients)
-        convergent_flow_data = build_convergent_flow_data(
-            budget_info_by_year.get(year, {}), by_code, recipients_by_code
-        )
+        # Hierarchical flow data for the Sankey diagrams, built for all years together below
+        if with_flows:
+            flow_inputs_by_year[year] = flow_inputs(budget_info_by_year.get(year, {}), by_code, recipients_by_code)
 
         orphan_sum = orphan_df['סכום ששולם'].sum()
         matched_sum = matched_df['סכום ששולם'].sum() if len(matched_df) > 0 else 0
+        reconciled_df = matched_df[matched_df['שיוך'] != 'exact']
+        reconciled_sum = reconciled_df['סכום ששולם'].sum()
         
         # Convert totals to thousands of ILS to match budget units
         paid_data[year] = {
@@ -363,167 +501,58 @@ def load_paid_supports_data(budget_data):
             'byCode': by_code,
             'recipients': recipients,
             'recipientsByCode': recipients_by_code,
-            'flowData': flow_data,
-            'convergentFlowData': convergent_flow_data,
+            'convergentFlowData': None,
             'orphanRecords': int(len(orphan_df)),
             'orphanAmount': (float(orphan_sum) / 1000.0) if pd.notna(orphan_sum) else 0.0,  # In thousands
-            'orphanCodes': int(orphan_df['קוד_תקנה'].nunique()) if len(orphan_df) > 0 else 0
+            'orphanCodes': int(orphan_df['קוד_תקנה'].nunique()) if len(orphan_df) > 0 else 0,
+            # Records matched through a crosswalk, a renamed code or another year's code
+            'reconciledRecords': int(len(reconciled_df)),
+            'reconciledAmount': (float(reconciled_sum) / 1000.0) if pd.notna(reconciled_sum) else 0.0,  # In thousands
+            'reconciledBy': {method: int(count) for method, count in reconciled_df['שיוך'].value_counts().items()}
         }
         
-        print(f"    שנת {year}: {len(matched_df):,} רשומות מותאמות, {len(orphan_df):,} ללא התאמה")
+        print(f"    שנת {year}: {len(matched_df):,} רשומות מותאמות ({len(reconciled_df):,} בשיוך מחדש), {len(orphan_df):,} ללא התאמה")
+
+    for year, convergent_flow_data in build_flows_by_year(flow_inputs_by_year, workers).items():
+        paid_data[year]['convergentFlowData'] = convergent_flow_data
     
     return paid_data
 
 
-def build_flow_data(budget_info, paid_by_code, recipients_by_code=None):
+def load_recipient_rows(budget_data, frame, first_year=FIRST_YEAR, last_year=LAST_YEAR):
     """
-    Build hierarchical flow data for Sankey diagram.
-    ONLY includes budget codes that actually have paid supports.
-    Flow values represent actual paid amounts (not budget allocations).
-
-    Hierarchy: רמה 1 → רמה 2 → סעיף → תקנה → מקבלי תמיכות (top 5)
-
-    Returns:
-    {
-        'nodes': [
-            { 'id': '...', 'name': '...', 'level': 1-5, 'budget': X, 'paid': Y },
-            ...
-        ],
-        'links': [
-            { 'source': '...', 'target': '...', 'paid': Y },
-            ...
-        ]
-    }
+    Every matched paid supports row per year, largest payment first, for the recipient search index.
+    frame: read_paid_supports_csv() result (None when there is no CSV)
+    Returns { year: DataFrame[name, code, hp, takanName, ministry, paid] }
     """
-    if recipients_by_code is None:
-        recipients_by_code = {}
+    rows_by_year = {}
+    if frame is None:
+        return rows_by_year
 
-    hierarchy = {}  # path_key -> { budget, paid, children }
+    budget_info_by_year, frame = paid_supports_budget_info(budget_data, frame)
 
-    # ONLY iterate over codes that have actual paid supports
-    for code_str, paid_info in paid_by_code.items():
-        code = int(code_str) if code_str.isdigit() else 0
-        paid = paid_info.get('paid', 0)
-        if paid <= 0:
+    for year in range(first_year, last_year + 1):
+        if year not in budget_data:
             continue
-
-        # Find budget info for this code
-        info = budget_info.get(code, {})
-        path = info.get('path', [])
-        if len(path) < 3:
+        budget_info = budget_info_by_year[year]
+        year_df = frame[frame['שנת הבקשה'] == year]
+        matched_df = year_df[year_df['שיוך'].notna()]
+        if len(matched_df) == 0:
             continue
-
-        rama1 = path[0] if len(path) > 0 and path[0] else 'לא מוגדר'
-        rama2 = path[1] if len(path) > 1 and path[1] else 'לא מוגדר'
-        seif = path[2] if len(path) > 2 and path[2] else 'לא מוגדר'
-        takana_name = paid_info.get('name', info.get('name', str(code)))
-
-        budget = info.get('value', 0)
-
-        # Build hierarchy keys
-        r1_key = f"r1_{rama1}"
-        r2_key = f"r2_{rama1}_{rama2}"
-        r3_key = f"r3_{rama1}_{rama2}_{seif}"
-        r4_key = f"r4_{code}"
-
-        # Initialize nodes if not exist
-        if r1_key not in hierarchy:
-            hierarchy[r1_key] = {'name': rama1, 'level': 1, 'budget': 0, 'paid': 0, 'children': set()}
-        if r2_key not in hierarchy:
-            hierarchy[r2_key] = {'name': rama2, 'level': 2, 'budget': 0, 'paid': 0, 'children': set(), 'parent': r1_key}
-        if r3_key not in hierarchy:
-            hierarchy[r3_key] = {'name': seif, 'level': 3, 'budget': 0, 'paid': 0, 'children': set(), 'parent': r2_key}
-        if r4_key not in hierarchy:
-            hierarchy[r4_key] = {'name': takana_name, 'level': 4, 'budget': 0, 'paid': 0, 'code': code, 'parent': r3_key}
-
-        # Aggregate values - use PAID as the flow amount
-        hierarchy[r1_key]['budget'] += budget
-        hierarchy[r1_key]['paid'] += paid
-        hierarchy[r1_key]['children'].add(r2_key)
-
-        hierarchy[r2_key]['budget'] += budget
-        hierarchy[r2_key]['paid'] += paid
-        hierarchy[r2_key]['children'].add(r3_key)
-
-        hierarchy[r3_key]['budget'] += budget
-        hierarchy[r3_key]['paid'] += paid
-        hierarchy[r3_key]['children'].add(r4_key)
-
-        hierarchy[r4_key]['budget'] += budget
-        hierarchy[r4_key]['paid'] += paid
-
-        # Level 5: Top recipients for this code
-        if code_str in recipients_by_code:
-            recipients = sorted(recipients_by_code[code_str], key=lambda r: -r.get('paid', 0))
-            top_recipients = recipients[:5]
-            recipients_sum_thousands = 0
-
-            for i, r in enumerate(top_recipients):
-                r_paid_thousands = r.get('paid', 0) / 1000.0  # Convert ILS to thousands
-                if r_paid_thousands <= 0:
-                    continue
-                # Cap at code's total paid
-                if recipients_sum_thousands + r_paid_thousands > paid:
-                    r_paid_thousands = max(0, paid - recipients_sum_thousands)
-                if r_paid_thousands <= 0:
-                    continue
-
-                recipients_sum_thousands += r_paid_thousands
-                r_key = f"r5_{code}_{i}"
-                r_name = r.get('name', 'לא ידוע')
-
-                if r_key not in hierarchy:
-                    hierarchy[r_key] = {
-                        'name': r_name, 'level': 5,
-                        'budget': 0, 'paid': r_paid_thousands,
-                        'parent': r4_key
-                    }
-
-            # "Others" remainder
-            remainder = paid - recipients_sum_thousands
-            if remainder > 0.1:
-                others_count = paid_info.get('recipients', 0) - len(top_recipients)
-                others_label = f'אחרים ({others_count})' if others_count > 0 else 'אחרים'
-                others_key = f"r5_{code}_others"
-                if others_key not in hierarchy:
-                    hierarchy[others_key] = {
-                        'name': others_label, 'level': 5,
-                        'budget': 0, 'paid': remainder,
-                        'parent': r4_key
-                    }
-
-    # Convert to nodes and links format
-    nodes = []
-    links = []
-
-    for key, data in hierarchy.items():
-        node = {
-            'id': key,
-            'name': data['name'],
-            'level': data['level'],
-            'budget': data.get('budget', 0),
-            'paid': data['paid']
-        }
-        if 'code' in data:
-            node['code'] = data['code']
-        nodes.append(node)
-
-        # Create link to parent - flow is based on PAID amount
-        if 'parent' in data:
-            links.append({
-                'source': data['parent'],
-                'target': key,
-                'budget': data.get('budget', 0),
-                'paid': data['paid']
-            })
-
-    # Sort nodes by level and paid amount (not budget)
-    nodes.sort(key=lambda x: (x['level'], -x['paid']))
-
-    return {
-        'nodes': nodes,
-        'links': links
-    }
+        matched_df = matched_df.sort_values('סכום ששולם', ascending=False, kind='stable')
+        matched_df = matched_df.assign(קוד_תקנה=matched_df['קוד_מותאם'])
+
+        ministries = {code: str(info['path'][0]) for code, info in budget_info.items() if info['path']}
+        hp = matched_df['ח"פ מגיש'] if 'ח"פ מגיש' in matched_df else pd.Series('', index=matched_df.index)
+        rows_by_year[year] = pd.DataFrame({
+            'name': matched_df['שם מגיש'].map(lambda v: str(v) if pd.notna(v) else '').to_numpy(),
+            'code': matched_df['קוד_תקנה'].astype('int64').to_numpy(),
+            'hp': hp.map(lambda v: str(v) if pd.notna(v) else '').to_numpy(),
+            'takanName': matched_df['שם_תקנה'].map(lambda v: str(v) if pd.notna(v) else '').to_numpy(),
+            'ministry': matched_df['קוד_תקנה'].astype('int64').map(ministries).fillna('').to_numpy(),
+            'paid': matched_df['סכום ששולם'].fillna(0.0).astype(float).to_numpy(),  # Keep in ILS
+        })
+    return rows_by_year
 
 
 def build_convergent_flow_data(budget_info, paid_by_code, recipients_by_code=None):
@@ -615,8 +644,9 @@ def build_convergent_flow_data(budget_info, paid_by_code, recipients_by_code=Non
         hierarchy[l4_key]['paid'] += paid
 
         # GAP: budget vs paid discrepancy for this takana
+        # (none for a code borrowed from another year: it has no budget of its own this year)
         gap = budget - paid
-        if abs(gap) > 10:  # Only show gaps > 10K ILS
+        if abs(gap) > 10 and not info.get('borrowed'):  # Only show gaps > 10K ILS
             if gap > 0:
                 # Budget > Paid: money allocated but NOT paid as support
                 gap_key = f"GAP_{code}_unused"
@@ -778,311 +808,570 @@ def build_convergent_flow_data(budget_info, paid_by_code, recipients_by_code=Non
     }
 
 
-def create_html_file(budget_data, income_data, commitment_data):
-    """יצירת קובץ HTML עם הנתונים"""
-
-    # קריאת התבנית
-    template_path = os.path.join(os.path.dirname(__file__), 'budget_visualization.html')
-
-    with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
-
-    # המרת הנתונים ל-JSON
-    json_data = json.dumps(budget_data, ensure_ascii=False)
-    json_income = json.dumps(income_data, ensure_ascii=False)
-    json_commitments = json.dumps(commitment_data, ensure_ascii=False)
-
-    # החלפת placeholder
-    final_html = html_template.replace('__BUDGET_DATA_PLACEHOLDER__', json_data)
-    final_html = final_html.replace('__INCOME_DATA_PLACEHOLDER__', json_income)
-    final_html = final_html.replace('__COMMITMENT_DATA_PLACEHOLDER__', json_commitments)
-
-    # שמירה
-    output_path = os.path.join(os.path.dirname(__file__), 'budget_interactive.html')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
+# Last serialized payloads per output page: output_name -> (template_name, {placeholder: json})
+# Kept only while keeping_page_payloads() points it at a dict (watch mode), to re-render a
+# page after a template-only edit without re-serializing its data
+PAGE_PAYLOADS = None
 
-    return output_path
 
+@contextmanager
+def keeping_page_payloads(page_payloads):
+    """Record the payloads of the pages rendered in this block into page_payloads (None: keep nothing)"""
+    global PAGE_PAYLOADS
+    previous, PAGE_PAYLOADS = PAGE_PAYLOADS, page_payloads
+    try:
+        yield
+    finally:
+        PAGE_PAYLOADS = previous
 
-def create_time_series_file(budget_data):
-    """יצירת קובץ HTML להשוואה שנתית"""
 
-    template_path = os.path.join(os.path.dirname(__file__), 'time_series_template.html')
+def fill_template(template_name, replacements):
+    """Template text with its placeholders replaced by serialized payloads; None when the template is missing"""
+    template_path = os.path.join(BASE_DIR, template_name)
 
     if not os.path.exists(template_path):
-        print("  תבנית time_series_template.html לא נמצאה, מדלג...")
+        print(f"  תבנית {template_name} לא נמצאה, מדלג...")
         return None
 
     with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
+        final_html = f.read()
 
-    json_data = json.dumps(budget_data, ensure_ascii=False)
-    final_html = html_template.replace('__BUDGET_DATA_PLACEHOLDER__', json_data)
+    # החלפת placeholder
+    for placeholder, payload in replacements.items():
+        final_html = final_html.replace(placeholder, payload)
+    return final_html
+
+
+def render_page(template_name, output_name, replacements, output_dir=OUTPUT_DIR):
+    """
+    Fill a template's placeholders with serialized payloads and write the page into output_dir.
+    Returns the output path, or None when the template is missing.
+    """
+    final_html = fill_template(template_name, replacements)
+    if final_html is None:
+        return None
 
-    output_path = os.path.join(os.path.dirname(__file__), 'time_series.html')
+    # שמירה
+    output_path = os.path.join(output_dir, output_name)
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(final_html)
 
+    if PAGE_PAYLOADS is not None:
+        PAGE_PAYLOADS[output_name] = (template_name, replacements)
     return output_path
 
 
-def create_salary_percentage_file(budget_data):
-    """יצירת קובץ HTML לניתוח אחוזי שכר"""
-
-    template_path = os.path.join(os.path.dirname(__file__), 'salary_percentage_template.html')
-
-    if not os.path.exists(template_path):
-        print("  תבנית salary_percentage_template.html לא נמצאה, מדלג...")
+def rerender_page(page_payloads, output_name, output_dir=OUTPUT_DIR):
+    """Re-render a page from its payloads kept in page_payloads (after a template edit); None if it was never rendered"""
+    if output_name not in page_payloads:
         return None
+    template_name, replacements = page_payloads[output_name]
+    return render_page(template_name, output_name, replacements, output_dir)
 
-    with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
 
-    json_data = json.dumps(budget_data, ensure_ascii=False)
-    final_html = html_template.replace('__BUDGET_DATA_PLACEHOLDER__', json_data)
+# Outputs whose pages load the shared data engine script: for grouping and aggregation in
+# its worker, or for its shard loader
+ENGINE_OUTPUTS = ('budget', 'time_series', 'five_pillars', 'paid_supports')
+ENGINE_TEMPLATE = 'data_engine_template.js'
 
-    output_path = os.path.join(os.path.dirname(__file__), 'salary_percentage.html')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
 
+def write_data_engine(output_dir=OUTPUT_DIR):
+    """Write the data engine script the pages load (data_engine.js) next to them; returns its path"""
+    script = fill_template(ENGINE_TEMPLATE, {})
+    if script is None:
+        return None
+    output_path = os.path.join(output_dir, 'data_engine.js')
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(script)
     return output_path
 
 
-def create_ministry_overview_file(budget_data):
-    """יצירת קובץ HTML לסקירת משרדים"""
-
-    template_path = os.path.join(os.path.dirname(__file__), 'ministry_overview_template.html')
+# Fields and hierarchy depth read by the main page (also served per year by the query server)
+MAIN_PAGE_FIELDS = ('path', 'value', 'isSalary', 'program', 'classification')
+MAIN_PAGE_DEPTH = 6
 
-    if not os.path.exists(template_path):
-        print("  תבנית ministry_overview_template.html לא נמצאה, מדלג...")
-        return None
-
-    with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
 
-    json_data = json.dumps(budget_data, ensure_ascii=False)
-    final_html = html_template.replace('__BUDGET_DATA_PLACEHOLDER__', json_data)
+def create_html_file(budget_data, income_data, rigidity_data, output_dir=OUTPUT_DIR):
+    """יצירת קובץ HTML עם הנתונים"""
 
-    output_path = os.path.join(os.path.dirname(__file__), 'ministry_overview.html')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
+    budget_data = project_budget_data(budget_data, fields=MAIN_PAGE_FIELDS, depth=MAIN_PAGE_DEPTH)
 
-    return output_path
+    # המרת הנתונים ל-JSON
+    return render_page('budget_visualization.html', 'budget_interactive.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': json.dumps(budget_data, ensure_ascii=False),
+        '__INCOME_DATA_PLACEHOLDER__': json.dumps(income_data, ensure_ascii=False),
+        '__RIGIDITY_DATA_PLACEHOLDER__': json.dumps(rigidity_data, ensure_ascii=False),
+    }, output_dir)
 
 
-def create_sunburst_file(budget_data):
-    """יצירת קובץ HTML לתרשים Sunburst"""
+def main_page_year(ctx, year):
+    """One year of the main page's data, fetched by the page in serve mode"""
+    return {
+        'budget': project_budget_data({year: ctx.budget_data[year]}, fields=MAIN_PAGE_FIELDS, depth=MAIN_PAGE_DEPTH)[year],
+        'income': ctx.income_data.get(year, []),
+        'rigidity': ctx.rigidity_data.get(year, {}),
+    }
 
-    template_path = os.path.join(os.path.dirname(__file__), 'sunburst_template.html')
 
-    if not os.path.exists(template_path):
-        print("  תבנית sunburst_template.html לא נמצאה, מדלג...")
+def main_page_shell(api_prefix):
+    """The main page with no embedded data; it fetches each year from the query server at api_prefix"""
+    html = fill_template('budget_visualization.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': '{}',
+        '__INCOME_DATA_PLACEHOLDER__': '{}',
+        '__RIGIDITY_DATA_PLACEHOLDER__': '{}',
+    })
+    if html is None:
         return None
+    return html.replace('</head>', f"<script>window.BUDGET_QUERY_API = {json.dumps(api_prefix)};</script>\n</head>", 1)
 
-    with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
 
-    json_data = json.dumps(budget_data, ensure_ascii=False)
-    final_html = html_template.replace('__BUDGET_DATA_PLACEHOLDER__', json_data)
+def create_time_series_file(budget_data, stage=None, output_dir=OUTPUT_DIR):
+    """יצירת קובץ HTML להשוואה שנתית (stage: StageRecord that counts the written shards)"""
 
-    output_path = os.path.join(os.path.dirname(__file__), 'sunburst_budget.html')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
+    # Top movers between consecutive years, loaded by the page for the selected end year
+    shards = write_year_deltas(output_dir, build_year_deltas(budget_data))
+    if stage:
+        stage.record_outputs(shards)
+    print(f"  שינויים בין שנים: {len(shards)} זוגות שנים")
 
-    return output_path
+    # Fields and hierarchy depth read by the template
+    budget_data = project_budget_data(budget_data, fields=('path', 'value'), depth=6)
 
+    return render_page('time_series_template.html', 'time_series.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': json.dumps(budget_data, ensure_ascii=False),
+    }, output_dir)
 
-def create_five_pillars_file(budget_data):
-    """יצירת קובץ HTML ל-5 עמודי התקציב"""
 
-    template_path = os.path.join(os.path.dirname(__file__), 'five_pillars_template.html')
+def create_salary_percentage_file(budget_data, output_dir=OUTPUT_DIR):
+    """יצירת קובץ HTML לניתוח אחוזי שכר"""
 
-    if not os.path.exists(template_path):
-        print("  תבנית five_pillars_template.html לא נמצאה, מדלג...")
-        return None
+    # Fields and hierarchy depth read by the template
+    budget_data = project_budget_data(budget_data, fields=('path', 'value', 'isSalary'), depth=5)
 
-    with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
+    return render_page('salary_percentage_template.html', 'salary_percentage.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': json.dumps(budget_data, ensure_ascii=False),
+    }, output_dir)
 
-    json_data = json.dumps(budget_data, ensure_ascii=False)
-    final_html = html_template.replace('__BUDGET_DATA_PLACEHOLDER__', json_data)
 
-    output_path = os.path.join(os.path.dirname(__file__), 'five_pillars.html')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
+def create_ministry_overview_file(budget_data, output_dir=OUTPUT_DIR):
+    """יצירת קובץ HTML לסקירת משרדים"""
 
-    return output_path
+    # Fields and hierarchy depth read by the template
+    budget_data = project_budget_data(budget_data, fields=('path', 'value', 'isSalary'), depth=5)
 
+    return render_page('ministry_overview_template.html', 'ministry_overview.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': json.dumps(budget_data, ensure_ascii=False),
+    }, output_dir)
 
-def create_budget_rigidity_file(budget_data, commitment_data):
-    """יצירת קובץ HTML למד קשיחות התקציב"""
 
-    template_path = os.path.join(os.path.dirname(__file__), 'budget_rigidity_template.html')
+def create_sunburst_file(budget_data, output_dir=OUTPUT_DIR):
+    """יצירת קובץ HTML לתרשים Sunburst"""
 
-    if not os.path.exists(template_path):
-        print("  תבנית budget_rigidity_template.html לא נמצאה, מדלג...")
-        return None
+    # Fields and hierarchy depth read by the template
+    budget_data = project_budget_data(budget_data, fields=('path', 'value'), depth=5)
 
-    with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
+    return render_page('sunburst_template.html', 'sunburst_budget.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': json.dumps(budget_data, ensure_ascii=False),
+    }, output_dir)
 
-    json_budget = json.dumps(budget_data, ensure_ascii=False)
-    json_commitments = json.dumps(commitment_data, ensure_ascii=False)
 
-    final_html = html_template.replace('__BUDGET_DATA_PLACEHOLDER__', json_budget)
-    final_html = final_html.replace('__COMMITMENT_DATA_PLACEHOLDER__', json_commitments)
+def create_five_pillars_file(budget_data, output_dir=OUTPUT_DIR):
+    """יצירת קובץ HTML ל-5 עמודי התקציב"""
 
-    output_path = os.path.join(os.path.dirname(__file__), 'budget_rigidity.html')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
+    # Fields and hierarchy depth read by the template
+    budget_data = project_budget_data(budget_data, fields=('path', 'value'), depth=6)
 
-    return output_path
+    return render_page('five_pillars_template.html', 'five_pillars.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': json.dumps(budget_data, ensure_ascii=False),
+    }, output_dir)
 
 
-def create_convergent_sankey_file(paid_supports_data):
-    """יצירת קובץ HTML לגרף סנקי מתכנס — תקציב ↔ תקנה ↔ עמותות"""
+def create_budget_rigidity_file(budget_data, rigidity_data, output_dir=OUTPUT_DIR):
+    """יצירת קובץ HTML למד קשיחות התקציב"""
 
-    template_path = os.path.join(os.path.dirname(__file__), 'convergent_sankey_template.html')
+    # Fields and hierarchy depth read by the template
+    budget_data = project_budget_data(budget_data, fields=('path', 'value', 'isSalary'), depth=2)
+    rigidity_data = project_rigidity_index(rigidity_data, depth=1)
 
-    if not os.path.exists(template_path):
-        print("  תבנית convergent_sankey_template.html לא נמצאה, מדלג...")
-        return None
+    return render_page('budget_rigidity_template.html', 'budget_rigidity.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': json.dumps(budget_data, ensure_ascii=False),
+        '__RIGIDITY_DATA_PLACEHOLDER__': json.dumps(rigidity_data, ensure_ascii=False),
+    }, output_dir)
 
-    with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
 
-    json_paid = json.dumps(paid_supports_data, ensure_ascii=False)
-    final_html = html_template.replace('__PAID_SUPPORTS_PLACEHOLDER__', json_paid)
+def create_convergent_sankey_file(paid_supports_data, output_dir=OUTPUT_DIR):
+    """יצירת קובץ HTML לגרף סנקי מתכנס — תקציב ↔ תקנה ↔ עמותות"""
 
-    output_path = os.path.join(os.path.dirname(__file__), 'convergent_sankey.html')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
+    # Fields read by the template, the Sankey graph as packed typed-array columns (see flow_encoding.py)
+    paid_supports_data = project_paid_supports_data(paid_supports_data, fields=('convergentFlowData',))
 
-    return output_path
+    return render_page('convergent_sankey_template.html', 'convergent_sankey.html', {
+        '__PAID_SUPPORTS_PLACEHOLDER__': json.dumps(encode_paid_supports_flows(paid_supports_data), ensure_ascii=False),
+    }, output_dir)
 
 
-def create_paid_supports_file(budget_data, paid_supports_data):
-    """יצירת קובץ HTML לניתוח תמיכות ותקציב"""
+# Per-year paid supports fields read by the paid supports page
+PAID_SUPPORTS_PAGE_FIELDS = (
+    'totalPaid', 'recipientCount', 'byCode', 'recipients', 'recipientsByCode',
+    'orphanRecords', 'orphanAmount', 'orphanCodes', 'reconciledRecords', 'reconciledBy',
+)
 
-    template_path = os.path.join(os.path.dirname(__file__), 'paid_supports_template.html')
+# Recipients per code embedded in the paid supports page when the recipient shards hold every
+# code's full list: the sunburst's top recipients (the table pages a picked code from the shards)
+EMBEDDED_CODE_RECIPIENTS = 10
 
-    if not os.path.exists(template_path):
-        print("  תבנית paid_supports_template.html לא נמצאה, מדלג...")
-        return None
 
-    with open(template_path, 'r', encoding='utf-8') as f:
-        html_template = f.read()
+def truncate_recipients_by_code(paid_supports_data, count):
+    """Copy of the per-year paid supports data keeping only the first `count` recipients of each code"""
+    return {
+        year: dict(year_data, recipientsByCode={
+            code: recipients[:count] for code, recipients in year_data.get('recipientsByCode', {}).items()
+        })
+        for year, year_data in paid_supports_data.items()
+    }
 
-    # Convert budget data to include code for matching
-    json_budget = json.dumps(budget_data, ensure_ascii=False)
-    json_paid = json.dumps(paid_supports_data, ensure_ascii=False)
-    
-    final_html = html_template.replace('__BUDGET_DATA_PLACEHOLDER__', json_budget)
-    final_html = final_html.replace('__PAID_SUPPORTS_PLACEHOLDER__', json_paid)
 
-    output_path = os.path.join(os.path.dirname(__file__), 'paid_supports.html')
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
+def create_paid_supports_file(budget_data, paid_supports_data, recipient_rows=None, stage=None, output_dir=OUTPUT_DIR):
+    """יצירת קובץ HTML לניתוח תמיכות ותקציב (stage: StageRecord that counts the written shards)"""
 
-    return output_path
+    # Full recipient tables and search index, loaded by the page as the user pages, sorts and searches
+    if recipient_rows:
+        shards = write_recipient_index(output_dir, recipient_rows)
+        if stage:
+            stage.record_outputs(shards)
+        print(f"  טבלאות ואינדקס חיפוש מקבלים: {sum(len(rows) for rows in recipient_rows.values()):,} רשומות, {len(shards)} קבצים")
 
+    # Fields and hierarchy depth read by the template
+    budget_data = project_budget_data(budget_data, fields=('path', 'value', 'code', 'name'), depth=6)
+    paid_supports_data = project_paid_supports_data(paid_supports_data, fields=PAID_SUPPORTS_PAGE_FIELDS)
+    # With shards the embedded recipientsByCode only feeds the sunburst; a build without them
+    # keeps the 100 largest per code as the table's fallback
+    if recipient_rows:
+        paid_supports_data = truncate_recipients_by_code(paid_supports_data, EMBEDDED_CODE_RECIPIENTS)
+
+    return render_page('paid_supports_template.html', 'paid_supports.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': json.dumps(budget_data, ensure_ascii=False),
+        '__PAID_SUPPORTS_PLACEHOLDER__': json.dumps(paid_supports_data, ensure_ascii=False),
+    }, output_dir)
 
-def main():
-    print("=" * 60)
-    print("יצירת ויזואליזציה אינטראקטיבית של תקציב המדינה")
-    print("=" * 60)
 
-    # טעינת נתונים
-    print("\n[1/11] טוען נתונים מכל השנים...")
-    budget_data, income_data, commitment_data = load_all_budget_data()
+class BuildContext:
+    """
+    Datasets shared by the outputs, each loaded on first use.
+    Building only outputs that read the budget never touches the paid supports CSV.
+    flow_workers: processes building the per-year Sankey data (see build_flows_by_year)
+    keep_page_payloads: keep the rendered pages' payloads in page_payloads (watch mode)
+    output_dir: directory the pages, their data engine script and shards are written to
+    """
 
+    def __init__(self, first_year=FIRST_YEAR, last_year=LAST_YEAR, instrumentation=None, flow_workers=None,
+                 keep_page_payloads=False, output_dir=OUTPUT_DIR):
+        self.output_dir = output_dir
+        self.first_year = first_year
+        self.last_year = last_year
+        self.instrumentation = instrumentation or BuildInstrumentation()
+        self.flow_workers = flow_workers
+        self.page_payloads = {} if keep_page_payloads else None
+        self.csv_path = PAID_SUPPORTS_CSV
+
+    def invalidate(self, *datasets):
+        """Drop loaded datasets so they are reloaded on next use"""
+        for dataset in datasets:
+            self.__dict__.pop(dataset, None)
+
+    def preload(self, datasets=('budget', 'recipient_rows')):
+        """
+        Load datasets now instead of on first use (by default the ones serve mode answers from).
+        The cached properties are not locked: load them before threads read them.
+        """
+        for dataset in datasets:
+            getattr(self, dataset)
+
+    @cached_property
+    def budget(self):
+        """(budget_data, income_data, rigidity_data) from load_all_budget_data()"""
+        print("\nטוען נתונים מכל השנים...")
+        with self.instrumentation.stage('load_all_budget_data') as stage:
+            budget = load_all_budget_data(first_year=self.first_year, last_year=self.last_year)
+            stage.output_rows = count_rows(budget[0])
+        print_budget_summary(*budget)
+        return budget
+
+    @property
+    def budget_data(self):
+        return self.budget[0]
+
+    @property
+    def income_data(self):
+        return self.budget[1]
+
+    @property
+    def rigidity_data(self):
+        return self.budget[2]
+
+    @cached_property
+    def summary_data(self):
+        """Program-free collapse of the budget; only the main page reads `program`"""
+        with self.instrumentation.stage('drop_program_detail', input_rows=count_rows(self.budget_data)) as stage:
+            summary_data = drop_program_detail(self.budget_data)
+            stage.output_rows = count_rows(summary_data)
+        return summary_data
+
+    @cached_property
+    def paid_supports_frame(self):
+        """
+        The parsed paid supports CSV with reconciled codes (None when missing),
+        shared by the paid supports datasets
+        """
+        print("\nטוען נתוני תמיכות...")
+        frame = read_paid_supports_csv(self.csv_path)
+        if frame is None:
+            return None
+        with self.instrumentation.stage('reconcile_codes', input_rows=len(frame)) as stage:
+            budget_info_by_year = {year: partition.code_info() for year, partition in self.budget_data.items()}
+            frame = reconcile_codes(frame, budget_info_by_year, load_code_crosswalk())
+            stage.output_rows = int(frame['שיוך'].isin(['crosswalk', 'renamed', 'prior', 'next']).sum())
+        print(f"  שויכו מחדש {stage.output_rows:,} רשומות ללא קוד בתקציב השנה")
+        return frame
+
+    @cached_property
+    def paid_supports_data(self):
+        frame = self.paid_supports_frame
+        if frame is None:
+            # No CSV: final for this build (read_paid_supports_csv already reported it)
+            return {}
+        with self.instrumentation.stage('load_paid_supports_data', input_rows=count_rows(self.budget_data)) as stage:
+            paid_supports_data = load_paid_supports_data(
+                self.budget_data, first_year=self.first_year, last_year=self.last_year, frame=frame,
+                workers=self.flow_workers
+            )
+            stage.output_rows = sum(len(year_data['byCode']) for year_data in paid_supports_data.values())
+        if paid_supports_data:
+            print(f"  נטענו נתוני תמיכות ל-{len(paid_supports_data)} שנים")
+        return paid_supports_data
+
+    @cached_property
+    def recipient_rows(self):
+        frame = self.paid_supports_frame
+        with self.instrumentation.stage('load_recipient_rows') as stage:
+            recipient_rows = load_recipient_rows(
+                self.budget_data, frame, first_year=self.first_year, last_year=self.last_year
+            )
+            stage.output_rows = count_rows(recipient_rows)
+        return recipient_rows
+
+
+def print_budget_summary(budget_data, income_data, rigidity_data):
     print(f"\nנטענו נתונים ל-{len(budget_data)} שנים: {sorted(budget_data.keys())}")
-    
+
     # Print total expenditure summary
     print("\nסיכום הוצאות לפי שנה (לאחר סינון):")
     for year in sorted(budget_data.keys()):
-        year_total = sum(item['value'] for item in budget_data[year])
-        print(f"  {year}: {year_total:,.2f}")
-    grand_total = sum(sum(item['value'] for item in budget_data[year]) for year in budget_data.keys())
+        print(f"  {year}: {budget_data.total(year):,.2f}")
+    grand_total = sum(budget_data.total(year) for year in budget_data.keys())
     print(f"  סה\"כ כל השנים: {grand_total:,.2f}")
-    
+
     # Print commitment balance summary
     print("\nסיכום יתרת התחיבויות לפי שנה:")
-    for year in sorted(commitment_data.keys()):
-        year_commitment_total = sum(item['value'] for item in commitment_data[year])
-        print(f"  {year}: {year_commitment_total:,.2f}")
-    commitment_grand_total = sum(sum(item['value'] for item in commitment_data[year]) for year in commitment_data.keys())
+    for year in sorted(rigidity_data.keys()):
+        print(f"  {year}: {rigidity_data[year]['commitments']:,.2f}")
+    commitment_grand_total = sum(index['commitments'] for index in rigidity_data.values())
     print(f"  סה\"כ כל השנים: {commitment_grand_total:,.2f}")
 
-    # טעינת נתוני תמיכות
-    print("\n[2/11] טוען נתוני תמיכות...")
-    paid_supports_data = load_paid_supports_data(budget_data)
-    if paid_supports_data:
-        print(f"  נטענו נתוני תמיכות ל-{len(paid_supports_data)} שנים")
-
-    # יצירת HTML ראשי
-    print("\n[3/11] יוצר קובץ HTML ראשי...")
-    output_path = create_html_file(budget_data, income_data, commitment_data)
-    print(f"נשמר: {output_path}")
-
-    # יצירת HTML להשוואה שנתית
-    print("\n[4/11] יוצר קובץ השוואה שנתית...")
-    time_series_path = create_time_series_file(budget_data)
-    if time_series_path:
-        print(f"נשמר: {time_series_path}")
-
-    # יצירת HTML לאחוזי שכר
-    print("\n[5/11] יוצר קובץ אחוזי שכר...")
-    salary_path = create_salary_percentage_file(budget_data)
-    if salary_path:
-        print(f"נשמר: {salary_path}")
-
-    # יצירת HTML לסקירת משרדים
-    print("\n[6/11] יוצר קובץ סקירת משרדים...")
-    ministry_path = create_ministry_overview_file(budget_data)
-    if ministry_path:
-        print(f"נשמר: {ministry_path}")
-
-    # יצירת HTML לתרשים Sunburst
-    print("\n[7/11] יוצר קובץ Sunburst...")
-    sunburst_path = create_sunburst_file(budget_data)
-    if sunburst_path:
-        print(f"נשמר: {sunburst_path}")
-
-    # יצירת HTML ל-5 עמודי התקציב
-    print("\n[8/11] יוצר קובץ 5 עמודי התקציב...")
-    five_pillars_path = create_five_pillars_file(budget_data)
-    if five_pillars_path:
-        print(f"נשמר: {five_pillars_path}")
-
-    # יצירת HTML למד קשיחות
-    print("\n[9/11] יוצר קובץ מד קשיחות...")
-    rigidity_path = create_budget_rigidity_file(budget_data, commitment_data)
-    if rigidity_path:
-        print(f"נשמר: {rigidity_path}")
-
-    # יצירת HTML לתמיכות ותקציב
-    print("\n[10/11] יוצר קובץ תמיכות ותקציב...")
-    if paid_supports_data:
-        paid_supports_path = create_paid_supports_file(budget_data, paid_supports_data)
-        if paid_supports_path:
-            print(f"נשמר: {paid_supports_path}")
-    else:
-        print("  דילוג - אין נתוני תמיכות")
-
-    # יצירת HTML לסנקי מתכנס
-    print("\n[11/11] יוצר קובץ סנקי מתכנס...")
-    if paid_supports_data:
-        convergent_path = create_convergent_sankey_file(paid_supports_data)
-        if convergent_path:
-            print(f"נשמר: {convergent_path}")
-    else:
-        print("  דילוג - אין נתוני תמיכות")
+
+# Output name -> (description, builder, datasets the builder reads)
+# The datasets are resolved on the BuildContext before the builder runs, so only the stages they need execute
+OUTPUTS = {
+    'budget': ('קובץ HTML ראשי',
+               lambda ctx: create_html_file(ctx.budget_data, ctx.income_data, ctx.rigidity_data,
+                                            output_dir=ctx.output_dir),
+               ('budget_data',)),
+    'time_series': ('קובץ השוואה שנתית',
+                    lambda ctx: create_time_series_file(ctx.summary_data, stage=ctx.instrumentation.current,
+                                                        output_dir=ctx.output_dir),
+                    ('summary_data',)),
+    'salary_percentage': ('קובץ אחוזי שכר',
+                          lambda ctx: create_salary_percentage_file(ctx.summary_data, output_dir=ctx.output_dir),
+                          ('summary_data',)),
+    'ministry_overview': ('קובץ סקירת משרדים',
+                          lambda ctx: create_ministry_overview_file(ctx.summary_data, output_dir=ctx.output_dir),
+                          ('summary_data',)),
+    'sunburst': ('קובץ Sunburst',
+                 lambda ctx: create_sunburst_file(ctx.summary_data, output_dir=ctx.output_dir),
+                 ('summary_data',)),
+    'five_pillars': ('קובץ 5 עמודי התקציב',
+                     lambda ctx: create_five_pillars_file(ctx.summary_data, output_dir=ctx.output_dir),
+                     ('summary_data',)),
+    'budget_rigidity': ('קובץ מד קשיחות',
+                        lambda ctx: create_budget_rigidity_file(ctx.summary_data, ctx.rigidity_data,
+                                                                output_dir=ctx.output_dir),
+                        ('summary_data',)),
+    'paid_supports': ('קובץ תמיכות ותקציב',
+                      lambda ctx: create_paid_supports_file(ctx.summary_data, ctx.paid_supports_data, ctx.recipient_rows,
+                                                           stage=ctx.instrumentation.current, output_dir=ctx.output_dir),
+                      ('summary_data', 'paid_supports_data', 'recipient_rows')),
+    'convergent_sankey': ('קובץ סנקי מתכנס',
+                          lambda ctx: create_convergent_sankey_file(ctx.paid_supports_data, output_dir=ctx.output_dir),
+                          ('paid_supports_data',)),
+}
+
+# Template each output is rendered from (besides the data engine script of ENGINE_OUTPUTS)
+OUTPUT_TEMPLATES = {
+    'budget': 'budget_visualization.html',
+    'time_series': 'time_series_template.html',
+    'salary_percentage': 'salary_percentage_template.html',
+    'ministry_overview': 'ministry_overview_template.html',
+    'sunburst': 'sunburst_template.html',
+    'five_pillars': 'five_pillars_template.html',
+    'budget_rigidity': 'budget_rigidity_template.html',
+    'paid_supports': 'paid_supports_template.html',
+    'convergent_sankey': 'convergent_sankey_template.html',
+}
+
+
+def parse_year_range(value):
+    """'2019-2024' or '2024' -> (first_year, last_year)"""
+    match = re.fullmatch(r'(\d{4})(?:-(\d{4}))?', value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"טווח שנים לא תקין: {value} (לדוגמה 2019-2024)")
+    first_year = int(match.group(1))
+    last_year = int(match.group(2) or first_year)
+    if first_year > last_year:
+        raise argparse.ArgumentTypeError(f"טווח שנים הפוך: {value}")
+    return first_year, last_year
+
+
+def parse_outputs(value):
+    """'sunburst,time_series' -> ['sunburst', 'time_series'] (validated against OUTPUTS)"""
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in OUTPUTS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"פלטים לא מוכרים: {', '.join(unknown)} (אפשריים: {', '.join(OUTPUTS)})")
+    return names
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='יצירת ויזואליזציה אינטראקטיבית של תקציב המדינה')
+    parser.add_argument('--only', type=parse_outputs, default=list(OUTPUTS),
+                        help=f"comma separated outputs to build ({', '.join(OUTPUTS)})")
+    parser.add_argument('--years', type=parse_year_range, default=(FIRST_YEAR, LAST_YEAR),
+                        help=f"year range, e.g. 2019-2024 (default {FIRST_YEAR}-{LAST_YEAR})")
+    parser.add_argument('--headless', action='store_true', help='do not open a browser when done')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='processes building the per-year Sankey data (default: CPU count)')
+    parser.add_argument('--report', help='write a JSON timing/memory report to this path')
+    parser.add_argument('--profile-dir', help='write a cProfile dump per stage into this directory')
+    parser.add_argument('--list', action='store_true', help='list the available outputs and exit')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep the data in memory, rebuild on template/data changes and live-reload open pages')
+    parser.add_argument('--serve', action='store_true',
+                        help='instead of exporting pages, serve the main page and a query API from memory')
+    parser.add_argument('--port', type=int, default=8765, help='port of the watch mode / serve mode server')
+    parser.add_argument('--facts', nargs='?', const='arrow', choices=('arrow', 'parquet'),
+                        help='also write the cleaned budget as a fact table partitioned by year to facts/ '
+                             '(Arrow IPC by default, or parquet; needs pyarrow)')
+    parser.add_argument('--dist', action='store_true',
+                        help='also write the deployable site (built pages and data, content-hashed) to dist/')
+    parser.add_argument('--precompress', action='store_true',
+                        help='with --dist, also write .gz/.br siblings for hosts that serve precompressed files')
+    parser.add_argument('--require-supports', action='store_true',
+                        help='fail when the paid supports CSV is missing instead of skipping its pages')
+    return parser.parse_args(argv)
+
+
+def build_outputs(ctx, names):
+    """Build the named outputs, loading only the datasets they read; returns the written paths"""
+    written = []
+    if any(name in ENGINE_OUTPUTS for name in names):
+        write_data_engine(ctx.output_dir)
+    with keeping_page_payloads(ctx.page_payloads):
+        for index, name in enumerate(names, start=1):
+            description, builder, datasets = OUTPUTS[name]
+            resolved = [getattr(ctx, dataset) for dataset in datasets]
+            print(f"\n[{index}/{len(names)}] יוצר {description}...")
+            if 'paid_supports_data' in datasets and not ctx.paid_supports_data:
+                print("  דילוג - אין נתוני תמיכות")
+                continue
+            input_rows = count_rows(resolved[0]) if datasets[0] != 'paid_supports_data' else None
+            with ctx.instrumentation.stage(f'create_{name}', input_rows=input_rows) as stage:
+                output_path = stage.record_output(builder(ctx))
+            if output_path:
+                print(f"נשמר: {output_path}")
+                written.append(output_path)
+    return written
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list:
+        for name, (description, _, _) in OUTPUTS.items():
+            print(f"  {name:<20} {description}")
+        return
+
+    print("=" * 60)
+    print("יצירת ויזואליזציה אינטראקטיבית של תקציב המדינה")
+    print("=" * 60)
+
+    # Stage timing; a report path / profile dir (flags or BUDGET_BUILD_* variables) add memory, JSON and cProfile
+    instrumentation = BuildInstrumentation.from_environment()
+    if args.report:
+        instrumentation.report_path = args.report
+        instrumentation.trace_memory = True
+    if args.profile_dir:
+        instrumentation.profile_dir = args.profile_dir
+
+    first_year, last_year = args.years
+    ctx = BuildContext(first_year, last_year, instrumentation, flow_workers=args.jobs,
+                       keep_page_payloads=args.watch)
+
+    if args.serve:
+        from query_server import serve
+        # Static export stays the default; serve mode builds no pages and loads the datasets up front,
+        # before the server's request threads share them
+        ctx.preload()
+        write_data_engine(ctx.output_dir)
+        serve(ctx, lambda year: main_page_year(ctx, year), main_page_shell,
+              base_dir=ctx.output_dir,
+              port=args.port, open_browser=not args.headless)
+        return
+
+    needs_supports = any('paid_supports_data' in OUTPUTS[name][2] for name in args.only)
+    if args.require_supports and needs_supports and not ctx.paid_supports_data:
+        sys.exit(f"שגיאה: אין נתוני תמיכות ({ctx.csv_path}) - הדפים התלויים בהם לא ייבנו")
+
+    written = build_outputs(ctx, args.only)
+
+    if args.facts:
+        from fact_table import write_fact_table
+        facts = write_fact_table(ctx.budget_data, ctx.output_dir, args.facts)
+        if facts:
+            print(f"\nטבלת עובדות: {len(facts)} קבצים ({sum(os.path.getsize(path) for path in facts) / 1e6:,.1f}MB)")
+
+    if args.dist:
+        from dist import build_dist
+        # Only the shards this build wrote, not whatever earlier builds left under data/
+        dist = build_dist(ctx.output_dir, written, instrumentation.outputs(), precompress=args.precompress)
+        compressed = f" ({dist.gzip_bytes / 1e6:,.1f}MB דחוס)" if args.precompress else ""
+        print(f"\nאתר להעלאה: {dist.dist_dir} - {dist.files:,} קבצים, {dist.raw_bytes / 1e6:,.1f}MB{compressed}")
+
+    report_path = instrumentation.write_report()
+    if report_path:
+        print(f"\nדוח מדידות נשמר: {report_path}")
+
+    if args.watch:
+        from watch_mode import watch
+        # Pass this module's state explicitly: when run as a script it is __main__, not create_visualization
+        watch(ctx, args.only, build_outputs, partial(rerender_page, ctx.page_payloads, output_dir=ctx.output_dir),
+              ctx.page_payloads, OUTPUTS, base_dir=ctx.output_dir, template_dir=BASE_DIR,
+              engine=(os.path.join(BASE_DIR, ENGINE_TEMPLATE), partial(write_data_engine, ctx.output_dir),
+                      {OUTPUT_TEMPLATES[name] for name in ENGINE_OUTPUTS}),
+              port=args.port, open_browser=not args.headless)
+        return
 
     # פתיחה בדפדפן
-    print("\nפותח בדפדפן...")
-    webbrowser.open('file://' + os.path.abspath(output_path))
+    if written and not args.headless:
+        print("\nפותח בדפדפן...")
+        webbrowser.open('file://' + os.path.abspath(written[0]))
 
     print("\n" + "=" * 60)
     print("הסתיים בהצלחה!")
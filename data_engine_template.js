@@ -0,0 +1,328 @@
+/*
+ * מנוע נתונים משותף לדפי התקציב
+ * Data engine shared by the budget pages, written next to them as data_engine.js by
+ * create_visualization.py.
+ *
+ * The engine holds the page's year-keyed datasets inside a Web Worker and runs the
+ * grouping, filtering and aggregation queries there, so large years do not freeze the
+ * page. A page hands its data over once, keeping only the years, and then posts queries
+ * on named channels:
+ *
+ *     const engine = DataEngine.start();
+ *     const BUDGET_YEARS = engine.load('budget', __BUDGET_DATA_PLACEHOLDER__);
+ *     engine.query('view', 'levelView', 'budget', { year, path }).then(render);
+ *
+ * load() posts one year per task, so no single structured clone of the whole dataset
+ * blocks the page, and drops its reference to a year once the worker has it: the page
+ * keeps no copy. Queries posted meanwhile wait behind the loads.
+ *
+ * Only the latest query of a channel is answered: a query still queued in the worker when
+ * a newer one arrives on its channel is dropped, and a superseded query's promise never
+ * settles, so dragging the year slider renders only the year it stops on.
+ *
+ * Results carry the items the page needs themselves (the page has no copy to index into).
+ *
+ * Pages opened from disk (file://) cannot start a worker from a script URL, so the worker
+ * runs the same engineMain source from a blob URL; where no worker can start at all the
+ * engine runs on the page's thread with the same asynchronous protocol.
+ *
+ * The engine script also loads the pages' shards (data/ scripts, see shards.py):
+ * loadShard(name) adds a shard's script tag once and resolves with the payload the
+ * script hands to registerShard(name, payload). The deployed site (dist.py) publishes
+ * shards under hashed names, listed in window.SHARD_FILES.
+ */
+(function () {
+    'use strict';
+
+    function engineMain(scope) {
+        const datasets = {};
+        const pending = new Map();  // channel -> latest queued query
+        let draining = false;
+
+        // A rule matches an item when every level it lists holds one of the listed labels
+        function matchesRule(item, rule) {
+            for (const level in rule) {
+                const allowed = rule[level];
+                const label = item.path[level];
+                if (Array.isArray(allowed) ? !allowed.includes(label) : label !== allowed) return false;
+            }
+            return true;
+        }
+
+        const queries = {
+            // Five pillars split of one year: pillar, other and whale items
+            categorize(data, { year, pillars, exclude, whaleThreshold, whaleExclude }) {
+                const items = data[year] || [];
+                const keys = Object.keys(pillars);
+                const pillarItems = keys.map(() => []);
+                const pillarTotals = keys.map(() => 0);
+                const other = [];
+                const whales = [];
+                let total = 0;
+                let excluded = 0;
+
+                items.forEach(item => {
+                    if (exclude.some(rule => matchesRule(item, rule))) {
+                        excluded += item.value;
+                        return;
+                    }
+                    total += item.value;
+                    const pillar = keys.findIndex(key => pillars[key].some(rule => matchesRule(item, rule)));
+                    if (pillar >= 0) {
+                        pillarItems[pillar].push(item);
+                        pillarTotals[pillar] += item.value;
+                        return;
+                    }
+                    other.push(item);
+                    if (item.value >= whaleThreshold && !whaleExclude.some(rule => matchesRule(item, rule))) {
+                        whales.push(item);
+                    }
+                });
+                whales.sort((a, b) => b.value - a.value);
+
+                const result = { total, pillars: {}, other, whales, excluded };
+                keys.forEach((key, i) => {
+                    result.pillars[key] = { items: pillarItems[i], total: pillarTotals[i] };
+                });
+                return result;
+            },
+
+            // Items at a hierarchy level in the last year, with their totals in every year
+            levelSeries(data, { level, filter, years }) {
+                const lastYear = years[years.length - 1];
+                const items = {};
+                (data[lastYear] || []).forEach(item => {
+                    const key = item.path[level];
+                    if (!key || (filter && item.path[0] !== filter)) return;
+                    if (!items[key]) {
+                        items[key] = {
+                            name: key,
+                            value: 0,
+                            path: item.path.slice(0, level + 1),
+                            // All parent levels, for the tooltip
+                            parents: item.path.slice(0, level).filter(Boolean),
+                            series: years.map(() => 0)
+                        };
+                    }
+                    items[key].value += item.value;
+                });
+
+                years.forEach((year, yearIndex) => {
+                    (data[year] || []).forEach(item => {
+                        const entry = items[item.path[level]];
+                        if (entry && (!filter || item.path[0] === filter)) entry.series[yearIndex] += item.value;
+                    });
+                });
+                return Object.values(items).sort((a, b) => b.value - a.value);
+            },
+
+            // One drill-down view of the main page: the path trimmed to what exists in the year,
+            // the total under it and the aggregated nodes of the shown level
+            levelView(data, { year, groupBy, path, flatLevel, depth }) {
+                const group = groupBy && groupBy !== 'default' ? groupBy : null;
+                // Grouping adds the group value as level 0 in front of the path
+                const label = group
+                    ? (item, level) => (level === 0 ? item[group] : item.path[level - 1])
+                    : (item, level) => item.path[level];
+
+                let items = data[year] || [];
+                if (group) items = items.filter(item => item[group]);
+
+                const validPath = [];
+                let under = items;
+                for (const part of path) {
+                    const level = validPath.length;
+                    const matching = under.filter(item => label(item, level) === part);
+                    if (matching.length === 0) break;
+                    validPath.push(part);
+                    under = matching;
+                }
+                if (flatLevel === null || flatLevel === undefined) items = under;
+
+                const levelIndex = flatLevel === null || flatLevel === undefined ? validPath.length : flatLevel;
+                const hasNextLevel = levelIndex + 1 < depth;
+                const nodes = {};
+                let total = 0;
+                items.forEach(item => {
+                    total += item.value;
+                    const key = label(item, levelIndex);
+                    if (!key) return;
+                    if (!nodes[key]) {
+                        nodes[key] = { name: key, value: 0, salaryValue: 0, parentCategory: label(item, 0), hasChildren: false };
+                    }
+                    const node = nodes[key];
+                    node.value += item.value;
+                    if (item.isSalary) node.salaryValue += item.value;
+                    if (hasNextLevel && !node.hasChildren && label(item, levelIndex + 1)) node.hasChildren = true;
+                });
+
+                return {
+                    path: validPath,
+                    total,
+                    nodes: Object.values(nodes).sort((a, b) => b.value - a.value)
+                };
+            }
+        };
+
+        function drain() {
+            draining = false;
+            const batch = [...pending.values()];
+            pending.clear();
+            batch.forEach(({ id, query, dataset, args }) => {
+                try {
+                    const result = queries[query](datasets[dataset] || {}, args);
+                    scope.postMessage({ id, result });
+                } catch (error) {
+                    scope.postMessage({ id, error: String(error && error.message || error) });
+                }
+            });
+        }
+
+        scope.onmessage = (event) => {
+            const message = event.data;
+            if (message.type === 'load') {
+                datasets[message.dataset] = Object.assign(datasets[message.dataset] || {}, message.data);
+                scope.postMessage({ id: message.id, loaded: true });
+                return;
+            }
+            // Queries wait for the messages already queued, so a newer query on the channel replaces them
+            const stale = pending.get(message.channel);
+            if (stale) scope.postMessage({ id: stale.id, cancelled: true });
+            pending.set(message.channel, message);
+            if (!draining) {
+                draining = true;
+                setTimeout(drain, 0);
+            }
+        };
+    }
+
+    // Inside the worker
+    if (typeof window === 'undefined') {
+        engineMain(self);
+        return;
+    }
+
+    // The same protocol on the page's thread, when no worker can start
+    function pageThreadWorker() {
+        const worker = { onmessage: null };
+        const scope = { postMessage: (data) => setTimeout(() => worker.onmessage({ data }), 0) };
+        engineMain(scope);
+        // Queries are copied like a worker message would be, so later state changes do not reach them
+        worker.postMessage = (data) => {
+            const message = data.type === 'query' ? structuredClone(data) : data;
+            setTimeout(() => scope.onmessage({ data: message }), 0);
+        };
+        return worker;
+    }
+
+    function startWorker() {
+        try {
+            const source = `(${engineMain.toString()})(self);`;
+            const url = URL.createObjectURL(new Blob([source], { type: 'text/javascript' }));
+            return new Worker(url);
+        } catch (error) {
+            console.warn('Data engine runs on the page thread:', error);
+            return pageThreadWorker();
+        }
+    }
+
+    function start() {
+        let worker = startWorker();
+        const loads = new Map();     // id -> load message the worker has not confirmed, replayed if it fails to start
+        const requests = new Map();  // id -> { channel, resolve, reject, message }
+        const latest = {};           // channel -> id of its latest query
+        let posted = Promise.resolve();  // the last queued post; loads and queries go out in order
+        let nextId = 1;
+
+        // Post in a task of its own, after everything queued before it
+        function post(message) {
+            posted = posted.then(() => new Promise(resolve => setTimeout(() => {
+                worker.postMessage(message);
+                resolve();
+            }, 0)));
+        }
+
+        function onmessage(event) {
+            const { id, result, error, cancelled, loaded } = event.data;
+            // The worker holds the year now: drop the page's last reference to it
+            if (loaded) {
+                loads.delete(id);
+                return;
+            }
+            const request = requests.get(id);
+            if (!request) return;
+            requests.delete(id);
+            // Superseded queries never settle
+            if (cancelled || latest[request.channel] !== id) return;
+            if (error) {
+                request.reject(new Error(error));
+            } else {
+                request.resolve(result);
+            }
+        }
+
+        // A blob worker refused after construction (some file:// setups) reports an error event
+        worker.onmessage = onmessage;
+        worker.onerror = (event) => {
+            event.preventDefault();
+            console.warn('Data engine runs on the page thread:', event.message);
+            worker = pageThreadWorker();
+            worker.onmessage = onmessage;
+            loads.forEach(message => worker.postMessage(message));
+            requests.forEach(request => worker.postMessage(request.message));
+        };
+
+        return {
+            // Hand a {year: items} dataset over to the worker, one year per message;
+            // returns its years in ascending order
+            load(dataset, data) {
+                const years = Object.keys(data).map(Number).sort((a, b) => a - b);
+                years.forEach(year => {
+                    const message = { type: 'load', id: nextId++, dataset, data: { [year]: data[year] } };
+                    loads.set(message.id, message);
+                    post(message);
+                });
+                return years;
+            },
+            query(channel, query, dataset, args) {
+                const id = nextId++;
+                latest[channel] = id;
+                const message = { type: 'query', id, channel, query, dataset, args };
+                return new Promise((resolve, reject) => {
+                    requests.set(id, { channel, resolve, reject, message });
+                    post(message);
+                });
+            }
+        };
+    }
+
+    // ============================================
+    // SHARDS - data/ scripts loaded on demand
+    // ============================================
+    const shardRequests = {};
+
+    function registerShard(name, payload) {
+        if (shardRequests[name]) shardRequests[name].resolve(payload);
+    }
+
+    function loadShard(name) {
+        if (!shardRequests[name]) {
+            const request = {};
+            request.promise = new Promise((resolve, reject) => {
+                request.resolve = resolve;
+                const script = document.createElement('script');
+                script.src = (window.SHARD_FILES && window.SHARD_FILES[name]) || `data/${name}.js`;
+                script.onerror = () => reject(new Error(`Missing shard: ${name}`));
+                document.head.appendChild(script);
+            });
+            shardRequests[name] = request;
+        }
+        return shardRequests[name].promise;
+    }
+
+    // Shard scripts call registerShard as a global
+    window.registerShard = registerShard;
+    window.loadShard = loadShard;
+
+    window.DataEngine = { start };
+})();
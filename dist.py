@@ -0,0 +1,165 @@
+"""
+אתר להעלאה (dist)
+The deployable site: only the published pages and the data they load, under dist/.
+
+Every page and script is published under a content-hashed name (name.<hash>.ext), so
+the host can let browsers cache it for good:
+
+    index.html                  entry point, redirects to the hashed main page
+    <page>.html                 small stub redirecting to the page's hashed file, so the
+                                pages link to each other by their stable names and a
+                                page's hash depends only on its own content
+    <page>.<hash>.html          the page, referencing the hashed data engine
+    data_engine.<hash>.js
+    data/<shard>.<hash>.js      every shard this build wrote (see shards.py)
+    data/manifest.<hash>.js     window.SHARD_FILES = {shard name: hashed path}, loaded by
+                                the pages that load shards (the data engine's loadShard reads it)
+
+With precompress, every file also gets .gz and .br siblings, for hosts that serve
+precompressed files (GitHub Pages does not; it compresses on the fly). Brotli needs the
+optional brotli package; without it only .gz siblings are written.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from shards import SHARD_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST_DIR = 'dist'
+HASH_LENGTH = 10
+
+# Smaller files are not worth a compressed sibling
+COMPRESS_MIN_BYTES = 1024
+
+ENGINE_SCRIPT = 'data_engine.js'
+MAIN_PAGE = 'budget_interactive.html'
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(name, data):
+    """'data/deltas/2015_2016.js' -> 'data/deltas/2015_2016.<hash>.js'"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{content_hash(data)}{ext}"
+
+
+def redirect_page(target):
+    """A page that sends the browser on to target (same shape as the repository's index.html)"""
+    return f"""<!DOCTYPE html>
+<html lang="he" dir="rtl">
+<head>
+    <meta charset="UTF-8">
+    <meta http-equiv="refresh" content="0; url={target}">
+    <title>תקציב המדינה</title>
+</head>
+<body>
+    <p>מעביר לדף הראשי... <a href="{target}">לחץ כאן אם אינך מועבר אוטומטית</a></p>
+</body>
+</html>
+"""
+
+
+class DistWriter:
+    """Writes files into the dist directory, with their compressed siblings when precompress is set, counting bytes"""
+
+    def __init__(self, dist_dir, precompress=False):
+        self.dist_dir = dist_dir
+        self.precompress = precompress
+        self.files = 0
+        self.raw_bytes = 0
+        self.gzip_bytes = 0
+
+    def write(self, name, data):
+        path = os.path.join(self.dist_dir, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.files += 1
+        self.raw_bytes += len(data)
+
+        if not self.precompress:
+            return name
+        if len(data) < COMPRESS_MIN_BYTES:
+            self.gzip_bytes += len(data)
+            return name
+        # mtime=0 keeps the archive identical between builds of the same content
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        with open(path + '.gz', 'wb') as f:
+            f.write(compressed)
+        self.gzip_bytes += len(compressed)
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+        return name
+
+    def write_hashed(self, name, data):
+        """Write data under its content-hashed name; returns that name"""
+        return self.write(hashed_name(name, data), data)
+
+
+def publish_shards(base_dir, writer, paths):
+    """
+    Publish the shards among paths (files under data/ written by this build, so shards
+    left over from earlier builds are not shipped); returns {shard name: hashed path}
+    """
+    shard_root = os.path.abspath(os.path.join(base_dir, SHARD_DIR))
+    files = {}
+    for path in paths:
+        relative = os.path.relpath(os.path.abspath(path), shard_root)
+        if relative.startswith(os.pardir) or not relative.endswith('.js'):
+            continue
+        shard = relative[:-len('.js')].replace(os.sep, '/')
+        with open(path, 'rb') as f:
+            files[shard] = writer.write_hashed(f"{SHARD_DIR}/{shard}.js", f.read())
+    return dict(sorted(files.items()))
+
+
+def build_dist(base_dir, pages, shards=(), dist_dir=None, precompress=False):
+    """
+    Write the deployable site for the given page paths (generated pages in base_dir).
+    shards: the files the build wrote alongside the pages; those under data/ are published
+    precompress: also write .gz / .br siblings
+    Returns the DistWriter with the written file counts and sizes.
+    """
+    dist_dir = dist_dir or os.path.join(base_dir, DIST_DIR)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    writer = DistWriter(dist_dir, precompress)
+
+    engine = None
+    engine_path = os.path.join(base_dir, ENGINE_SCRIPT)
+    if os.path.exists(engine_path):
+        with open(engine_path, 'rb') as f:
+            engine = writer.write_hashed(ENGINE_SCRIPT, f.read())
+
+    shard_files = publish_shards(base_dir, writer, shards)
+    manifest = None
+    if shard_files:
+        body = f"window.SHARD_FILES = {json.dumps(shard_files, separators=(',', ':'))};\n"
+        manifest = writer.write_hashed(f"{SHARD_DIR}/manifest.js", body.encode('utf-8'))
+
+    hashed_pages = {}
+    for page in pages:
+        page_name = os.path.basename(page)
+        with open(page, 'r', encoding='utf-8') as f:
+            html = f.read()
+        if engine:
+            html = html.replace(f'src="{ENGINE_SCRIPT}"', f'src="{engine}"')
+        if manifest and 'loadShard(' in html:
+            html = html.replace('</head>', f'<script src="{manifest}"></script>\n</head>', 1)
+        hashed_pages[page_name] = writer.write_hashed(page_name, html.encode('utf-8'))
+        writer.write(page_name, redirect_page(hashed_pages[page_name]).encode('utf-8'))
+
+    if hashed_pages:
+        entry = hashed_pages.get(MAIN_PAGE) or next(iter(hashed_pages.values()))
+        writer.write('index.html', redirect_page(entry).encode('utf-8'))
+    return writer
@@ -0,0 +1,135 @@
+"""
+טבלת עובדות של התקציב המסונן
+The cleaned budget (after the loaders' filters, name normalization and row merging) as a
+tidy fact table, one file per year, for tools that should not re-derive it from the
+workbooks:
+
+    facts/budget/year=2024/part-0.arrow     (or part-0.parquet)
+
+The layout is Hive partitioned, so the whole table scans as one dataset:
+
+    pyarrow.dataset.dataset('facts/budget', format='arrow', partitioning='hive')
+
+Arrow IPC files are written uncompressed so readers can memory-map them; Parquet files
+are zstd compressed. Hierarchy labels, program and classification are dictionary encoded,
+and missing labels and codes are nulls. Amounts are in thousands of ILS, as in the workbooks.
+
+Writing needs the optional pyarrow package; fact_frame() (a pandas DataFrame of one year,
+e.g. of BudgetPipeline.budget_data) does not.
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from budget_store import NO_CODE
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FACT_DIR = 'facts'
+FACT_TABLE = 'budget'
+FACT_FORMATS = ('arrow', 'parquet')
+
+# Fact table column -> workbook column it comes from, in path order
+LEVEL_COLUMNS = {
+    'rama1': 'שם רמה 1',
+    'rama2': 'שם רמה 2',
+    'seif': 'שם סעיף',
+    'thum': 'שם תחום',
+    'takana': 'שם תקנה',
+    'miunRama1': 'שם מיון רמה 1',
+}
+
+OTHER_COLUMNS = {
+    'code': 'קוד תקנה',
+    'value': 'הוצאה נטו',
+    'isSalary': 'שם מיון רמה 1 = שכר',
+    'program': 'שם תכנית',
+    'classification': 'שם מיון רמה 2',
+    'commitment': 'יתרת התחיבויות',
+}
+
+
+def level_categoricals(store):
+    """Per hierarchy level: (categories, category code of each interned path) over the store's path table"""
+    levels = []
+    for level in range(len(LEVEL_COLUMNS)):
+        labels = np.array([path[level] or None if len(path) > level else None for path in store.paths], dtype=object)
+        codes, categories = pd.factorize(labels)
+        levels.append((categories, codes.astype(np.int32)))
+    return levels
+
+
+def nonempty_categorical(values):
+    """Categorical with '' turned into a missing value"""
+    values = pd.Categorical(values)
+    if '' in values.categories:
+        values = values.remove_categories([''])
+    return values
+
+
+def fact_frame(store, year, levels=None):
+    """One year of the store as a fact table DataFrame; levels: a level_categoricals(store) result to reuse"""
+    levels = levels or level_categoricals(store)
+    frame = store[year].frame
+    path_ids = frame['path_id'].to_numpy()
+    columns = {
+        name: pd.Categorical.from_codes(codes[path_ids], categories=categories)
+        for name, (categories, codes) in zip(LEVEL_COLUMNS, levels)
+    }
+    code = pd.array(frame['code'].to_numpy(), dtype='Int32')
+    code[code == NO_CODE] = pd.NA
+    columns.update({
+        'code': code,
+        'value': frame['value'].to_numpy(),
+        'isSalary': frame['isSalary'].to_numpy(),
+        'program': nonempty_categorical(frame['program']),
+        'classification': nonempty_categorical(frame['classification']),
+        'commitment': frame['commitment'].to_numpy(),
+    })
+    return pd.DataFrame(columns)
+
+
+def fact_schema_metadata(year):
+    """Field -> source column notes and the year, stored in each file's schema metadata"""
+    sources = {**LEVEL_COLUMNS, **OTHER_COLUMNS}
+    return {
+        'year': str(year),
+        'unit': 'thousands ILS',
+        **{f'source.{name}': source for name, source in sources.items()},
+    }
+
+
+def write_fact_table(store, base_dir, fmt='arrow'):
+    """
+    Write one fact table file per year of the store under base_dir/facts/budget.
+    Returns the written paths; [] when pyarrow is not installed.
+    """
+    if fmt not in FACT_FORMATS:
+        raise ValueError(f"unknown fact table format: {fmt} ({', '.join(FACT_FORMATS)})")
+    if pyarrow is None:
+        print("  pyarrow לא מותקן - מדלג על ייצוא טבלת העובדות")
+        return []
+
+    table_dir = os.path.join(base_dir, FACT_DIR, FACT_TABLE)
+    shutil.rmtree(table_dir, ignore_errors=True)
+    levels = level_categoricals(store)
+    written = []
+    for year in sorted(store):
+        table = pyarrow.Table.from_pandas(fact_frame(store, year, levels), preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **fact_schema_metadata(year)})
+        path = os.path.join(table_dir, f"year={year}", f"part-0.{fmt}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if fmt == 'arrow':
+            pyarrow.feather.write_feather(table, path, compression='uncompressed')
+        else:
+            pyarrow.parquet.write_table(table, path, compression='zstd')
+        written.append(path)
+    return written
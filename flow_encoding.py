@@ -0,0 +1,153 @@
+"""
+קידוד בינארי לגרפי הסנקי
+Packed encoding of the Sankey graph (convergentFlowData) embedded in the convergent Sankey page.
+
+Node and link objects with string ids that repeat the Hebrew hierarchy names become
+columns: every node / link field is one little-endian typed array, base64 encoded, that
+the page turns into a Uint32Array / Float32Array / Float64Array in one step.
+
+    {
+        'strings': ['שירותים חברתיים', 'left', ...],       names, sides and gap types, once each
+        'nodeCount': N, 'linkCount': M,
+        'nodes': {'name': {'type': 'string', 'data': '<base64>'}, 'budget': {...}, ...},
+        'links': {'source': {'type': 'node', 'data': '<base64>'}, ...}
+    }
+
+A node's id is its index: links refer to nodes by index ('node' columns) and text fields
+refer to the string table ('string' columns). A field missing on some nodes / links holds
+MISSING (index columns) or NaN (float columns) there; a field missing on all of them has
+no column. Amounts stay float64 so the pages show the same thousands; layout coordinates
+are float32.
+"""
+
+import base64
+import math
+import sys
+from array import array
+
+# Column type -> array typecode (all four bytes wide, or eight for float64)
+TYPECODES = {
+    'string': 'I',
+    'node': 'I',
+    'uint32': 'I',
+    'float32': 'f',
+    'float64': 'd',
+}
+
+# Index columns' marker for a field the node / link does not have
+MISSING = 0xFFFFFFFF
+
+NODE_FIELDS = {
+    'name': 'string',
+    'level': 'uint32',
+    'side': 'string',
+    'code': 'uint32',
+    'budget': 'float64',
+    'paid': 'float64',
+    'x': 'float32',
+    'y': 'float32',
+    'gap': 'float64',
+    'gap_type': 'string',
+}
+
+LINK_FIELDS = {
+    'source': 'node',
+    'target': 'node',
+    'value': 'float64',
+    'side': 'string',
+    'budget': 'float64',
+    'paid': 'float64',
+    'gap_type': 'string',
+}
+
+# Fields every node / link has
+REQUIRED_NODE_FIELDS = ('name', 'level', 'budget', 'paid')
+REQUIRED_LINK_FIELDS = ('source', 'target', 'budget', 'paid')
+
+
+def pack_array(typecode, values):
+    """Base64 of the values as a little-endian array"""
+    packed = array(typecode, values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode('ascii')
+
+
+def unpack_array(column):
+    """The array of a {'type', 'data'} column (ValueError on bad base64 or a length that is not whole items)"""
+    packed = array(TYPECODES[column['type']])
+    packed.frombytes(base64.b64decode(column['data'], validate=True))
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed
+
+
+def encode_columns(items, fields, strings, node_index):
+    """{field: column} of a list of nodes or links; strings: {text: index}, extended in place"""
+    present = [field for field in fields if any(field in item for item in items)]
+    unknown = {field for item in items for field in item} - set(fields) - {'id'}
+    if unknown:
+        raise ValueError(f"no column type for fields {sorted(unknown)}")
+
+    columns = {}
+    for field in present:
+        column_type = fields[field]
+        if column_type == 'string':
+            values = [strings.setdefault(item[field], len(strings)) if field in item else MISSING for item in items]
+        elif column_type == 'node':
+            values = [node_index[item[field]] for item in items]
+        elif column_type == 'uint32':
+            values = [item.get(field, MISSING) for item in items]
+        else:
+            values = [item.get(field, math.nan) for item in items]
+        columns[field] = {'type': column_type, 'data': pack_array(TYPECODES[column_type], values)}
+    return columns
+
+
+def encode_flow_graph(graph):
+    """Packed form of a {'nodes', 'links'} graph from build_convergent_flow_data"""
+    nodes, links = graph['nodes'], graph['links']
+    node_index = {node['id']: index for index, node in enumerate(nodes)}
+    strings = {}
+    node_columns = encode_columns(nodes, NODE_FIELDS, strings, node_index)
+    link_columns = encode_columns(links, LINK_FIELDS, strings, node_index)
+    return {
+        'strings': list(strings),
+        'nodeCount': len(nodes),
+        'linkCount': len(links),
+        'nodes': node_columns,
+        'links': link_columns,
+    }
+
+
+def encode_paid_supports_flows(paid_supports_data):
+    """Copy of load_paid_supports_data() output with the Sankey graph of every year packed"""
+    return {
+        year: {
+            **year_data,
+            'convergentFlowData': encode_flow_graph(year_data['convergentFlowData']),
+        }
+        for year, year_data in paid_supports_data.items()
+    }
+
+
+def decode_items(columns, count, strings):
+    """List of count dicts from packed columns (node fields stay indices); the inverse of encode_columns"""
+    items = [{} for _ in range(count)]
+    for field, column in columns.items():
+        values = unpack_array(column)
+        for item, value in zip(items, values):
+            if column['type'] in ('string', 'uint32') and value == MISSING:
+                continue
+            if column['type'].startswith('float') and math.isnan(value):
+                continue
+            item[field] = strings[value] if column['type'] == 'string' else value
+    return items
+
+
+def decode_flow_graph(packed):
+    """{'nodes', 'links'} with each node's index as its id (for inspection and checks)"""
+    nodes = decode_items(packed['nodes'], packed['nodeCount'], packed['strings'])
+    for index, node in enumerate(nodes):
+        node['id'] = index
+    return {'nodes': nodes, 'links': decode_items(packed['links'], packed['linkCount'], packed['strings'])}
@@ -0,0 +1,278 @@
+"""
+צינור הבנייה לשימוש ממחברת
+Importable build pipeline, for notebooks (jon_test_1.ipynb) and other scripts.
+
+create_visualization.py runs every stage from main(), next to the script, and opens a
+browser. BudgetPipeline exposes the same stages as lazily evaluated, memoized steps with
+explicit directories and no browser:
+
+    from pipeline import BudgetPipeline
+    pipeline = BudgetPipeline(output_dir='out', first_year=2020)
+    pipeline.budget_data[2024].code_info()   # load budget
+    pipeline.paid_supports_data[2024]        # load supports
+    pipeline.flows(2024)                     # build flows of one year
+    pipeline.render('sunburst')              # render page
+
+Each stage is cached under a key hashing its inputs: the contents of the workbooks, the
+paid supports CSV, name_mappings.json, code_crosswalk.json and a page's own template (and
+the data engine script, for the pages that load it), the year range, and the keys of the
+stages it reads. A stage runs again on its next use only when
+its key changed: after an edit to the CSV the budget stays loaded, and a page whose
+inputs are unchanged is not rewritten.
+
+The dataset attributes match BuildContext, so the OUTPUTS builders run on a pipeline as is.
+Pipelines share no module state: each passes its output directory and name mappings to
+create_visualization, so two pipelines in one process do not interfere.
+"""
+
+import contextlib
+import hashlib
+import io
+import os
+
+import create_visualization as cv
+from build_instrumentation import BuildInstrumentation, count_rows
+from code_reconciliation import CROSSWALK_PATH
+
+# Datasets that depend on the paid supports CSV (the rest depend on the workbooks only)
+SUPPORTS_DATASETS = ('paid_supports_data', 'recipient_rows')
+
+
+def stage_key(*parts):
+    """Hash of a stage's inputs (file digests, parameters and upstream keys)"""
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+class FileDigests:
+    """sha256 of files' contents, rehashed only when a file's size or mtime changed"""
+
+    def __init__(self):
+        self._cache = {}  # path -> ((size, mtime), digest)
+
+    def __call__(self, path):
+        """Digest of the file at path; None when it does not exist"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = self._cache.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        self._cache[path] = (signature, digest.hexdigest())
+        return digest.hexdigest()
+
+
+def flow_payload(convergent_flow_data):
+    """A year's flows under their paid supports payload keys"""
+    return {'convergentFlowData': convergent_flow_data}
+
+
+class BudgetPipeline:
+    """
+    The build stages as memoized steps.
+    data_dir: directory holding the tableau_BudgetData*.xlsx workbooks
+    output_dir: directory the rendered pages (and their data engine and shards) are written to
+    csv_path: the paid supports CSV (default: table_of_paid_supports.csv next to the script)
+    verbose: show the progress printed by the stages
+    flow_workers: processes building the per-year Sankey data (see build_flows_by_year)
+    """
+
+    def __init__(self, data_dir=cv.BASE_DIR, output_dir=cv.BASE_DIR, first_year=cv.FIRST_YEAR,
+                 last_year=cv.LAST_YEAR, csv_path=None, verbose=True, instrumentation=None, flow_workers=None):
+        self.data_dir = data_dir
+        self.output_dir = os.path.abspath(output_dir)
+        self.first_year = first_year
+        self.last_year = last_year
+        self.csv_path = csv_path or cv.PAID_SUPPORTS_CSV
+        self.verbose = verbose
+        self.instrumentation = instrumentation or BuildInstrumentation()
+        self.flow_workers = flow_workers
+        self._digest = FileDigests()
+        self._memo = {}  # stage -> (key, value)
+
+    def invalidate(self):
+        """Drop every cached stage, whatever its key"""
+        self._memo.clear()
+
+    def _stage(self, stage, key, compute):
+        """The stage's cached value when its key is unchanged, else compute() (and cache it)"""
+        cached = self._memo.get(stage)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO()):
+            value = compute()
+        self._memo[stage] = (key, value)
+        return value
+
+    # --- keys ---
+
+    def workbooks(self):
+        """Workbooks in data_dir within the year range"""
+        return sorted(
+            path for path in cv.budget_workbooks(self.data_dir)
+            if self.first_year <= cv.workbook_year(path) <= self.last_year
+        )
+
+    def budget_key(self):
+        return stage_key(
+            'budget', self.first_year, self.last_year,
+            [(os.path.basename(path), self._digest(path)) for path in self.workbooks()],
+            self._digest(cv.NAME_MAPPINGS_PATH),
+        )
+
+    def supports_key(self):
+        return stage_key('supports', self.budget_key(), self._digest(self.csv_path), self._digest(CROSSWALK_PATH))
+
+    def template_key(self, name):
+        """Key of the templates one output is rendered from: its page template, and the engine script it loads"""
+        templates = [cv.OUTPUT_TEMPLATES[name]] + ([cv.ENGINE_TEMPLATE] if name in cv.ENGINE_OUTPUTS else [])
+        return stage_key('templates', [(template, self._digest(os.path.join(cv.BASE_DIR, template))) for template in templates])
+
+    # --- load budget ---
+
+    @property
+    def budget(self):
+        """(budget_data, income_data, rigidity_data) from load_all_budget_data()"""
+        return self._stage('budget', self.budget_key(), self._load_budget)
+
+    def _load_budget(self):
+        # name_mappings.json is read on import; read it again so an edit reaches this load
+        name_mappings = cv.load_name_mappings()
+        with self.instrumentation.stage('load_all_budget_data') as stage:
+            budget = cv.load_all_budget_data(data_dir=self.data_dir, first_year=self.first_year, last_year=self.last_year,
+                                             name_mappings=name_mappings)
+            stage.output_rows = count_rows(budget[0])
+        return budget
+
+    @property
+    def budget_data(self):
+        return self.budget[0]
+
+    @property
+    def income_data(self):
+        return self.budget[1]
+
+    @property
+    def rigidity_data(self):
+        return self.budget[2]
+
+    @property
+    def summary_data(self):
+        """Program-free collapse of the budget; only the main page reads `program`"""
+        return self._stage('summary_data', self.budget_key(), lambda: cv.drop_program_detail(self.budget_data))
+
+    # --- load supports ---
+
+    @property
+    def _reconciled(self):
+        """(budget info by year extended with borrowed codes, reconciled CSV frame); ({}, None) without a CSV"""
+        return self._stage('reconciled', self.supports_key(), self._reconcile)
+
+    def _reconcile(self):
+        frame = cv.read_paid_supports_csv(self.csv_path)
+        if frame is None:
+            return {}, None
+        with self.instrumentation.stage('reconcile_codes', input_rows=len(frame)):
+            return cv.paid_supports_budget_info(self.budget_data, frame)
+
+    @property
+    def budget_info(self):
+        """{year: {code: {name, path, value}}} as the Sankey builders read it"""
+        return self._reconciled[0]
+
+    @property
+    def paid_supports_frame(self):
+        return self._reconciled[1]
+
+    @property
+    def _paid_supports_without_flows(self):
+        return self._stage('paid_supports', self.supports_key(), self._load_paid_supports)
+
+    def _load_paid_supports(self):
+        if self.paid_supports_frame is None:
+            return {}
+        with self.instrumentation.stage('load_paid_supports_data', input_rows=count_rows(self.budget_data)) as stage:
+            paid_supports_data = cv.load_paid_supports_data(
+                self.budget_data, first_year=self.first_year, last_year=self.last_year,
+                frame=self.paid_supports_frame, with_flows=False
+            )
+            stage.output_rows = sum(len(year_data['byCode']) for year_data in paid_supports_data.values())
+        return paid_supports_data
+
+    @property
+    def paid_supports_data(self):
+        """load_paid_supports_data() result, with the flows of every year"""
+        return self._stage('paid_supports_data', self.supports_key(), self._with_flows)
+
+    def _with_flows(self):
+        # Years whose flows are not cached yet are built together, in parallel
+        paid_supports_data = self._paid_supports_without_flows
+        missing = [year for year in paid_supports_data if self._memo.get(('flows', year), (None,))[0] != self._flows_key(year)]
+        if missing:
+            with self.instrumentation.stage('build_flows', input_rows=len(missing)):
+                built = cv.build_flows_by_year({year: self._flow_inputs(year) for year in missing}, self.flow_workers)
+            for year, flows in built.items():
+                self._memo[('flows', year)] = (self._flows_key(year), flow_payload(flows))
+        return {year: {**year_data, **self.flows(year)} for year, year_data in paid_supports_data.items()}
+
+    @property
+    def recipient_rows(self):
+        return self._stage('recipient_rows', self.supports_key(), lambda: cv.load_recipient_rows(
+            self.budget_data, self.paid_supports_frame, first_year=self.first_year, last_year=self.last_year
+        ))
+
+    # --- build flows ---
+
+    def _flows_key(self, year):
+        return stage_key(self.supports_key(), year)
+
+    def _flow_inputs(self, year):
+        year_data = self._paid_supports_without_flows[year]
+        return cv.flow_inputs(self.budget_info.get(year, {}), year_data['byCode'], year_data['recipientsByCode'])
+
+    def flows(self, year):
+        """{'convergentFlowData'} of one year's paid supports (KeyError for a year without any)"""
+        return self._stage(('flows', year), self._flows_key(year), lambda: self._build_flows(year))
+
+    def _build_flows(self, year):
+        inputs = self._flow_inputs(year)
+        with self.instrumentation.stage(f'build_flows_{year}', input_rows=len(inputs[1])):
+            return flow_payload(cv.build_year_flows(*inputs))
+
+    # --- render pages ---
+
+    def render(self, name):
+        """Write one page (an OUTPUTS name) to output_dir; returns its path, None when it was skipped"""
+        _, _, datasets = cv.OUTPUTS[name]
+        key = stage_key(
+            name, self.output_dir, self.template_key(name),
+            [self.supports_key() if dataset in SUPPORTS_DATASETS else self.budget_key() for dataset in datasets],
+        )
+        cached = self._memo.get(('render', name))
+        if cached is not None and cached[1] and not os.path.exists(cached[1]):
+            # The page was deleted since it was written
+            del self._memo[('render', name)]
+        return self._stage(('render', name), key, lambda: self._render(name))
+
+    def _render(self, name):
+        _, builder, datasets = cv.OUTPUTS[name]
+        for dataset in datasets:
+            getattr(self, dataset)
+        if 'paid_supports_data' in datasets and not self.paid_supports_data:
+            print("  דילוג - אין נתוני תמיכות")
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        if name in cv.ENGINE_OUTPUTS:
+            cv.write_data_engine(self.output_dir)
+        with self.instrumentation.stage(f'create_{name}') as stage:
+            return stage.record_output(builder(self))
+
+    def build(self, names=None):
+        """Render the named outputs (default: all of them); returns the written paths"""
+        paths = [self.render(name) for name in (names or cv.OUTPUTS)]
+        return [path for path in paths if path]
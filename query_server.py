@@ -0,0 +1,248 @@
+"""
+שרת שאילתות מקומי
+Serve mode: answer the pages' queries from the in-memory datasets instead of
+embedding every year and row in the pages.
+
+The BuildContext, with its datasets preloaded, is queried over a small local JSON API:
+
+    /api/years                          years and their totals
+    /api/year?year=2024                 one year of the main page's data
+    /api/recipients?year=2024&q=...     paid supports recipients by name, ח"פ, תקנה or code
+                                        (every matched row, searched like the page's index;
+                                        limit=1..MAX_RECIPIENT_LIMIT rows per answer)
+
+The main page fetches each year whole: its data engine groups, filters and flattens a
+year's rows client-side, so drill-down needs no per-path queries.
+
+Responses are cached and carry an ETag, so an unchanged slice is answered with 304.
+Requests run on threads of a ThreadingHTTPServer: the datasets are built before the
+server starts and only read, and the search postings built on first use are guarded by a lock.
+Static export (create_visualization.py without --serve) remains the default.
+"""
+
+import bisect
+import hashlib
+import json
+import threading
+import webbrowser
+from collections import OrderedDict
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from recipient_index import BUCKET_PREFIX, build_postings, tokenize
+
+API_PREFIX = '/api'
+
+# Number of serialized responses kept in the response cache
+RESPONSE_CACHE_SIZE = 512
+
+DEFAULT_RECIPIENT_LIMIT = 100
+MAX_RECIPIENT_LIMIT = 1000
+
+MAIN_PAGE = 'budget_interactive.html'
+
+
+class QueryError(Exception):
+    """Bad query parameters; answered with 400"""
+
+
+class QueryIndex:
+    """Queries over a BuildContext's preloaded datasets; a year's search postings are built on first use"""
+
+    def __init__(self, ctx, year_slice):
+        self.ctx = ctx
+        self.year_slice = year_slice
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def partition(self, year):
+        if year not in self.ctx.budget_data:
+            raise QueryError(f"אין נתונים לשנת {year}")
+        return self.ctx.budget_data[year]
+
+    def years(self):
+        store = self.ctx.budget_data
+        return [{'year': year, 'total': store.total(year)} for year in sorted(store)]
+
+    def year(self, year):
+        self.partition(year)
+        return self.year_slice(year)
+
+    def recipient_rows(self, year):
+        rows = (self.ctx.recipient_rows or {}).get(year)
+        if rows is None:
+            raise QueryError(f"אין נתוני תמיכות לשנת {year}")
+        return rows
+
+    def postings(self, year):
+        """(sorted tokens, row ids of each) of a year's rows, the index the page loads from its shards"""
+        # Request threads share the index: one builds a year's postings, the others wait for it
+        with self._lock:
+            if year not in self._postings:
+                postings = build_postings(self.recipient_rows(year))
+                tokens = sorted(postings)
+                self._postings[year] = (tokens, [postings[token] for token in tokens])
+            return self._postings[year]
+
+    def token_row_ids(self, year, token):
+        """Row ids of every row having a token that starts with token"""
+        tokens, postings = self.postings(year)
+        ids = set()
+        for i in range(bisect.bisect_left(tokens, token), len(tokens)):
+            if not tokens[i].startswith(token):
+                break
+            ids.update(postings[i])
+        return ids
+
+    def recipients(self, year, query, limit):
+        rows = self.recipient_rows(year)
+        if query.strip():
+            tokens = [token for token in tokenize(query) if len(token) >= BUCKET_PREFIX]
+            if not tokens:
+                raise QueryError(f"מונח חיפוש קצר מדי (לפחות {BUCKET_PREFIX} תווים)")
+            ids = set.intersection(*(self.token_row_ids(year, token) for token in tokens))
+            # Row ids follow the rows' order, largest payment first
+            rows = rows.iloc[sorted(ids)]
+        page = rows.iloc[:limit]
+        return {
+            'total': len(rows),
+            'recipients': [
+                {'name': name, 'code': int(code), 'hp': hp, 'takanName': takana, 'ministry': ministry,
+                 'paid': float(paid), 'requestYear': year}
+                for name, code, hp, takana, ministry, paid in zip(
+                    page['name'], page['code'], page['hp'], page['takanName'], page['ministry'], page['paid']
+                )
+            ]
+        }
+
+
+def int_param(params, name, default=None):
+    values = params.get(name)
+    if not values:
+        if default is None:
+            raise QueryError(f"חסר פרמטר {name}")
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise QueryError(f"ערך לא תקין ל-{name}: {values[0]}") from None
+
+
+def limit_param(params):
+    limit = int_param(params, 'limit', DEFAULT_RECIPIENT_LIMIT)
+    if not 1 <= limit <= MAX_RECIPIENT_LIMIT:
+        raise QueryError(f"limit חייב להיות בין 1 ל-{MAX_RECIPIENT_LIMIT}: {limit}")
+    return limit
+
+
+ROUTES = ('years', 'year', 'recipients')
+
+
+def answer(index, route, params):
+    """Result of one API route (one of ROUTES) as a JSON-serializable object"""
+    if route == 'years':
+        return index.years()
+    if route == 'year':
+        return index.year(int_param(params, 'year'))
+    return index.recipients(int_param(params, 'year'), params.get('q', [''])[0], limit_param(params))
+
+
+class ResponseCache:
+    """LRU of serialized responses keyed by request path, each with its ETag"""
+
+    def __init__(self, size=RESPONSE_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body):
+        entry = (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return entry
+
+
+def make_handler(index, cache, main_page, base_dir):
+    class QueryHandler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=base_dir, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path.startswith(API_PREFIX + '/'):
+                return self.send_api(url)
+            if url.path in ('/', '/' + MAIN_PAGE):
+                body = main_page(API_PREFIX)
+                if body is not None:
+                    return self.send_body(body.encode('utf-8'), 'text/html; charset=utf-8', etag=None)
+            return super().do_GET()
+
+        def send_api(self, url):
+            route = url.path[len(API_PREFIX) + 1:]
+            if route not in ROUTES:
+                return self.send_error(404, f"Unknown query: {route}")
+            entry = cache.get(self.path)
+            if entry is None:
+                try:
+                    result = answer(index, route, parse_qs(url.query))
+                except QueryError as e:
+                    body = json.dumps({'error': str(e)}, ensure_ascii=False).encode('utf-8')
+                    return self.send_body(body, 'application/json; charset=utf-8', etag=None, status=400)
+                entry = cache.put(self.path, json.dumps(result, ensure_ascii=False).encode('utf-8'))
+            body, etag = entry
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_body(body, 'application/json; charset=utf-8', etag=etag)
+
+        def send_body(self, body, content_type, etag, status=200):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            if etag:
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+            else:
+                self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(body)
+
+    return QueryHandler
+
+
+def serve(ctx, year_slice, main_page, base_dir, port=8765, open_browser=True):
+    """
+    Run the query server until interrupted.
+    year_slice(year): one year of the main page's data
+    main_page(api_prefix): the main page's HTML without embedded data, fetching years from the API
+    (both come from create_visualization; passed in so the running script's state is shared)
+    """
+    # ctx's datasets are loaded already (BuildContext.preload): request threads only read them
+    index = QueryIndex(ctx, year_slice)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(index, ResponseCache(), main_page, base_dir))
+    server.daemon_threads = True
+
+    url = f"http://127.0.0.1:{port}/{MAIN_PAGE}"
+    print(f"\nשרת שאילתות: {url} (Ctrl+C לסיום)")
+    if open_browser:
+        webbrowser.open(url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nשרת השאילתות נעצר")
+    finally:
+        server.server_close()
@@ -0,0 +1,259 @@
+"""
+אינדקס חיפוש וטבלאות מקבלי תמיכות
+Every matched paid supports row (not only the top rows embedded in the page), written
+as shards the paid supports page loads as the user searches, pages and sorts:
+
+Per year:
+    recipients/<year>/meta         row count, chunk size and the search shards present
+    recipients/<year>/rows_<k>     rows k*ROW_CHUNK_SIZE.. as columns, largest payment first
+    recipients/<year>/<column>_<k> { ids }: the row ids at positions k*ROW_CHUNK_SIZE.. of the
+                                   rows sorted by a table column (TABLE_ORDERS); the rows
+                                   themselves are stored once, in the rows_<k> chunks
+    recipients/<year>/code_ranges  { code: [first, count] }: the rows of each קוד תקנה, a
+                                   contiguous range of the code order (amount order within it)
+    recipients/<year>/search_<b>   sorted tokens and their delta-encoded row id postings
+
+Row ids in the postings are positions in the rows_<k> (amount) order.
+
+Across years:
+    recipients/entities_<b>        per-organization history: { key: name, per-year totals,
+                                   codes and ministries }, bucketed by entity_bucket(key)
+
+An organization is keyed by its ח"פ מגיש, or by its normalized name when it has none
+(see entity_key / entityKey in the page).
+
+Tokens are normalized Hebrew/Latin words of שם מגיש and שם תקנה plus ח"פ מגיש and
+קוד תקנה. A token lives in the search shard picked from its first two characters, so
+a query token of two or more characters needs exactly one search shard, where all the
+tokens it prefixes sit next to each other. The page must normalize and bucket the same
+way (see normalizeSearchText / searchBucket in paid_supports_template.html).
+"""
+
+import re
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from shards import clear_shards, write_shard
+
+ROW_CHUNK_SIZE = 1000
+SEARCH_SHARD_COUNT = 32
+
+# Characters of a token that select its search shard; shorter query tokens are not looked up
+BUCKET_PREFIX = 2
+
+SHARD_PREFIX = 'recipients'
+
+# Niqqud and cantillation marks (not maqaf, paseq or sof pasuq, which separate words)
+NIQQUD = re.compile('[\u0591-\u05bd\u05bf\u05c1\u05c2\u05c4\u05c5\u05c7]')
+# Quotes inside abbreviations (בע"מ, ע׳) are dropped so the abbreviation stays one token
+QUOTES = re.compile('[\'"`\u05f3\u05f4]')
+FINAL_LETTERS = str.maketrans('ךםןףץ', 'כמנפצ')
+TOKEN_SEPARATOR = re.compile('[^0-9a-z\u05d0-\u05ea]+')
+
+ENTITY_SHARD_COUNT = 16
+
+ROW_COLUMNS = ('name', 'code', 'hp', 'takanName', 'ministry', 'paid')
+
+# Sortable table columns besides the amount, each written ascending with ties kept in
+# amount order; the page reads an order from its end for descending
+TABLE_ORDERS = ('name', 'ministry', 'code')
+
+
+def normalize_text(text):
+    """Lowercase, without niqqud and quotes, final letters replaced by their regular form"""
+    return QUOTES.sub('', NIQQUD.sub('', str(text))).lower().translate(FINAL_LETTERS)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_SEPARATOR.split(normalize_text(text)) if token]
+
+
+def search_bucket(token):
+    """Search shard of a token, from its first BUCKET_PREFIX characters"""
+    bucket = 0
+    for char in token[:BUCKET_PREFIX]:
+        bucket = bucket * 31 + ord(char)
+    return bucket % SEARCH_SHARD_COUNT
+
+
+def entity_key(hp, name):
+    """Key of a recipient organization: its ח"פ, else 'name:' and its normalized name"""
+    hp = str(hp).strip()
+    if hp.endswith('.0'):
+        hp = hp[:-2]
+    return hp if hp else 'name:' + ' '.join(tokenize(name))
+
+
+def entity_bucket(key):
+    bucket = 0
+    for char in key:
+        bucket = (bucket * 31 + ord(char)) & 0xFFFFFFFF
+    return bucket % ENTITY_SHARD_COUNT
+
+
+def build_recipient_entities(rows_by_year):
+    """
+    Per-organization history over all years, in one groupby over (key, year):
+    { key: {'name', 'years': {year: [total, [codes], [ministries]]}} }
+    The name is the one used in the organization's latest year.
+    """
+    if not rows_by_year:
+        return {}
+    rows = pd.concat(
+        [year_rows.assign(year=year) for year, year_rows in rows_by_year.items()],
+        ignore_index=True
+    )
+    keys = {
+        (hp, name): entity_key(hp, name)
+        for hp, name in rows[['hp', 'name']].drop_duplicates().itertuples(index=False)
+    }
+    rows['key'] = [keys[pair] for pair in zip(rows['hp'], rows['name'])]
+
+    grouped = rows.groupby(['key', 'year'], sort=True).agg(
+        name=('name', 'first'),
+        total=('paid', 'sum'),
+        codes=('code', 'unique'),
+        ministries=('ministry', 'unique'),
+    )
+
+    entities = {}
+    for (key, year), row in zip(grouped.index, grouped.itertuples(index=False)):
+        entity = entities.setdefault(key, {'name': row.name, 'years': {}})
+        entity['name'] = row.name  # years ascend, so the latest year's name wins
+        entity['years'][int(year)] = [
+            float(row.total),
+            sorted(int(code) for code in row.codes),
+            sorted(ministry for ministry in row.ministries if ministry),
+        ]
+    return entities
+
+
+def write_entity_index(base_dir, entities):
+    """
+    Write the organization histories as ENTITY_SHARD_COUNT shards; ministries are
+    stored once per shard and referenced by position. Returns the written paths.
+    """
+    shards = defaultdict(dict)
+    for key, entity in entities.items():
+        shards[entity_bucket(key)][key] = entity
+
+    written = []
+    for bucket in range(ENTITY_SHARD_COUNT):
+        ministries = {}
+        shard_entities = {}
+        for key, entity in shards.get(bucket, {}).items():
+            shard_entities[key] = {
+                'name': entity['name'],
+                'years': {
+                    year: [total, codes, [ministries.setdefault(m, len(ministries)) for m in year_ministries]]
+                    for year, (total, codes, year_ministries) in entity['years'].items()
+                }
+            }
+        written.append(write_shard(base_dir, f"{SHARD_PREFIX}/entities_{bucket}", {
+            'ministries': list(ministries),
+            'entities': shard_entities,
+        }))
+    return written
+
+
+def build_postings(rows):
+    """{token: [row ids]} over a year's rows; ids ascend, so postings keep the amount order"""
+    name_ids, names = pd.factorize(rows['name'])
+    takana_ids, takanot = pd.factorize(rows['takanName'])
+    name_tokens = [set(tokenize(name)) for name in names]
+    takana_tokens = [set(tokenize(takana)) for takana in takanot]
+
+    postings = defaultdict(list)
+    for row_id, (name_id, takana_id, hp, code) in enumerate(
+        zip(name_ids, takana_ids, rows['hp'].to_numpy(), rows['code'].to_numpy())
+    ):
+        tokens = set(tokenize(hp))
+        tokens.add(str(code))
+        if name_id >= 0:
+            tokens |= name_tokens[name_id]
+        if takana_id >= 0:
+            tokens |= takana_tokens[takana_id]
+        for token in tokens:
+            if len(token) >= BUCKET_PREFIX:
+                postings[token].append(row_id)
+    return postings
+
+
+def delta_encode(ids):
+    previous = 0
+    encoded = []
+    for row_id in ids:
+        encoded.append(row_id - previous)
+        previous = row_id
+    return encoded
+
+
+def write_row_chunks(base_dir, prefix, rows):
+    """Write rows as <prefix>_<k> shards of ROW_CHUNK_SIZE rows; returns the written paths"""
+    written = []
+    for chunk, start in enumerate(range(0, len(rows), ROW_CHUNK_SIZE)):
+        part = rows.iloc[start:start + ROW_CHUNK_SIZE]
+        written.append(write_shard(base_dir, f"{prefix}_{chunk}", {
+            column: part[column].tolist() for column in ROW_COLUMNS
+        }))
+    return written
+
+
+def write_order_chunks(base_dir, prefix, row_ids):
+    """Write a sort order's row ids as <prefix>_<k> shards of ROW_CHUNK_SIZE ids; returns the written paths"""
+    return [
+        write_shard(base_dir, f"{prefix}_{chunk}", {'ids': row_ids[start:start + ROW_CHUNK_SIZE].tolist()})
+        for chunk, start in enumerate(range(0, len(row_ids), ROW_CHUNK_SIZE))
+    ]
+
+
+def table_order(rows, column):
+    """Row ids of the rows sorted ascending by a column, ties kept in amount (row id) order"""
+    return np.argsort(rows[column].to_numpy(), kind='stable')
+
+
+def code_ranges(rows):
+    """{ code: [first, count] } of each code's rows in the rows sorted by code"""
+    codes, counts = np.unique(rows['code'].to_numpy(), return_counts=True)
+    starts = np.cumsum(counts) - counts
+    return {str(code): [int(start), int(count)] for code, start, count in zip(codes, starts, counts)}
+
+
+def write_recipient_index(base_dir, rows_by_year):
+    """
+    Write the row chunks, table orders and search index for {year: rows DataFrame}
+    (see load_recipient_rows), and the cross-year organization index.
+    Returns the written paths.
+    """
+    clear_shards(base_dir, SHARD_PREFIX)
+    written = []
+    for year, rows in sorted(rows_by_year.items()):
+        prefix = f"{SHARD_PREFIX}/{year}"
+        buckets = defaultdict(dict)
+        for token, ids in build_postings(rows).items():
+            buckets[search_bucket(token)][token] = ids
+
+        written.append(write_shard(base_dir, f"{prefix}/meta", {
+            'rows': len(rows),
+            'chunkSize': ROW_CHUNK_SIZE,
+            'shardCount': SEARCH_SHARD_COUNT,
+            'buckets': sorted(buckets),
+            'orders': list(TABLE_ORDERS),
+        }))
+
+        written += write_row_chunks(base_dir, f"{prefix}/rows", rows)
+        for column in TABLE_ORDERS:
+            written += write_order_chunks(base_dir, f"{prefix}/{column}", table_order(rows, column))
+        written.append(write_shard(base_dir, f"{prefix}/code_ranges", code_ranges(rows)))
+
+        for bucket, postings in buckets.items():
+            tokens = sorted(postings)
+            written.append(write_shard(base_dir, f"{prefix}/search_{bucket}", {
+                'tokens': tokens,
+                'postings': [delta_encode(postings[token]) for token in tokens],
+            }))
+
+    written += write_entity_index(base_dir, build_recipient_entities(rows_by_year))
+    return written
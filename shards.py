@@ -0,0 +1,35 @@
+"""
+קבצי נתונים חיצוניים (shards)
+Data the pages load on demand instead of embedding it.
+
+A shard is a small script next to the pages, under data/, that hands its payload to
+registerShard(name, payload). Script shards load from file:// as well as from a web
+server, so the exported pages keep working when opened from disk. Pages load a shard
+with loadShard(name), which adds the script tag once and resolves with the payload;
+both come from the data engine script (data_engine_template.js).
+"""
+
+import json
+import os
+import shutil
+
+SHARD_DIR = 'data'
+
+
+def shard_path(base_dir, name):
+    return os.path.join(base_dir, SHARD_DIR, *name.split('/')) + '.js'
+
+
+def write_shard(base_dir, name, payload):
+    """Write one shard; name is a '/'-separated key such as 'recipients/2024/rows_0'. Returns the path"""
+    path = shard_path(base_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"registerShard({json.dumps(name)},{body});\n")
+    return path
+
+
+def clear_shards(base_dir, prefix):
+    """Remove the shards under a key prefix left by a previous build"""
+    shutil.rmtree(os.path.join(base_dir, SHARD_DIR, *prefix.split('/')), ignore_errors=True)
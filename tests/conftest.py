@@ -0,0 +1,6 @@
+"""The build modules live at the repository root, next to create_visualization.py"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from budget_store import NO_CODE, BudgetStore, collapse_frame
+
+PATHS = [
+    ('חינוך', 'משרד החינוך', 'שכר'),
+    ('חינוך', 'משרד החינוך', 'שכר'),
+    ('בריאות', 'קופות', 'העברות'),
+    ('חינוך', 'משרד החינוך', 'שכר'),
+    ('חינוך', 'מעונות', ''),
+]
+
+
+def make_store(aggregate=False, paths=PATHS, year=2024):
+    store = BudgetStore()
+    store.add_year(
+        year, paths,
+        value=[1.0, 2.0, 4.0, 8.0, 16.0],
+        code=[101, 101, 202, 101, NO_CODE],
+        is_salary=[True, True, False, True, False],
+        program=['א', 'ב', 'א', 'א', 'א'],
+        classification=['ש', 'ש', 'ה', 'ש', 'ה'],
+        commitment=[0.5, 0.0, -1.0, 0.25, 0.0],
+        aggregate=aggregate,
+    )
+    return store
+
+
+def naive_projection(partition, fields, depth):
+    """project() the slow way, through the record views"""
+    merged = {}
+    key_fields = [field for field in fields if field != 'value']
+    for record in partition:
+        key = tuple(tuple(record['path'][:depth]) if field == 'path' else record[field] for field in key_fields)
+        entry = merged.setdefault(key, {
+            **{field: (list(value) if field == 'path' else value) for field, value in zip(key_fields, key)},
+            'value': 0.0,
+        })
+        entry['value'] += record['value']
+    return list(merged.values())
+
+
+def test_collapse_frame_sums_duplicate_keys_in_first_seen_order():
+    frame = make_store()[2024].frame
+    collapsed = collapse_frame(frame)
+    assert list(collapsed.columns) == list(frame.columns)
+    # Rows 0 and 3 share path, code, salary, classification and program
+    assert collapsed['value'].tolist() == [9.0, 2.0, 4.0, 16.0]
+    assert collapsed['commitment'].tolist() == [0.75, 0.0, -1.0, 0.0]
+    assert collapsed['program'].tolist() == ['א', 'ב', 'א', 'א']
+
+
+def test_collapse_frame_without_program_merges_programs():
+    collapsed = collapse_frame(make_store()[2024].frame, keep_program=False)
+    assert collapsed['value'].tolist() == [11.0, 4.0, 16.0]
+    assert collapsed['program'].tolist() == ['', '', '']
+
+
+def test_key_count_matches_collapsed_length():
+    partition = make_store()[2024]
+    for keep_program in (True, False):
+        assert partition.key_count(keep_program) == len(collapse_frame(partition.frame, keep_program))
+
+
+def test_add_year_aggregate_stores_collapsed_records():
+    partition = make_store(aggregate=True)[2024]
+    assert len(partition) == 4
+    assert partition.total() == 31.0
+    record = partition[-1]
+    assert record['code'] is None
+    assert record['name'] == 'מעונות'
+    assert dict(partition[0])['value'] == 9.0
+
+
+def test_record_view_reads_the_columns():
+    partition = make_store()[2024]
+    record = partition[2]
+    assert record['path'] == PATHS[2]
+    assert record['name'] == 'העברות'
+    assert record['miunRama1'] == 'העברות'
+    assert record['isSalary'] is False
+    assert record.get('unknown', 'default') == 'default'
+    assert [r['value'] for r in partition[1:3]] == [2.0, 4.0]
+
+
+def test_code_and_ministry_indexes():
+    partition = make_store()[2024]
+    assert partition.rows_for_code(101).tolist() == [0, 1, 3]
+    assert partition.rows_for_code(999).tolist() == []
+    assert partition.rows_for_ministry('חינוך').tolist() == [0, 1, 3, 4]
+    assert partition.rows_for_ministry('אין כזה').tolist() == []
+
+
+def test_project_merges_records_identical_after_truncation():
+    projected = make_store()[2024].project(('path', 'value', 'isSalary'), depth=1)
+    assert projected == [
+        {'path': ['חינוך'], 'isSalary': True, 'value': 11.0},
+        {'path': ['בריאות'], 'isSalary': False, 'value': 4.0},
+        {'path': ['חינוך'], 'isSalary': False, 'value': 16.0},
+    ]
+
+
+def test_project_matches_the_record_views():
+    partition = make_store()[2024]
+    for fields, depth in (
+        (('path', 'value'), 2),
+        (('path', 'value', 'code', 'name'), 6),
+        (('path', 'value', 'isSalary', 'program', 'classification'), None),
+        (('value',), None),
+    ):
+        assert partition.project(fields, depth) == naive_projection(partition, fields, depth)
+
+
+def test_project_sums_in_row_order():
+    # Float addition is not associative: the sums must match adding the records one by one
+    values = [0.1, 0.2, 0.3, 1e16, -1e16, 0.7]
+    store = BudgetStore()
+    store.add_year(2024, [('א', 'ב')] * len(values), values, [1] * len(values), [False] * len(values),
+                   [''] * len(values), [''] * len(values), [0.0] * len(values))
+    expected = 0.0
+    for value in values:
+        expected += value
+    assert store[2024].project(('path', 'value'))[0]['value'] == expected
+
+
+def test_project_of_an_empty_year():
+    store = BudgetStore()
+    store.add_year(2024, [], [], [], [], [], [], [])
+    assert store[2024].project(('path', 'value'), depth=2) == []
+
+
+def test_path_tables_follow_paths_added_later():
+    store = make_store()
+    assert store.level_labels(np.array([0, 1]), 0).tolist() == ['חינוך', 'בריאות']
+    store.add_year(2025, [('ביטחון', 'צבא', 'שכר')] + PATHS[1:], [1.0] * 5, [1] * 5, [False] * 5,
+                   [''] * 5, [''] * 5, [0.0] * 5)
+    assert store.level_labels(np.arange(len(store.paths)), 0).tolist() == ['חינוך', 'בריאות', 'חינוך', 'ביטחון']
+    assert store[2025].project(('path', 'value'), depth=1)[0] == {'path': ['ביטחון'], 'value': 1.0}
+
+
+def test_without_program_shares_the_path_table():
+    store = make_store()
+    collapsed = store.without_program()
+    assert collapsed.paths is store.paths
+    assert len(collapsed[2024]) == 3
+    assert pd.isna(collapsed[2024].frame['program']).sum() == 0
+    assert collapsed[2024].project(('path', 'value'), depth=1) == [
+        {'path': ['חינוך'], 'value': 27.0},
+        {'path': ['בריאות'], 'value': 4.0},
+    ]
@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from code_reconciliation import CodeIndex, extend_budget_info, load_code_crosswalk, reconcile_codes
+
+
+def info(name, takana=''):
+    return {'name': name, 'path': ['משרד', 'תחום', 'סעיף', 'תחום פעילות', takana], 'value': 10.0}
+
+
+BUDGET_INFO = {
+    2022: {20010101: info('אור', 'תמיכה באור'), 20010505: info('ישן')},
+    2023: {20010101: info('אור', 'תמיכה באור'), 20010202: info('מלגות', 'מלגות  לסטודנטים')},
+    2024: {20010303: info('מלגות', 'מלגות לסטודנטים'), 20010404: info('חדש')},
+}
+
+
+def payments(rows):
+    return pd.DataFrame(rows, columns=['קוד_תקנה', 'שנת הבקשה', 'שם_תקנה'])
+
+
+def methods(result):
+    return [None if pd.isna(method) else method for method in result['שיוך']]
+
+
+def test_code_index_contains_and_nearest_year():
+    index = CodeIndex({2020: [1, 2], 2022: [1], 2025: [2]})
+    assert index.contains(np.array([1, 1, 2, 3]), np.array([2020, 2021, 2025, 2020])).tolist() == [
+        True, False, True, False]
+    source, is_prior = index.nearest_year(np.array([1, 2, 2, 3]), np.array([2021, 2021, 2024, 2021]))
+    # 2021 is one year from both 2020 and 2022: ties prefer the earlier year
+    assert source.tolist() == [2020, 2020, 2025, 0]
+    assert is_prior.tolist()[:3] == [True, True, False]
+
+
+def test_code_index_of_no_codes():
+    source, is_prior = CodeIndex({}).nearest_year(np.array([1]), np.array([2024]))
+    assert source.tolist() == [0] and is_prior.tolist() == [False]
+
+
+def test_reconcile_codes_methods_in_order():
+    df = payments([
+        (20010101, 2023, 'תמיכה באור'),        # exact
+        (20019999, 2024, ''),                   # crosswalk to 20010404
+        (20010202, 2024, 'מלגות   לסטודנטים'),  # renamed to 20010303 (same סעיף and name)
+        (20010505, 2024, ''),                   # only in 2022: prior
+        (20010303, 2023, 'אחר'),                # only in 2024: next
+        (77777777, 2024, ''),                   # nowhere
+        (None, 2024, ''),                       # no code
+        (20010101, 2019, ''),                   # a year with no budget
+    ])
+    result = reconcile_codes(df, BUDGET_INFO, crosswalk={20019999: 20010404})
+    assert methods(result) == ['exact', 'crosswalk', 'renamed', 'prior', 'next', None, None, None]
+    assert result['קוד_מותאם'].tolist()[:5] == [20010101, 20010404, 20010303, 20010505, 20010303]
+    assert result['קוד_מותאם'].isna().tolist()[5:] == [True, True, True]
+    assert result['שנת_מקור'].tolist()[:5] == [2023, 2024, 2024, 2022, 2024]
+    # The input frame is left unchanged
+    assert 'שיוך' not in df.columns
+
+
+def test_reconcile_codes_skips_ambiguous_renames():
+    budget_info = {2024: {20010303: info('א', 'מלגות'), 20010404: info('ב', 'מלגות')}}
+    result = reconcile_codes(payments([(20010202, 2024, 'מלגות')]), budget_info)
+    assert methods(result) == [None]
+
+
+def test_reconcile_codes_crosswalk_needs_a_code_of_the_year():
+    result = reconcile_codes(payments([(20019999, 2023, '')]), BUDGET_INFO, crosswalk={20019999: 20010404})
+    # 20010404 exists only in 2024, and 20019999 in no year
+    assert methods(result) == [None]
+
+
+def test_extend_budget_info_borrows_codes_from_other_years():
+    df = payments([(20010505, 2024, ''), (20010505, 2024, ''), (20010101, 2023, '')])
+    result = reconcile_codes(df, BUDGET_INFO)
+    extended = extend_budget_info({year: dict(codes) for year, codes in BUDGET_INFO.items()}, result)
+    assert extended[2024][20010505] == {'name': 'ישן', 'path': BUDGET_INFO[2022][20010505]['path'],
+                                        'value': 0.0, 'borrowed': True}
+    assert extended[2023] == BUDGET_INFO[2023]
+
+
+def test_load_code_crosswalk(tmp_path):
+    path = tmp_path / 'code_crosswalk.json'
+    assert load_code_crosswalk(str(path)) == {}
+    path.write_text(json.dumps({'20019999': 20010404}), encoding='utf-8')
+    assert load_code_crosswalk(str(path)) == {20019999: 20010404}
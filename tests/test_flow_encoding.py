@@ -0,0 +1,94 @@
+import math
+
+import pytest
+
+from flow_encoding import (
+    MISSING, decode_flow_graph, encode_flow_graph, encode_paid_supports_flows, pack_array, unpack_array,
+)
+
+
+def flow_graph():
+    return {
+        'nodes': [
+            {'id': 'root', 'name': 'תקציב המדינה', 'level': 0, 'side': 'left', 'budget': 1234.5678, 'paid': 99.25,
+             'x': 0.25, 'y': 0.5},
+            {'id': 'code', 'name': 'תקנה 1', 'level': 1, 'code': 20010101, 'budget': 1e12 + 0.1, 'paid': 0.0,
+             'gap': -3.5, 'gap_type': 'underpaid'},
+            {'id': 'org', 'name': 'תקציב המדינה', 'level': 2, 'side': 'right', 'budget': 0.0, 'paid': 12.0},
+        ],
+        'links': [
+            {'source': 'root', 'target': 'code', 'value': 10.0, 'budget': 10.0, 'paid': 5.0, 'side': 'left'},
+            {'source': 'code', 'target': 'org', 'value': 5.0, 'budget': 0.0, 'paid': 5.0, 'gap_type': 'underpaid'},
+        ],
+    }
+
+
+def without_ids(graph):
+    """The graph with links referring to nodes by position, as decode_flow_graph returns it"""
+    index = {node['id']: i for i, node in enumerate(graph['nodes'])}
+    nodes = [{**node, 'id': index[node['id']]} for node in graph['nodes']]
+    links = [{**link, 'source': index[link['source']], 'target': index[link['target']]} for link in graph['links']]
+    return {'nodes': nodes, 'links': links}
+
+
+def test_round_trip_keeps_every_field():
+    decoded = decode_flow_graph(encode_flow_graph(flow_graph()))
+    expected = without_ids(flow_graph())
+    # Layout coordinates are float32; amounts and everything else come back exactly
+    for node in expected['nodes']:
+        for field in ('x', 'y'):
+            if field in node:
+                node[field] = pytest.approx(node[field])
+    assert decoded == expected
+
+
+def test_strings_are_stored_once():
+    packed = encode_flow_graph(flow_graph())
+    assert packed['strings'].count('תקציב המדינה') == 1
+    assert packed['nodeCount'] == 3 and packed['linkCount'] == 2
+
+
+def test_fields_missing_everywhere_have_no_column():
+    graph = flow_graph()
+    for node in graph['nodes']:
+        node.pop('gap', None)
+    assert 'gap' not in encode_flow_graph(graph)['nodes']
+
+
+def test_missing_values_are_marked():
+    packed = encode_flow_graph(flow_graph())
+    assert list(unpack_array(packed['nodes']['code'])) == [MISSING, 20010101, MISSING]
+    gaps = list(unpack_array(packed['nodes']['gap']))
+    assert math.isnan(gaps[0]) and gaps[1] == -3.5
+
+
+def test_unknown_fields_are_rejected():
+    graph = flow_graph()
+    graph['nodes'][0]['color'] = 'red'
+    with pytest.raises(ValueError, match='color'):
+        encode_flow_graph(graph)
+
+
+def test_empty_graph():
+    packed = encode_flow_graph({'nodes': [], 'links': []})
+    assert packed == {'strings': [], 'nodeCount': 0, 'linkCount': 0, 'nodes': {}, 'links': {}}
+    assert decode_flow_graph(packed) == {'nodes': [], 'links': []}
+
+
+def test_pack_array_round_trip_and_bad_data():
+    column = {'type': 'float64', 'data': pack_array('d', [1.5, -2.0])}
+    assert list(unpack_array(column)) == [1.5, -2.0]
+    with pytest.raises(ValueError):
+        # Three bytes: not a whole uint32
+        unpack_array({'type': 'uint32', 'data': 'AAAA'})
+    with pytest.raises(ValueError):
+        unpack_array({'type': 'uint32', 'data': 'not base64!'})
+
+
+def test_encode_paid_supports_flows_packs_each_year():
+    data = {2024: {'totalPaid': 1.0, 'convergentFlowData': flow_graph()}}
+    encoded = encode_paid_supports_flows(data)
+    assert encoded[2024]['totalPaid'] == 1.0
+    assert encoded[2024]['convergentFlowData'] == encode_flow_graph(flow_graph())
+    # The input is not modified
+    assert data[2024]['convergentFlowData'] == flow_graph()
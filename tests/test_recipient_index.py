@@ -0,0 +1,128 @@
+import json
+
+import pandas as pd
+
+from recipient_index import (
+    BUCKET_PREFIX, ROW_CHUNK_SIZE, SEARCH_SHARD_COUNT, TABLE_ORDERS, build_postings, code_ranges, delta_encode,
+    entity_key, normalize_text, search_bucket, table_order, tokenize, write_recipient_index,
+)
+from shards import shard_path
+
+
+def recipient_rows():
+    """A year's rows as load_recipient_rows() returns them, largest payment first"""
+    return pd.DataFrame({
+        'name': ['עמותת אור לציון בע"מ', 'Beit Or', 'קרן השלום', 'עמותת אור'],
+        'code': [20010101, 20010101, 30020202, 30020202],
+        'hp': ['580000001', '', '580000003', '580000001'],
+        'takanName': ['תמיכה בחינוך', 'תמיכה בחינוך', 'מענקים', 'מענקים'],
+        'ministry': ['חינוך', 'חינוך', 'רווחה', 'רווחה'],
+        'paid': [500.0, 400.0, 300.0, 200.0],
+    })
+
+
+def test_normalize_text_drops_niqqud_quotes_and_final_letters():
+    assert normalize_text('שָׁלוֹם') == 'שלומ'
+    assert normalize_text('בע"מ') == 'בעמ'
+    assert normalize_text("ע׳ ABC") == 'ע abc'
+
+
+def test_tokenize_splits_on_anything_but_letters_and_digits():
+    assert tokenize('עמותת "אור לציון" - בע"מ (2024)') == ['עמותת', 'אור', 'לציונ', 'בעמ', '2024']
+    assert tokenize('') == []
+
+
+def test_search_bucket_depends_only_on_the_prefix():
+    assert search_bucket('אורות') == search_bucket('אור') == search_bucket('או')
+    assert all(0 <= search_bucket(token) < SEARCH_SHARD_COUNT for token in ('אב', 'zz', '99'))
+
+
+def test_build_postings_covers_name_takana_hp_and_code():
+    postings = build_postings(recipient_rows())
+    assert postings['עמותת'] == [0, 3]
+    assert postings['אור'] == [0, 3]
+    assert postings['תמיכה'] == [0, 1]
+    assert postings['580000001'] == [0, 3]
+    assert postings['30020202'] == [2, 3]
+    assert postings['beit'] == postings['or'] == [1]
+
+
+def test_build_postings_skips_tokens_too_short_to_bucket():
+    rows = recipient_rows().assign(name=['א ב', 'ג', 'ד', 'ה'])
+    assert all(len(token) >= BUCKET_PREFIX for token in build_postings(rows))
+
+
+def test_build_postings_ids_ascend_once_per_row():
+    # A token in both the name and the תקנה name is posted once for the row
+    rows = recipient_rows().assign(takanName=['אור', 'אור', '', ''])
+    for ids in build_postings(rows).values():
+        assert ids == sorted(set(ids))
+
+
+def test_delta_encode_round_trip():
+    ids = [0, 3, 4, 10, 1000]
+    encoded = delta_encode(ids)
+    assert encoded == [0, 3, 1, 6, 990]
+    decoded, total = [], 0
+    for delta in encoded:
+        total += delta
+        decoded.append(total)
+    assert decoded == ids
+    assert delta_encode([]) == []
+
+
+def test_entity_key_prefers_the_hp():
+    assert entity_key('580000001.0', 'עמותה') == '580000001'
+    assert entity_key(' ', 'עמותת "אור"') == 'name:עמותת אור'
+
+
+def read_shard(base_dir, name):
+    with open(shard_path(base_dir, name), encoding='utf-8') as f:
+        text = f.read()
+    return json.loads(text[text.index(',') + 1:text.rindex(')')])
+
+
+def test_table_order_is_stable_within_equal_values():
+    rows = recipient_rows()
+    assert table_order(rows, 'ministry').tolist() == [0, 1, 2, 3]
+    assert table_order(rows, 'code').tolist() == [0, 1, 2, 3]
+    assert table_order(rows, 'name').tolist() == [1, 3, 0, 2]
+
+
+def test_code_ranges_index_the_code_order():
+    rows = recipient_rows().assign(code=[30020202, 20010101, 30020202, 10000001])
+    ranges = code_ranges(rows)
+    assert ranges == {'10000001': [0, 1], '20010101': [1, 1], '30020202': [2, 2]}
+    order = table_order(rows, 'code')
+    for code, (first, count) in ranges.items():
+        assert {int(rows['code'][row]) for row in order[first:first + count]} == {int(code)}
+
+
+def test_written_orders_point_into_the_row_chunks(tmp_path):
+    # Enough rows for several chunks, with names out of amount order
+    count = 2 * ROW_CHUNK_SIZE + 7
+    rows = pd.DataFrame({
+        'name': [f'עמותה {(i * 7919) % count}' for i in range(count)],
+        'code': [10000000 + i % 13 for i in range(count)],
+        'hp': [str(580000000 + i) for i in range(count)],
+        'takanName': ['תקנה'] * count,
+        'ministry': [f'משרד {i % 5}' for i in range(count)],
+        'paid': [float(count - i) for i in range(count)],
+    })
+    write_recipient_index(str(tmp_path), {2024: rows})
+
+    meta = read_shard(tmp_path, 'recipients/2024/meta')
+    assert meta['rows'] == count and meta['orders'] == list(TABLE_ORDERS)
+    chunks = range(0, -(-count // meta['chunkSize']))
+    stored = [name for k in chunks for name in read_shard(tmp_path, f'recipients/2024/rows_{k}')['name']]
+    assert stored == rows['name'].tolist()
+
+    for column in TABLE_ORDERS:
+        ids = [i for k in chunks for i in read_shard(tmp_path, f'recipients/2024/{column}_{k}')['ids']]
+        assert sorted(ids) == list(range(count))
+        keys = [(rows[column][i], i) for i in ids]
+        assert keys == sorted(keys)
+
+    code_ids = [i for k in chunks for i in read_shard(tmp_path, f'recipients/2024/code_{k}')['ids']]
+    for code, (first, length) in read_shard(tmp_path, 'recipients/2024/code_ranges').items():
+        assert {int(rows['code'][i]) for i in code_ids[first:first + length]} == {int(code)}
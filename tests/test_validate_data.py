@@ -0,0 +1,115 @@
+import json
+import math
+
+import pytest
+
+from flow_encoding import encode_flow_graph
+from validate_data import (
+    RIGIDITY_NODE, SCHEMAS, Boolean, Integer, ListOf, MapOf, Nullable, Number, PackedFlowGraph, PageMismatch,
+    Record, String, budget_record, locate_payloads,
+)
+
+
+def errors(schema, value):
+    return list(schema.check(value, 'data'))
+
+
+def test_scalar_schemas():
+    assert errors(Number(), 1) == errors(Number(), 1.5) == []
+    assert errors(Number(), True) == [('data', 'expected a number, got bool')]
+    assert errors(Number(), math.inf) == [('data', 'non-finite number inf')]
+    assert errors(Integer(), 1.0) == [('data', 'expected an integer, got float')]
+    assert errors(String(), None) == [('data', 'expected a string, got NoneType')]
+    assert errors(Boolean(), 0) == [('data', 'expected a boolean, got int')]
+    assert errors(Nullable(Integer()), None) == []
+
+
+def test_list_and_map_schemas():
+    assert errors(ListOf(Integer(), max_length=2), [1, 2, 'x']) == [
+        ('data', '3 entries, at most 2 expected'),
+        ('data[2]', 'expected an integer, got str'),
+    ]
+    assert errors(MapOf(Integer(), key_pattern=r'\d{4}'), {'2024': 1, 'year': 2}) == [
+        ('data', "unexpected key 'year'"),
+    ]
+    assert errors(MapOf(Integer()), []) == [('data', 'expected an object, got list')]
+
+
+def test_record_schema_reports_missing_and_unknown_fields():
+    schema = Record({'a': Integer()}, {'b': String()})
+    assert errors(schema, {'a': 1, 'b': 'x'}) == []
+    assert errors(schema, {'b': 2, 'c': 3}) == [
+        ('data', "missing field 'a'"),
+        ('data.b', 'expected a string, got int'),
+        ('data', "unexpected field 'c'"),
+    ]
+
+
+def test_budget_record_path_depth():
+    schema = budget_record(depth=2)
+    assert errors(schema, {'path': ['א', 'ב'], 'value': 1.0, 'code': None}) == []
+    assert errors(schema, {'path': ['א', 'ב', 'ג'], 'value': 1.0}) == [('data.path', '3 entries, at most 2 expected')]
+
+
+def test_rigidity_node_is_checked_recursively():
+    node = {'value': 1.0, 'commitments': -1.0, 'absCommitments': 1.0, 'children': {
+        'א': {'value': 1.0, 'commitments': -1.0, 'absCommitments': 1.0, 'children': {'ב': {'value': 1.0}}},
+    }}
+    assert errors(RIGIDITY_NODE, node) == [
+        ('data.children.א.children.ב', "missing field 'commitments'"),
+        ('data.children.א.children.ב', "missing field 'absCommitments'"),
+    ]
+
+
+def flow_graph():
+    return {
+        'nodes': [
+            {'id': 'root', 'name': 'תקציב', 'level': 0, 'budget': 10.0, 'paid': 5.0, 'side': 'left'},
+            {'id': 'code', 'name': 'תקנה', 'level': 1, 'budget': 10.0, 'paid': 5.0, 'code': 20010101},
+        ],
+        'links': [{'source': 'root', 'target': 'code', 'budget': 10.0, 'paid': 5.0, 'value': 5.0}],
+    }
+
+
+def test_packed_flow_graph_accepts_an_encoded_graph():
+    assert errors(PackedFlowGraph(), encode_flow_graph(flow_graph())) == []
+
+
+def test_packed_flow_graph_rejects_broken_columns():
+    packed = encode_flow_graph(flow_graph())
+    packed['nodeCount'] = 3
+    del packed['links']['paid']
+    packed['nodes']['name']['type'] = 'float64'
+    found = errors(PackedFlowGraph(), packed)
+    assert ('data.links', "missing column 'paid'") in found
+    assert ('data.nodes.name', "type 'float64', expected 'string'") in found
+    assert ('data.nodes.budget', '2 entries, expected 3') in found
+
+    packed = encode_flow_graph(flow_graph())
+    packed['strings'] = packed['strings'][:1]
+    assert ('data.nodes.name', '1 references past the end (of 1)') in errors(PackedFlowGraph(), packed)
+
+
+def test_paid_supports_schema_declares_every_page_field():
+    from create_visualization import PAID_SUPPORTS_PAGE_FIELDS
+    schema = SCHEMAS['paid_supports'].values
+    assert set(PAID_SUPPORTS_PAGE_FIELDS) == set(schema.required) | set(schema.optional)
+
+
+TEMPLATE = 'const A = __A_PLACEHOLDER__;\nconst B = __B_PLACEHOLDER__;\n'
+
+
+def test_locate_payloads_parses_each_payload_in_place():
+    a = {'2024': [{'path': ['};', 'x'], 'value': 1}]}
+    page = TEMPLATE.replace('__A_PLACEHOLDER__', json.dumps(a, ensure_ascii=False)).replace('__B_PLACEHOLDER__', '{}')
+    assert list(locate_payloads(page, TEMPLATE)) == [('__A_PLACEHOLDER__', a), ('__B_PLACEHOLDER__', {})]
+
+
+def test_locate_payloads_rejects_a_page_that_differs_from_its_template():
+    page = TEMPLATE.replace('__A_PLACEHOLDER__', '{}').replace('__B_PLACEHOLDER__', '{}')
+    with pytest.raises(PageMismatch, match='before __B_PLACEHOLDER__'):
+        list(locate_payloads(page.replace('const B', 'let B'), TEMPLATE))
+    with pytest.raises(PageMismatch, match='line 3'):
+        list(locate_payloads(page + '// edited\n', TEMPLATE))
+    with pytest.raises(json.JSONDecodeError):
+        list(locate_payloads(page.replace('{};\nconst B', '{;\nconst B'), TEMPLATE))
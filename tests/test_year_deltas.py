@@ -0,0 +1,95 @@
+import math
+
+import pandas as pd
+
+from budget_store import BudgetStore
+from year_deltas import TOP_MOVERS, build_year_deltas, diff_totals, movers, normalize_label
+
+
+def describe(key):
+    return {'key': key}
+
+
+def test_normalize_label_collapses_whitespace():
+    assert normalize_label('  משרד   החינוך ') == 'משרד החינוך'
+    assert normalize_label(2024) == '2024'
+
+
+def test_diff_totals_matches_new_and_disappeared_nodes():
+    joined = diff_totals(pd.Series({'a': 100.0, 'b': 50.0, 'gone': 10.0, 'zero': 0.0}),
+                         pd.Series({'a': 150.0, 'b': 25.0, 'new': 5.0, 'zero': 3.0}))
+    assert joined.loc['a', 'change'] == 50.0 and joined.loc['a', 'relative'] == 0.5
+    assert joined.loc['b', 'change'] == -25.0 and joined.loc['b', 'relative'] == -0.5
+    assert joined.loc['new', 'change'] == 5.0 and math.isnan(joined.loc['new', 'from'])
+    assert math.isnan(joined.loc['new', 'relative'])
+    assert joined.loc['gone', 'change'] == -10.0 and math.isnan(joined.loc['gone', 'to'])
+    # No relative change from a zero base
+    assert math.isnan(joined.loc['zero', 'relative'])
+
+
+def test_diff_totals_relative_change_from_a_negative_base():
+    joined = diff_totals(pd.Series({'a': -100.0}), pd.Series({'a': -50.0}))
+    assert joined.loc['a', 'relative'] == 0.5
+
+
+def test_movers_splits_and_sorts_the_lists():
+    joined = diff_totals(pd.Series({'a': 100.0, 'b': 50.0, 'c': 10.0, 'same': 1.0, 'gone': -20.0}),
+                         pd.Series({'a': 180.0, 'b': 20.0, 'c': 30.0, 'same': 1.0, 'new': 7.0}))
+    result = movers(joined, describe)
+    assert [entry['key'] for entry in result['increases']] == ['a', 'c']
+    assert [entry['key'] for entry in result['decreases']] == ['b']
+    assert result['new'] == [{'key': 'new', 'from': None, 'to': 7.0, 'change': 7.0, 'relative': None}]
+    assert result['disappeared'][0]['key'] == 'gone' and result['disappeared'][0]['to'] is None
+    assert result['counts'] == {'matched': 4, 'new': 1, 'disappeared': 1}
+    assert result['totalChange'] == 80.0 - 30.0 + 20.0 + 7.0 + 20.0
+
+
+def test_movers_keeps_the_top_entries_only():
+    previous = pd.Series({f'n{i}': 100.0 for i in range(TOP_MOVERS + 10)})
+    current = pd.Series({f'n{i}': 100.0 + i for i in range(TOP_MOVERS + 10)})
+    increases = movers(diff_totals(previous, current), describe)['increases']
+    assert len(increases) == TOP_MOVERS
+    assert increases[0]['key'] == f'n{TOP_MOVERS + 9}'
+
+
+def test_movers_of_empty_totals():
+    result = movers(diff_totals(pd.Series(dtype=float), pd.Series(dtype=float)), describe)
+    assert result['increases'] == result['new'] == [] and result['totalChange'] == 0.0
+
+
+def add_year(store, year, rows):
+    paths, values, codes = zip(*rows)
+    count = len(rows)
+    store.add_year(year, paths, values, codes, [False] * count, [''] * count, [''] * count, [0.0] * count)
+
+
+def test_build_year_deltas_per_level_and_code():
+    store = BudgetStore()
+    add_year(store, 2023, [
+        (('חינוך', 'שכר'), 100.0, 101),
+        (('בריאות', 'קופות'), 50.0, 202),
+    ])
+    add_year(store, 2024, [
+        # Spacing changed between the years: still the same node
+        (('חינוך', ' שכר '), 130.0, 101),
+        (('רווחה', 'קצבאות'), 20.0, 303),
+    ])
+    deltas = build_year_deltas(store)
+    assert list(deltas) == [(2023, 2024)]
+    top, second = deltas[(2023, 2024)]['levels'][:2]
+    assert top['increases'][0]['path'] == ['חינוך'] and top['increases'][0]['change'] == 30.0
+    assert top['new'][0]['path'] == ['רווחה']
+    assert top['disappeared'][0]['path'] == ['בריאות']
+    assert second['counts'] == {'matched': 1, 'new': 1, 'disappeared': 1}
+
+    codes = deltas[(2023, 2024)]['codes']
+    # A code's path is shown as the later year has it
+    assert codes['increases'][0]['code'] == 101 and codes['increases'][0]['path'] == ['חינוך', ' שכר ']
+    assert codes['new'][0]['code'] == 303
+    assert codes['disappeared'][0]['code'] == 202
+
+
+def test_build_year_deltas_of_a_single_year():
+    store = BudgetStore()
+    add_year(store, 2024, [(('חינוך', 'שכר'), 100.0, 101)])
+    assert build_year_deltas(store) == {}
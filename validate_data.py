@@ -1,55 +1,427 @@
+"""
+בדיקת תקינות הנתונים בדפים שנוצרו
+Validation of the data embedded in every generated page.
 
+Each page is walked along its template: the template text between placeholders must
+match the page exactly, and at each placeholder position the embedded payload is parsed
+in place with JSONDecoder.raw_decode (no regex over the multi-MB page, and strings
+containing '};' do not matter). The page is read whole and each payload decoded whole:
+the standard library has no incremental JSON decoder, and the largest page (a few MB)
+fits in memory comfortably. Every payload is then checked against its declared
+schema (PAGES / SCHEMAS below). Pages are validated in parallel; the exit status is 1
+when any page fails.
+
+    python validate_data.py                   every generated page found
+    python validate_data.py time_series.html  only the given pages
+
+A missing page fails the run when pages are named or when running in CI (CI is set,
+as on GitHub Actions); otherwise it is skipped. --optional PAGE lets a page be missing
+even then (the paid supports pages of a build without the supports CSV).
+"""
+
+import abc
+import argparse
 import json
-import re
+import math
 import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from flow_encoding import (
+    LINK_FIELDS, MISSING, NODE_FIELDS, REQUIRED_LINK_FIELDS, REQUIRED_NODE_FIELDS, TYPECODES, unpack_array,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PLACEHOLDER = re.compile(r'(__[A-Z_]+_PLACEHOLDER__)')
+
+# Errors reported per payload before the rest are only counted
+MAX_ERRORS = 20
+
+
+# ============================================
+# SCHEMAS
+# ============================================
+
+class Schema(abc.ABC):
+    """check(value, where) yields (where, message) for every violation"""
+
+    @abc.abstractmethod
+    def check(self, value, where):
+        """Yield (where, message) for every violation in value"""
+
+
+class Number(Schema):
+    def check(self, value, where):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            yield where, f"expected a number, got {type(value).__name__}"
+        elif not math.isfinite(value):
+            yield where, f"non-finite number {value}"
+
+
+class Integer(Schema):
+    def check(self, value, where):
+        if isinstance(value, bool) or not isinstance(value, int):
+            yield where, f"expected an integer, got {type(value).__name__}"
+
+
+class String(Schema):
+    def check(self, value, where):
+        if not isinstance(value, str):
+            yield where, f"expected a string, got {type(value).__name__}"
+
+
+class Boolean(Schema):
+    def check(self, value, where):
+        if not isinstance(value, bool):
+            yield where, f"expected a boolean, got {type(value).__name__}"
+
+
+class Nullable(Schema):
+    def __init__(self, schema):
+        self.schema = schema
+
+    def check(self, value, where):
+        if value is not None:
+            yield from self.schema.check(value, where)
+
+
+class ListOf(Schema):
+    def __init__(self, items, max_length=None):
+        self.items = items
+        self.max_length = max_length
+
+    def check(self, value, where):
+        if not isinstance(value, list):
+            yield where, f"expected a list, got {type(value).__name__}"
+            return
+        if self.max_length is not None and len(value) > self.max_length:
+            yield where, f"{len(value)} entries, at most {self.max_length} expected"
+        for index, item in enumerate(value):
+            yield from self.items.check(item, f"{where}[{index}]")
+
+
+class MapOf(Schema):
+    """Object with arbitrary keys (matching key_pattern) and values of one schema"""
+
+    def __init__(self, values, key_pattern=None):
+        self.values = values
+        self.key_pattern = re.compile(key_pattern) if key_pattern else None
+
+    def check(self, value, where):
+        if not isinstance(value, dict):
+            yield where, f"expected an object, got {type(value).__name__}"
+            return
+        for key, item in value.items():
+            if self.key_pattern and not self.key_pattern.fullmatch(key):
+                yield where, f"unexpected key {key!r}"
+            yield from self.values.check(item, f"{where}.{key}")
+
+
+class Record(Schema):
+    """Object with required and optional fields; unknown fields are violations"""
+
+    def __init__(self, required, optional=None):
+        self.required = required
+        self.optional = optional or {}
+
+    def check(self, value, where):
+        if not isinstance(value, dict):
+            yield where, f"expected an object, got {type(value).__name__}"
+            return
+        for field, schema in self.required.items():
+            if field not in value:
+                yield where, f"missing field {field!r}"
+            else:
+                yield from schema.check(value[field], f"{where}.{field}")
+        for field, item in value.items():
+            if field in self.required:
+                continue
+            if field not in self.optional:
+                yield where, f"unexpected field {field!r}"
+            else:
+                yield from self.optional[field].check(item, f"{where}.{field}")
+
+
+class Lazy(Schema):
+    """Reference to a schema defined later (recursive schemas)"""
 
-def validate_json_in_html():
-    file_path = 'budget_interactive.html'
-    if not os.path.exists(file_path):
-        print(f"File {file_path} not found.")
-        return
+    def __init__(self, resolve):
+        self.resolve = resolve
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    def check(self, value, where):
+        yield from self.resolve().check(value, where)
 
-    # Extract JSON object
-    # const BUDGET_DATA = { ... };
-    match = re.search(r'const BUDGET_DATA = ({.*?});', content, re.DOTALL)
-    if not match:
-        print("Could not find BUDGET_DATA in HTML.")
-        return
 
-    json_str = match.group(1)
-    
+class PackedFlowGraph(Record):
+    """
+    Sankey graph packed into typed-array columns (flow_encoding.py): each column has the
+    declared type of its field and one entry per node / link, string and node references
+    point into the string table / node list, and only optional fields hold missing markers
+    """
+
+    COLUMN = Record({'type': String(), 'data': String()})
+
+    def __init__(self):
+        super().__init__({
+            'strings': ListOf(String()),
+            'nodeCount': Integer(),
+            'linkCount': Integer(),
+            'nodes': MapOf(self.COLUMN),
+            'links': MapOf(self.COLUMN),
+        })
+
+    def check(self, value, where):
+        errors = list(super().check(value, where))
+        yield from errors
+        if errors:
+            return
+        limits = {'string': len(value['strings']), 'node': value['nodeCount']}
+        for part, fields, required, count in (
+            ('nodes', NODE_FIELDS, REQUIRED_NODE_FIELDS, value['nodeCount']),
+            ('links', LINK_FIELDS, REQUIRED_LINK_FIELDS, value['linkCount']),
+        ):
+            columns = value[part]
+            for field in required:
+                if field not in columns:
+                    yield f"{where}.{part}", f"missing column {field!r}"
+            for field, column in columns.items():
+                yield from self.check_column(column, fields.get(field), field in required, count, limits,
+                                             f"{where}.{part}.{field}")
+
+    @staticmethod
+    def check_column(column, declared_type, required, count, limits, where):
+        if declared_type is None:
+            yield where, "unexpected column"
+            return
+        if column['type'] != declared_type:
+            yield where, f"type {column['type']!r}, expected {declared_type!r}"
+            return
+        try:
+            values = unpack_array(column)
+        except ValueError as e:
+            yield where, f"undecodable data ({e})"
+            return
+        if len(values) != count:
+            yield where, f"{len(values)} entries, expected {count}"
+            return
+
+        if TYPECODES[declared_type] == 'I':
+            missing = sum(1 for item in values if item == MISSING)
+            limit = limits.get(declared_type)
+            out_of_range = sum(1 for item in values if item != MISSING and item >= limit) if limit is not None else 0
+            if out_of_range:
+                yield where, f"{out_of_range} references past the end (of {limit})"
+        else:
+            missing = sum(1 for item in values if math.isnan(item))
+            infinite = sum(1 for item in values if math.isinf(item))
+            if infinite:
+                yield where, f"{infinite} non-finite numbers"
+        if missing and (required or declared_type == 'node'):
+            yield where, f"{missing} missing values in a required column"
+
+
+YEAR_KEY = r'\d{4}'
+CODE_KEY = r'\d+'
+
+
+def years_of(schema):
+    return MapOf(schema, key_pattern=YEAR_KEY)
+
+
+# Fields a projected budget record may carry (see project_budget_data)
+def budget_record(depth):
+    return Record(
+        {'path': ListOf(String(), max_length=depth), 'value': Number()},
+        {
+            'name': String(),
+            'code': Nullable(Integer()),
+            'isSalary': Boolean(),
+            'miunRama1': String(),
+            'program': String(),
+            'classification': String(),
+            'commitment': Number(),
+        }
+    )
+
+
+RIGIDITY_NODE = Record(
+    {'value': Number(), 'commitments': Number(), 'absCommitments': Number()},
+    {'children': MapOf(Lazy(lambda: RIGIDITY_NODE))}
+)
+
+PAID_SUPPORTS_YEAR = Record(
+    {
+        'totalPaid': Number(),
+        'recipientCount': Integer(),
+        'byCode': MapOf(
+            Record({'paid': Number(), 'count': Integer(), 'name': String(), 'recipients': Integer()}),
+            key_pattern=CODE_KEY
+        ),
+        'recipients': ListOf(Record({
+            'name': String(), 'code': Integer(), 'hp': String(), 'takanName': String(),
+            'ministry': String(), 'paid': Number(), 'requestYear': Integer(),
+        })),
+        'recipientsByCode': MapOf(
+            ListOf(Record({'name': String(), 'hp': String(), 'paid': Number()})),
+            key_pattern=CODE_KEY
+        ),
+        'orphanRecords': Integer(),
+        'orphanAmount': Number(),
+        'orphanCodes': Integer(),
+    },
+    {
+        'reconciledRecords': Integer(),
+        'reconciledBy': MapOf(Integer()),
+    }
+)
+
+SCHEMAS = {
+    'budget_data': years_of(ListOf(budget_record(depth=6))),
+    'income_data': years_of(ListOf(budget_record(depth=6))),
+    'rigidity': years_of(RIGIDITY_NODE),
+    'paid_supports': years_of(PAID_SUPPORTS_YEAR),
+    'convergent_flows': years_of(Record({'convergentFlowData': PackedFlowGraph()})),
+}
+
+# Generated page -> (template, {placeholder: schema name})
+PAGES = {
+    'budget_interactive.html': ('budget_visualization.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': 'budget_data',
+        '__INCOME_DATA_PLACEHOLDER__': 'income_data',
+        '__RIGIDITY_DATA_PLACEHOLDER__': 'rigidity',
+    }),
+    'time_series.html': ('time_series_template.html', {'__BUDGET_DATA_PLACEHOLDER__': 'budget_data'}),
+    'salary_percentage.html': ('salary_percentage_template.html', {'__BUDGET_DATA_PLACEHOLDER__': 'budget_data'}),
+    'ministry_overview.html': ('ministry_overview_template.html', {'__BUDGET_DATA_PLACEHOLDER__': 'budget_data'}),
+    'sunburst_budget.html': ('sunburst_template.html', {'__BUDGET_DATA_PLACEHOLDER__': 'budget_data'}),
+    'five_pillars.html': ('five_pillars_template.html', {'__BUDGET_DATA_PLACEHOLDER__': 'budget_data'}),
+    'budget_rigidity.html': ('budget_rigidity_template.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': 'budget_data',
+        '__RIGIDITY_DATA_PLACEHOLDER__': 'rigidity',
+    }),
+    'paid_supports.html': ('paid_supports_template.html', {
+        '__BUDGET_DATA_PLACEHOLDER__': 'budget_data',
+        '__PAID_SUPPORTS_PLACEHOLDER__': 'paid_supports',
+    }),
+    'convergent_sankey.html': ('convergent_sankey_template.html', {'__PAID_SUPPORTS_PLACEHOLDER__': 'convergent_flows'}),
+}
+
+
+# ============================================
+# PAGE WALK
+# ============================================
+
+class PageMismatch(Exception):
+    """The page's text differs from its template outside the payloads"""
+
+
+def line_of(text, position):
+    return text.count('\n', 0, position) + 1
+
+
+def first_difference(page, text, position):
+    """Position in the page of the first character differing from text placed at position"""
+    return position + len(os.path.commonprefix([page[position:position + len(text)], text]))
+
+
+def locate_payloads(page, template):
+    """
+    Yield (placeholder, payload) for every placeholder of the template, in order, parsing
+    each payload where it starts in the page. Raises PageMismatch or json.JSONDecodeError.
+    """
+    pieces = PLACEHOLDER.split(template)  # text, placeholder, text, placeholder, ..., text
+    decoder = json.JSONDecoder()
+    position = 0
+    for index in range(0, len(pieces) - 1, 2):
+        text, placeholder = pieces[index], pieces[index + 1]
+        if not page.startswith(text, position):
+            difference = first_difference(page, text, position)
+            raise PageMismatch(f"page differs from its template before {placeholder} "
+                               f"(line {line_of(page, difference)}); rebuild the page")
+        position += len(text)
+        payload, position = decoder.raw_decode(page, position)
+        yield placeholder, payload
+    if page[position:] != pieces[-1]:
+        difference = first_difference(page, pieces[-1], position)
+        raise PageMismatch(f"page differs from its template at line {line_of(page, difference)}; rebuild the page")
+
+
+def validate_page(page_name, base_dir=BASE_DIR):
+    """(page_name, [payload summaries], [failure messages]) of one generated page"""
+    template_name, schemas = PAGES[page_name]
+    with open(os.path.join(base_dir, template_name), 'r', encoding='utf-8') as f:
+        template = f.read()
+    with open(os.path.join(base_dir, page_name), 'r', encoding='utf-8') as f:
+        page = f.read()
+
+    summaries = []
+    failures = []
     try:
-        data = json.loads(json_str)
-        print("JSON is valid.")
-        
-        # Check structure of 2024 data
-        if '2024' in data:
-            items = data['2024']
-            print(f"Found {len(items)} items for 2024.")
-            if len(items) > 0:
-                item = items[0]
-                print("Sample item keys:", item.keys())
-                if 'program' in item:
-                    print(f"Sample program: '{item['program']}'")
-                else:
-                    print("WARNING: 'program' key missing in item.")
-                
-                if 'classification' in item:
-                    print(f"Sample classification: '{item['classification']}'")
-                else:
-                    print("WARNING: 'classification' key missing in item.")
-                    
-                # Check for items with empty program
-                empty_programs = sum(1 for i in items if not i.get('program'))
-                print(f"Items with empty program: {empty_programs} out of {len(items)}")
-                
+        for placeholder, payload in locate_payloads(page, template):
+            schema_name = schemas.get(placeholder)
+            if schema_name is None:
+                failures.append(f"{placeholder}: no schema declared")
+                continue
+            errors = SCHEMAS[schema_name].check(payload, schema_name)
+            count = 0
+            for where, message in errors:
+                count += 1
+                if count <= MAX_ERRORS:
+                    failures.append(f"{where}: {message}")
+            if count > MAX_ERRORS:
+                failures.append(f"{schema_name}: {count - MAX_ERRORS:,} more errors")
+            years = payload if isinstance(payload, dict) else {}
+            summaries.append(f"{schema_name}: {len(years)} שנים")
+    except PageMismatch as e:
+        failures.append(str(e))
     except json.JSONDecodeError as e:
-        print(f"JSON Decode Error: {e}")
-        # Print context around error
-        print(json_str[max(0, e.pos-50):min(len(json_str), e.pos+50)])
+        failures.append(f"invalid JSON at line {line_of(page, e.pos)}: {e.msg}")
+    return page_name, summaries, failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='בדיקת תקינות הנתונים בדפים שנוצרו')
+    parser.add_argument('pages', nargs='*', help=f"pages to check (default: every generated page of {', '.join(PAGES)})")
+    parser.add_argument('--base-dir', default=BASE_DIR, help='directory holding the templates and generated pages')
+    parser.add_argument('--jobs', type=int, default=None, help='pages validated in parallel (default: CPU count)')
+    parser.add_argument('--optional', action='append', default=[], metavar='PAGE',
+                        help='a page that may be missing, even when pages are named or in CI')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    unknown = [page for page in args.pages + args.optional if page not in PAGES]
+    if unknown:
+        print(f"דפים לא מוכרים: {', '.join(unknown)}")
+        return 2
+
+    # Named pages, and every page of a CI build, must exist
+    require_pages = bool(args.pages) or bool(os.environ.get('CI'))
+    pages = args.pages or list(PAGES)
+    missing = [page for page in pages if not os.path.exists(os.path.join(args.base_dir, page))]
+    pages = [page for page in pages if page not in missing]
+    failed = 0
+    for page in missing:
+        if require_pages and page not in args.optional:
+            print(f"  {page}: לא נמצא")
+            failed += 1
+        else:
+            print(f"  {page}: לא נמצא, מדלג")
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for page_name, summaries, failures in pool.map(validate_page, pages, [args.base_dir] * len(pages)):
+            status = 'תקין' if not failures else f"{len(failures)} שגיאות"
+            print(f"  {page_name}: {status} ({', '.join(summaries)})")
+            for failure in failures:
+                print(f"      {failure}")
+            failed += bool(failures)
+
+    print(f"\nנבדקו {len(pages)} דפים, {failed} נכשלו" + (f" ({len(missing)} לא נמצאו)" if missing else ''))
+    return 1 if failed else 0
+
 
 if __name__ == "__main__":
-    validate_json_in_html()
+    sys.exit(main())
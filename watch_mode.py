@@ -0,0 +1,209 @@
+"""
+מצב צפייה עם רענון חי
+Watch mode: keep the parsed datasets in memory, rebuild only the outputs affected by a
+changed template, workbook or CSV, and tell open pages to reload.
+
+Pages are served by a small local HTTP server that injects a live-reload snippet into
+every HTML response; the snippet listens on a Server-Sent Events stream.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+import webbrowser
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+RELOAD_PATH = '/__livereload'
+
+RELOAD_SNIPPET = """
+<script>
+(function () {
+    const page = decodeURIComponent(location.pathname.split('/').pop()) || 'index.html';
+    const source = new EventSource('%s');
+    source.onmessage = (event) => {
+        const changed = JSON.parse(event.data);
+        if (changed.includes(page)) location.reload();
+    };
+})();
+</script>
+""" % RELOAD_PATH
+
+
+class ReloadBroadcaster:
+    """
+    Hands the names of rebuilt pages to every connected live-reload stream.
+    Each page name keeps the version of its last rebuild, and each stream the version it
+    has sent up to, so pages rebuilt back to back between two wakeups of a stream all reach it.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        self._page_versions = {}  # page name -> version of its last rebuild
+
+    def notify(self, changed_names):
+        with self._condition:
+            self._version += 1
+            for name in changed_names:
+                self._page_versions[name] = self._version
+            self._condition.notify_all()
+
+    def wait(self, version, timeout):
+        """
+        Block until a version newer than `version` (the stream's cursor); returns
+        (new cursor, names of the pages rebuilt since `version`, or None on timeout)
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._version > version, timeout=timeout):
+                return version, None
+            changed = sorted(name for name, changed_at in self._page_versions.items() if changed_at > version)
+            return self._version, changed
+
+    @property
+    def version(self):
+        with self._condition:
+            return self._version
+
+
+def make_handler(directory, broadcaster):
+    class LiveReloadHandler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == RELOAD_PATH:
+                return self.stream_reloads()
+            path = self.translate_path(self.path)
+            if os.path.isdir(path):
+                path = os.path.join(path, 'index.html')
+            if path.endswith('.html') and os.path.isfile(path):
+                return self.send_html(path)
+            return super().do_GET()
+
+        def send_html(self, path):
+            with open(path, 'rb') as f:
+                body = f.read()
+            marker = b'</body>'
+            snippet = RELOAD_SNIPPET.encode('utf-8')
+            index = body.rfind(marker)
+            body = body[:index] + snippet + body[index:] if index >= 0 else body + snippet
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def stream_reloads(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            version = broadcaster.version
+            try:
+                while True:
+                    version, changed = broadcaster.wait(version, timeout=15)
+                    if changed is None:
+                        self.wfile.write(b': keepalive\n\n')
+                    else:
+                        self.wfile.write(f"data: {json.dumps(changed)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return LiveReloadHandler
+
+
+def snapshot(paths):
+    """{path: mtime} for the paths that exist"""
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    return mtimes
+
+
+def watched_files(template_dir, data_dir, csv_path, page_payloads):
+    """Templates of the rendered pages, the budget workbooks and the paid supports CSV"""
+    templates = {os.path.join(template_dir, template) for template, _ in page_payloads.values()}
+    workbooks = set(glob.glob(os.path.join(data_dir, "tableau_BudgetData*.xlsx")) +
+                    glob.glob(os.path.join(data_dir, "tableau_tableau_BudgetData*.xlsx")))
+    csv_files = {os.path.abspath(csv_path)}
+    return templates, workbooks, csv_files
+
+
+def watch(ctx, names, build_outputs, rerender_page, page_payloads, outputs, base_dir, template_dir, engine,
+          data_dir='.', port=8765, open_browser=True, interval=0.3):
+    """
+    Serve base_dir (the built pages) with live reload and rebuild on changes until interrupted.
+    build_outputs / rerender_page / page_payloads / outputs come from create_visualization
+    (passed in so the running script's module state is shared, not a re-imported copy).
+    template_dir: directory of the templates; ctx.csv_path is the watched paid supports CSV
+    engine: (data engine template path, write_engine() that rewrites data_engine.js,
+    templates of the pages that load it)
+    """
+    engine_template, write_engine, engine_page_templates = engine
+    broadcaster = ReloadBroadcaster()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(base_dir, broadcaster))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    rendered = [name for name in page_payloads]
+    url = f"http://127.0.0.1:{port}/{rendered[0] if rendered else ''}"
+    print(f"\nמצב צפייה: {url} (Ctrl+C לסיום)")
+    if open_browser:
+        webbrowser.open(url)
+
+    templates, workbooks, csv_files = watched_files(template_dir, data_dir, ctx.csv_path, page_payloads)
+    mtimes = snapshot(templates | workbooks | csv_files | {engine_template})
+
+    try:
+        while True:
+            time.sleep(interval)
+            templates, workbooks, csv_files = watched_files(template_dir, data_dir, ctx.csv_path, page_payloads)
+            current = snapshot(templates | workbooks | csv_files | {engine_template})
+            changed = {path for path in current.keys() | mtimes.keys() if current.get(path) != mtimes.get(path)}
+            mtimes = current
+            if not changed:
+                continue
+
+            start = time.perf_counter()
+            rebuilt = []
+            reload_pages = []
+            if changed & workbooks:
+                print("\nשינוי בקבצי התקציב - טוען מחדש...")
+                ctx.invalidate('budget', 'summary_data', 'paid_supports_frame', 'paid_supports_data', 'recipient_rows')
+                rebuilt = build_outputs(ctx, names)
+            else:
+                if changed & csv_files:
+                    print("\nשינוי בקובץ התמיכות - טוען מחדש...")
+                    ctx.invalidate('paid_supports_frame', 'paid_supports_data', 'recipient_rows')
+                    rebuilt += build_outputs(ctx, [n for n in names if 'paid_supports_data' in outputs[n][2]])
+                if engine_template in changed:
+                    # Only the script changes: rewrite it and reload the pages that load it
+                    print("\nשינוי במנוע הנתונים - כותב מחדש את data_engine.js...")
+                    if write_engine():
+                        reload_pages += [page for page, (template_name, _) in page_payloads.items()
+                                         if template_name in engine_page_templates]
+                changed_templates = {os.path.basename(path) for path in changed & templates}
+                for output_name, (template_name, _) in list(page_payloads.items()):
+                    if template_name in changed_templates:
+                        path = rerender_page(output_name)
+                        if path:
+                            rebuilt.append(path)
+
+            rebuilt_names = sorted({os.path.basename(path) for path in rebuilt} | set(reload_pages))
+            if rebuilt_names:
+                print(f"  עודכן ({(time.perf_counter() - start) * 1000:.0f}ms): {', '.join(rebuilt_names)}")
+                broadcaster.notify(rebuilt_names)
+    except KeyboardInterrupt:
+        print("\nמצב צפייה הסתיים")
+    finally:
+        server.shutdown()
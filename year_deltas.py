@@ -0,0 +1,142 @@
+"""
+שינויים בין שנים
+Year-over-year deltas between each pair of consecutive years in a BudgetStore.
+
+For every hierarchy level (and for קוד תקנה, which stays stable when a תקנה is renamed)
+the nodes of both years are matched on their normalized path, and the generator ships
+sorted top-movers lists: the largest increases and decreases, the largest new nodes and
+the largest disappeared nodes, with absolute and relative change. Each pair is written
+as a deltas/<from>_<to> shard that the time series page loads when it is shown.
+"""
+
+import numpy as np
+import pandas as pd
+
+from shards import clear_shards, write_shard
+
+# Entries kept in each top-movers list
+TOP_MOVERS = 25
+
+# Hierarchy levels compared (the six levels of the budget pages)
+DELTA_LEVELS = 6
+
+SHARD_PREFIX = 'deltas'
+
+# Joins path labels into one key; cannot appear inside a label
+KEY_SEPARATOR = '\x1f'
+
+
+def normalize_label(label):
+    """Label with whitespace runs collapsed, so spacing differences between years still match"""
+    return ' '.join(str(label).split())
+
+
+def level_totals(store, year, depth=DELTA_LEVELS):
+    """
+    [Series per level] of the year's totals keyed by the joined normalized path prefix,
+    plus a Series of totals per קוד תקנה
+    """
+    frame = store[year].frame
+    # Sum per interned path first: far fewer distinct paths than rows
+    path_sums = frame.groupby('path_id', sort=False)['value'].sum()
+    paths = [[normalize_label(label) for label in store.paths[path_id]] for path_id in path_sums.index]
+    values = path_sums.to_numpy()
+
+    levels = []
+    for level in range(depth):
+        keys = np.array([
+            KEY_SEPARATOR.join(path[:level + 1]) if len(path) > level and path[level] else ''
+            for path in paths
+        ], dtype=object)
+        totals = pd.Series(values).groupby(keys).sum()
+        levels.append(totals[totals.index != ''])
+
+    coded = frame[frame['code'] > 0]
+    codes = coded.groupby('code')['value'].sum()
+    return levels, codes
+
+
+def diff_totals(previous, current):
+    """
+    Matched-node changes between two Series of totals:
+    DataFrame[from, to, change, relative] with NaN `from` / `to` for new / disappeared nodes
+    """
+    joined = pd.concat({'from': previous, 'to': current}, axis=1)
+    joined['change'] = joined['to'].fillna(0.0) - joined['from'].fillna(0.0)
+    base = joined['from'].abs()
+    joined['relative'] = np.where(base > 0, joined['change'] / base.where(base > 0, 1.0), np.nan)
+    return joined
+
+
+def movers(joined, describe):
+    """Top-movers lists of one level; describe(key) gives the node's identifying fields"""
+    new = joined['from'].isna()
+    gone = joined['to'].isna()
+    matched = joined[~new & ~gone]
+
+    def entries(rows):
+        result = []
+        for key, row in zip(rows.index, rows.itertuples(index=False)):
+            entry = describe(key)
+            entry.update({
+                'from': None if pd.isna(row[0]) else float(row[0]),
+                'to': None if pd.isna(row[1]) else float(row[1]),
+                'change': float(row[2]),
+                'relative': None if pd.isna(row[3]) else float(row[3]),
+            })
+            result.append(entry)
+        return result
+
+    columns = ['from', 'to', 'change', 'relative']
+    return {
+        'increases': entries(matched[matched['change'] > 0].nlargest(TOP_MOVERS, 'change')[columns]),
+        'decreases': entries(matched[matched['change'] < 0].nsmallest(TOP_MOVERS, 'change')[columns]),
+        'new': entries(joined[new].assign(size=joined['to'][new].abs()).nlargest(TOP_MOVERS, 'size')[columns]),
+        'disappeared': entries(joined[gone].assign(size=joined['from'][gone].abs()).nlargest(TOP_MOVERS, 'size')[columns]),
+        'counts': {
+            'matched': int(len(matched)),
+            'new': int(new.sum()),
+            'disappeared': int(gone.sum()),
+        },
+        'totalChange': float(joined['change'].sum()),
+    }
+
+
+def build_year_deltas(store):
+    """
+    { (from_year, to_year): {'levels': [movers per hierarchy level], 'codes': movers per קוד תקנה} }
+    for each pair of consecutive years in the store
+    """
+    years = sorted(store)
+    totals = {year: level_totals(store, year) for year in years}
+    # Hierarchy of each code down to its תקנה, to show next to the code
+    code_paths = {year: {code: info['path'][:5] for code, info in store[year].code_info().items()} for year in years}
+
+    def describe_path(key):
+        return {'path': key.split(KEY_SEPARATOR)}
+
+    deltas = {}
+    for previous_year, year in zip(years, years[1:]):
+        previous_levels, previous_codes = totals[previous_year]
+        levels, codes = totals[year]
+        pair_code_paths = {**code_paths[previous_year], **code_paths[year]}
+        deltas[(previous_year, year)] = {
+            'levels': [
+                movers(diff_totals(previous, current), describe_path)
+                for previous, current in zip(previous_levels, levels)
+            ],
+            'codes': movers(
+                diff_totals(previous_codes, codes),
+                lambda code: {'code': int(code), 'path': pair_code_paths.get(code, [])}
+            ),
+        }
+    return deltas
+
+
+def write_year_deltas(base_dir, deltas):
+    """Write one deltas/<from>_<to> shard per year pair; returns the written paths"""
+    clear_shards(base_dir, SHARD_PREFIX)
+    return [
+        write_shard(base_dir, f"{SHARD_PREFIX}/{previous_year}_{year}", {'from': previous_year, 'to': year, **pair})
+        for (previous_year, year), pair in deltas.items()
+    ]